@@ -0,0 +1,115 @@
+"""
+Benchmark of the event-scheduled driver against the per-second loop previously used by `run_simulation`.
+
+By default the dynamics is a no-op object, so the benchmark measures only the Python-level overhead of the
+two drivers. Both call `evolve` once per simulated second: the difference is the per-second checks of the
+actions, which the timeline driver skips, not the per-second calls themselves. With --dsf, both drivers evolve
+a real network built from the files in ./updated_input, and the time spent in `evolve` dominates.
+
+Run from the root directory of the project with
+
+    python -m benchmarks.bench_driver --duration 86400
+"""
+import argparse
+import time
+import numpy as np
+
+from src.graph.tools.driver import build_timeline, run_timeline
+
+
+class NoOpDynamics:
+    """
+    Stand-in for `mobility.Dynamics` that does nothing, to measure the driver overhead alone.
+    """
+    def evolve(self, reinsert_agents=False): pass
+    def setOriginNodes(self, origins): pass
+    def setDestinationNodes(self, destinations): pass
+    def updatePaths(self, throw_on_empty=False): pass
+    def normalizedTurnCounts(self): return {}
+    def addAgentsRandomly(self, n_agents): pass
+
+
+def per_second_loop(simulator, start, end, dt_agent, input_vehicles, hourly_origins, hourly_destinations):
+    """
+    The per-second loop of `run_simulation` before the event-scheduled driver.
+    """
+    turn_counts = []
+    for i in range(start, end + 1):
+        if i % 3600 == 0 and i // 3600 < len(hourly_origins):
+            simulator.setOriginNodes(hourly_origins[i // 3600])
+            simulator.setDestinationNodes(hourly_destinations[i // 3600])
+        if i % 300 == 0:
+            simulator.updatePaths(False)
+        if i >= 0:
+            if i % 3600 == 0:
+                turn_counts.append(simulator.normalizedTurnCounts())
+        if i % dt_agent == 0 and i // dt_agent < len(input_vehicles):
+            n_agents = int(input_vehicles[i // dt_agent] / 25)
+            simulator.addAgentsRandomly(n_agents if n_agents > 0 else 0)
+        simulator.evolve(False)
+
+
+def timeline_driver(simulator, start, end, dt_agent, input_vehicles, hourly_origins, hourly_destinations):
+    """
+    The same actions, run through `build_timeline` and `run_timeline`.
+    """
+    turn_counts = []
+
+    def set_od(t):
+        simulator.setOriginNodes(hourly_origins[t // 3600])
+        simulator.setDestinationNodes(hourly_destinations[t // 3600])
+
+    def add_agents(t):
+        n_agents = int(input_vehicles[t // dt_agent] / 25)
+        simulator.addAgentsRandomly(n_agents if n_agents > 0 else 0)
+
+    timeline = build_timeline(
+        start,
+        end,
+        {"od": 3600, "paths": 300, "turn_counts": 3600, "agents": dt_agent},
+        limits={"od": len(hourly_origins), "agents": len(input_vehicles)},
+    )
+    run_timeline(simulator, start, end, timeline, {
+        "od": set_od,
+        "paths": lambda t: simulator.updatePaths(False),
+        "turn_counts": lambda t: turn_counts.append(simulator.normalizedTurnCounts()),
+        "agents": add_agents,
+    })
+
+
+def make_dsf_dynamics():
+    """
+    Builds a real dynamics on the default network, as a replica of `run_simulation` does.
+    """
+    from dsf import mobility
+    from src.graph.tools.network_cache import _prepare_network
+    rn = _prepare_network("./updated_input/edges.csv", "./updated_input/node_props.csv")
+    return mobility.Dynamics(rn, False, 42, 0.9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=24 * 3600, help="simulated seconds (default: 1 day)")
+    parser.add_argument("--dt-agent", type=int, default=10, help="seconds between agent injections")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per driver, the best one is reported")
+    parser.add_argument("--dsf", action="store_true", help="evolve a real dsf network instead of a no-op")
+    args = parser.parse_args()
+
+    start, end = 0, args.duration
+    input_vehicles = np.random.default_rng(0).uniform(0, 500, size=end // args.dt_agent + 1)
+    hourly_origins = [{0: 1.0}] * 24
+    hourly_destinations = [{1: 1.0}] * 24
+
+    for name, driver in (("per-second loop", per_second_loop), ("timeline driver", timeline_driver)):
+        timings = []
+        for _ in range(args.repeat):
+            simulator = make_dsf_dynamics() if args.dsf else NoOpDynamics()
+            t0 = time.perf_counter()
+            driver(simulator, start, end, args.dt_agent, input_vehicles, hourly_origins, hourly_destinations)
+            timings.append(time.perf_counter() - t0)
+        best = min(timings)
+        print(f"{name:>16}: {best:8.3f} s  ({best / (end - start + 1) * 1e6:6.2f} us per simulated second)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark of the wall-clock time spent saving the simulation output, at different save cadences.
+
+Every configuration evolves a replica of the network built from the files in ./updated_input for the same
+simulated time, saving to a fresh database shard as `run_simulation` does (see `output_writer`). The time spent on
+output is the difference with a run that saves nothing. The shard is then merged, as at the end of an ensemble.
+
+Run from the root directory of the project with
+
+    python -m benchmarks.bench_output --duration 3600 --intervals 60 300 900
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import numpy as np
+from contextlib import closing
+
+from benchmarks.bench_driver import make_dsf_dynamics, timeline_driver
+from src.graph.tools.ensemble import merge_shards
+from src.graph.tools.output_writer import OUTPUT_TABLES, connect_output, output_config
+from src.graph.tools.utils import get_epoch_time
+
+
+def run(config, duration, dt_agent, input_vehicles, hourly_origins, hourly_destinations):
+    """
+    Runs a replica saving with the given output configuration (None to save nothing).
+
+    Returns:
+        The seconds spent simulating, the seconds spent merging the shard and the size of the shard in MB.
+    """
+    simulator = make_dsf_dynamics()
+    simulator.setInitTime(get_epoch_time("2022-01-31", 0))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shard_path = os.path.join(tmp_dir, "shard.db")
+        if config is not None:
+            connect_output(simulator, shard_path, config)
+
+        t0 = time.perf_counter()
+        timeline_driver(simulator, 0, duration, dt_agent, input_vehicles, hourly_origins, hourly_destinations)
+        simulate_time = time.perf_counter() - t0
+
+        if config is None:
+            return simulate_time, 0.0, 0.0
+        del simulator  # close the connection of the simulator before merging
+        with closing(sqlite3.connect(shard_path)) as conn:
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        # otherwise the comparison of the journal modes measures nothing
+        assert journal_mode == ("wal" if config["wal"] else "delete"), f"The shard is in {journal_mode} mode"
+        size_mb = sum(
+            os.path.getsize(f"{shard_path}{suffix}")
+            for suffix in ("", "-wal")
+            if os.path.exists(f"{shard_path}{suffix}")
+        ) / 1024**2
+        t0 = time.perf_counter()
+        merge_shards([shard_path], os.path.join(tmp_dir, "database.db"))
+        merge_time = time.perf_counter() - t0
+    return simulate_time, merge_time, size_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=3600, help="simulated seconds (default: 1 hour)")
+    parser.add_argument("--dt-agent", type=int, default=10, help="seconds between agent injections")
+    parser.add_argument("--intervals", type=int, nargs="+", default=[60, 300, 900], help="save intervals to compare, in simulated seconds")
+    parser.add_argument("--tables", nargs="+", default=list(OUTPUT_TABLES), choices=OUTPUT_TABLES, help="tables to save")
+    parser.add_argument("--no-wal", action="store_true", help="also run every interval with the rollback journal")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration, the best one is reported")
+    args = parser.parse_args()
+
+    input_vehicles = np.random.default_rng(0).uniform(0, 500, size=args.duration // args.dt_agent + 1)
+    hourly_origins = [{0: 1.0}] * 24
+    hourly_destinations = [{1: 1.0}] * 24
+
+    configs = [("no output", None)]
+    for interval in args.intervals:
+        configs.append((f"every {interval} s, WAL", output_config(interval, args.tables, wal=True)))
+        if args.no_wal:
+            configs.append((f"every {interval} s, journal", output_config(interval, args.tables, wal=False)))
+
+    baseline = None
+    for name, config in configs:
+        timings = [run(config, args.duration, args.dt_agent, input_vehicles, hourly_origins, hourly_destinations) for _ in range(args.repeat)]
+        simulate_time, merge_time, size_mb = min(timings)
+        baseline = simulate_time if baseline is None else baseline
+        print(
+            f"{name:>24}: simulation {simulate_time:8.3f} s, output {simulate_time - baseline:+8.3f} s, "
+            f"merge {merge_time:6.3f} s, shard {size_mb:7.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
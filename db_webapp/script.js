@@ -444,7 +444,8 @@ L.Control.MP4Recorder = L.Control.extend({
           return;
         }
 
-        // Update slider and map
+        // Update slider and map, once the frame is loaded
+        await loadFrame(Math.floor(currentVal / step));
         timeSlider.value = currentVal;
         timeSlider.dispatchEvent(new Event('input'));
 
@@ -541,19 +542,31 @@ L.Control.MP4Recorder = L.Control.extend({
 // Add MP4 recorder control to map
 map.addControl(new L.Control.MP4Recorder());
 
-// Custom Canvas layer for edges
+// Density buckets of the edge palette: colors and widths are quantized, so edges are drawn with one path per bucket
+const PALETTE_SIZE = 256;
+const PALETTE_MAX_DENSITY = 2 * MAX_DENSITY; // widths grow up to twice MAX_DENSITY, colors saturate at MAX_DENSITY
+const PALETTE_SCALE = PALETTE_SIZE / PALETTE_MAX_DENSITY;
+const EDGES_PER_GRID_CELL = 8; // average number of edges per cell of the spatial grid
+const HIT_TOLERANCE = 10; // pixels
+const MOTORWAY_DASH = [4, 4];
+const NO_DASH = [];
+
+// Custom Canvas layer for edges.
+// Edge geometries are projected once and indexed in a uniform grid, so that only the visible edges are drawn
+// and hit-tested; densities are mapped to a precomputed palette, so drawing a frame allocates nothing.
 L.CanvasEdges = L.Layer.extend({
   initialize: function(edges, options) {
     L.setOptions(this, options);
     this.edges = edges;
-    this.colors = [];
     this.densities = [];
+    this._buildPalette();
   },
 
   onAdd: function(map) {
     this._map = map;
     this._canvas = L.DomUtil.create('canvas', 'leaflet-canvas-layer');
     this._ctx = this._canvas.getContext('2d');
+    if (!this._points) this._buildIndex(map.options.crs);
     
     // Set canvas style
     this._canvas.style.pointerEvents = 'none';
@@ -590,26 +603,167 @@ L.CanvasEdges = L.Layer.extend({
     if (this._zoomAnimationFrame) {
       cancelAnimationFrame(this._zoomAnimationFrame);
     }
+    if (this._redrawFrame) {
+      cancelAnimationFrame(this._redrawFrame);
+      this._redrawFrame = null;
+    }
+  },
+
+  // Precompute the color and width factor of each density bucket
+  _buildPalette: function() {
+    this._paletteColors = new Array(PALETTE_SIZE);
+    this._paletteWidths = new Float32Array(PALETTE_SIZE);
+    for (let b = 0; b < PALETTE_SIZE; b++) {
+      const density = (b + 0.5) / PALETTE_SCALE;
+      const rgb = d3.rgb(colorScale(Math.min(density, MAX_DENSITY)));
+      this._paletteColors[b] = `rgba(${rgb.r}, ${rgb.g}, ${rgb.b}, 0.69)`;
+      this._paletteWidths[b] = 0.5 + Math.min(density * MAX_DENSITY_INVERTED, 2.0);
+    }
+  },
+
+  // Project the edge geometries to world pixels at zoom 0, and index their bounding boxes in a uniform grid
+  _buildIndex: function(crs) {
+    const edges = this.edges;
+    const n = edges.length;
+    this._offsets = new Uint32Array(n + 1);
+    for (let e = 0; e < n; e++) {
+      this._offsets[e + 1] = this._offsets[e] + (edges[e].geometry ? edges[e].geometry.length : 0);
+    }
+    this._points = new Float64Array(2 * this._offsets[n]);
+    this._bboxes = new Float64Array(4 * n);
+    this._motorways = new Uint8Array(n);
+
+    let minX = Infinity, minY = Infinity, maxX = -Infinity, maxY = -Infinity;
+    for (let e = 0; e < n; e++) {
+      const geometry = edges[e].geometry || [];
+      let eMinX = Infinity, eMinY = Infinity, eMaxX = -Infinity, eMaxY = -Infinity;
+      for (let i = 0; i < geometry.length; i++) {
+        const p = crs.latLngToPoint(L.latLng(geometry[i].y, geometry[i].x), 0);
+        const k = 2 * (this._offsets[e] + i);
+        this._points[k] = p.x;
+        this._points[k + 1] = p.y;
+        eMinX = Math.min(eMinX, p.x); eMaxX = Math.max(eMaxX, p.x);
+        eMinY = Math.min(eMinY, p.y); eMaxY = Math.max(eMaxY, p.y);
+      }
+      this._bboxes.set([eMinX, eMinY, eMaxX, eMaxY], 4 * e);
+      if (geometry.length) {
+        minX = Math.min(minX, eMinX); maxX = Math.max(maxX, eMaxX);
+        minY = Math.min(minY, eMinY); maxY = Math.max(maxY, eMaxY);
+      }
+      this._motorways[e] = edges[e].name && edges[e].name.toLowerCase().includes("autostrada") ? 1 : 0;
+    }
+    if (minX === Infinity) minX = minY = maxX = maxY = 0;
+
+    // cells sized for EDGES_PER_GRID_CELL edges each, on average
+    const width = Math.max(maxX - minX, 1e-9);
+    const height = Math.max(maxY - minY, 1e-9);
+    const cellSize = Math.sqrt(width * height * EDGES_PER_GRID_CELL / Math.max(n, 1));
+    const grid = {
+      x0: minX, y0: minY, cellSize,
+      cols: Math.max(1, Math.ceil(width / cellSize)),
+      rows: Math.max(1, Math.ceil(height / cellSize))
+    };
+    this._grid = grid;
+
+    // compressed cell lists: the edges of cell c are cellEdges[cellStart[c] .. cellStart[c + 1]]
+    const cellStart = new Uint32Array(grid.cols * grid.rows + 1);
+    const forEachCell = (e, fn) => {
+      const b = 4 * e;
+      if (this._offsets[e + 1] === this._offsets[e]) return;
+      const c0 = this._gridCol(this._bboxes[b]), c1 = this._gridCol(this._bboxes[b + 2]);
+      const r0 = this._gridRow(this._bboxes[b + 1]), r1 = this._gridRow(this._bboxes[b + 3]);
+      for (let r = r0; r <= r1; r++) {
+        for (let c = c0; c <= c1; c++) fn(r * grid.cols + c);
+      }
+    };
+    for (let e = 0; e < n; e++) forEachCell(e, cell => cellStart[cell + 1]++);
+    for (let c = 0; c < grid.cols * grid.rows; c++) cellStart[c + 1] += cellStart[c];
+    const cellEdges = new Uint32Array(cellStart[grid.cols * grid.rows]);
+    const cursor = cellStart.slice(0, -1);
+    for (let e = 0; e < n; e++) forEachCell(e, cell => { cellEdges[cursor[cell]++] = e; });
+    this._cellStart = cellStart;
+    this._cellEdges = cellEdges;
+
+    // scratch buffers of the queries and of the drawing, reused by every frame
+    this._stamps = new Uint32Array(n);
+    this._stamp = 0;
+    this._visible = new Uint32Array(n);
+    this._sorted = new Uint32Array(n);
+    this._bucketOf = new Uint16Array(n);
+    this._bucketStart = new Uint32Array(PALETTE_SIZE + 1);
+  },
+
+  _gridCol: function(x) {
+    const c = Math.floor((x - this._grid.x0) / this._grid.cellSize);
+    return Math.min(this._grid.cols - 1, Math.max(0, c));
+  },
+
+  _gridRow: function(y) {
+    const r = Math.floor((y - this._grid.y0) / this._grid.cellSize);
+    return Math.min(this._grid.rows - 1, Math.max(0, r));
+  },
+
+  // Collect in this._visible the edges whose bounding box intersects the given box (world pixels at zoom 0)
+  _queryGrid: function(minX, minY, maxX, maxY) {
+    if (++this._stamp === 0xffffffff) {
+      this._stamps.fill(0);
+      this._stamp = 1;
+    }
+    const stamp = this._stamp;
+    const bboxes = this._bboxes;
+    const c0 = this._gridCol(minX), c1 = this._gridCol(maxX);
+    const r0 = this._gridRow(minY), r1 = this._gridRow(maxY);
+    let count = 0;
+    for (let r = r0; r <= r1; r++) {
+      for (let c = c0; c <= c1; c++) {
+        const cell = r * this._grid.cols + c;
+        for (let k = this._cellStart[cell]; k < this._cellStart[cell + 1]; k++) {
+          const e = this._cellEdges[k];
+          if (this._stamps[e] === stamp) continue;
+          this._stamps[e] = stamp;
+          const b = 4 * e;
+          if (bboxes[b] > maxX || bboxes[b + 2] < minX || bboxes[b + 1] > maxY || bboxes[b + 3] < minY) continue;
+          this._visible[count++] = e;
+        }
+      }
+    }
+    return count;
+  },
+
+  // Scale and offset from world pixels at zoom 0 to container pixels
+  _view: function() {
+    const scale = this._map.getZoomScale(this._map.getZoom(), 0);
+    const origin = this._map.containerPointToLayerPoint([0, 0]).add(this._map.getPixelOrigin());
+    return { scale, ox: origin.x, oy: origin.y };
+  },
+
+  _bucket: function(e) {
+    const density = this.densities[e] || 0;
+    return density <= 0 ? 0 : Math.min(PALETTE_SIZE - 1, (density * PALETTE_SCALE) | 0);
+  },
+
+  _tracePath: function(ctx, e, view) {
+    const points = this._points;
+    let k = 2 * this._offsets[e];
+    const end = 2 * this._offsets[e + 1];
+    if (end - k < 2) return;
+    ctx.moveTo(points[k] * view.scale - view.ox, points[k + 1] * view.scale - view.oy);
+    for (k += 2; k < end; k += 2) {
+      ctx.lineTo(points[k] * view.scale - view.ox, points[k + 1] * view.scale - view.oy);
+    }
   },
 
   _reset: function() {
     const size = this._map.getSize();
     this._canvas.width = size.x;
     this._canvas.height = size.y;
-    
-    const topLeft = this._map.containerPointToLayerPoint([0, 0]);
-    L.DomUtil.setPosition(this._canvas, topLeft);
-    
     this._update();
   },
 
+  // Redraw at the next animation frame: bursts of move events and density updates are drawn once
   _update: function() {
-    if (!this._map) return;
-    
-    const topLeft = this._map.containerPointToLayerPoint([0, 0]);
-    L.DomUtil.setPosition(this._canvas, topLeft);
-    
-    this._redraw();
+    if (!this._map || this._redrawFrame) return;
+    this._redrawFrame = requestAnimationFrame(() => this._redraw());
   },
 
   _onZoomStart: function() {
@@ -641,97 +795,138 @@ L.CanvasEdges = L.Layer.extend({
     });
   },
 
-  setColors: function(colors) {
-    this.colors = colors;
-    this._redraw();
-  },
-
   setDensities: function(densities) {
     this.densities = densities;
-    this._redraw();
+    this._update();
   },
 
   setHighlightedEdge: function(highlightedEdge) {
     this.highlightedEdge = highlightedEdge;
-    this._redraw();
+    this._update();
   },
 
   _redraw: function() {
+    this._redrawFrame = null;
     if (!this._map) return;
     
     // Don't draw edges while zooming for better performance
     if (this._zooming) return;
+
+    const topLeft = this._map.containerPointToLayerPoint([0, 0]);
+    L.DomUtil.setPosition(this._canvas, topLeft);
     
     const ctx = this._ctx;
     ctx.clearRect(0, 0, this._canvas.width, this._canvas.height);
     const zoom = this._map.getZoom();
     const baseStrokeWidth = 3 + (zoom - baseZoom);
+    const view = this._view();
+    const size = this._map.getSize();
 
-    this.edges.forEach((edge, index) => {
-      if (!edge.geometry || edge.geometry.length === 0) return;
-
+    // visible edges, with a margin for the widest strokes
+    const margin = Math.max(1, baseStrokeWidth * 3);
+    const count = this._queryGrid(
+      (view.ox - margin) / view.scale, (view.oy - margin) / view.scale,
+      (view.ox + size.x + margin) / view.scale, (view.oy + size.y + margin) / view.scale
+    );
+
+    // counting sort of the visible edges by density bucket
+    const bucketStart = this._bucketStart;
+    bucketStart.fill(0);
+    for (let i = 0; i < count; i++) {
+      const e = this._visible[i];
+      const b = this._bucket(e);
+      this._bucketOf[e] = b;
+      bucketStart[b + 1]++;
+    }
+    for (let b = 0; b < PALETTE_SIZE; b++) bucketStart[b + 1] += bucketStart[b];
+    for (let i = 0; i < count; i++) {
+      const e = this._visible[i];
+      this._sorted[bucketStart[this._bucketOf[e]]++] = e;
+    }
+    // bucketStart[b] now holds the end of bucket b
+
+    ctx.lineCap = 'round';
+    ctx.lineJoin = 'round';
+    let highlighted = -1;
+    let start = 0;
+    for (let b = 0; b < PALETTE_SIZE; b++) {
+      const end = bucketStart[b];
+      if (end === start) continue;
+      ctx.lineWidth = Math.max(1, baseStrokeWidth * this._paletteWidths[b]);
+      ctx.strokeStyle = this._paletteColors[b];
       ctx.beginPath();
-      const firstPoint = this._map.latLngToContainerPoint([edge.geometry[0].y, edge.geometry[0].x]);
-      ctx.moveTo(firstPoint.x, firstPoint.y);
-
-      for (let i = 1; i < edge.geometry.length; i++) {
-        const point = this._map.latLngToContainerPoint([edge.geometry[i].y, edge.geometry[i].x]);
-        ctx.lineTo(point.x, point.y);
-      }
-
-      // Calculate width based on density
-      let density = this.densities[index] || 0;
-      // Scale width: base width + density factor
-      density *= MAX_DENSITY_INVERTED;
-      // Assuming density is roughly 0-1, but can be higher.
-      // Let's cap the max width increase to avoid huge lines.
-      const densityFactor = Math.min(density, 2.0); 
-      ctx.lineWidth = Math.max(1, baseStrokeWidth * (0.5 + densityFactor));
-      
-      ctx.lineCap = 'round';
-      ctx.lineJoin = 'round';
-
-      let color = this.colors[index] || 'rgba(0, 128, 0, 0.69)';
-      if (this.highlightedEdge && edge.id === this.highlightedEdge) {
-        color = 'white';
-        ctx.lineWidth = ctx.lineWidth * 1.5; // Make highlighted edge thicker
+      let motorways = 0;
+      for (let i = start; i < end; i++) {
+        const e = this._sorted[i];
+        if (this.highlightedEdge && this.edges[e].id === this.highlightedEdge) {
+          highlighted = e;
+          continue;
+        }
+        this._tracePath(ctx, e, view);
+        motorways += this._motorways[e];
       }
-
-      ctx.strokeStyle = color;
       ctx.stroke();
 
       // Draw dashed line for autostrada
-      if (edge.name.toLowerCase().includes("autostrada")) {
-        ctx.setLineDash([4, 4]);
+      if (motorways) {
+        ctx.setLineDash(MOTORWAY_DASH);
+        ctx.beginPath();
+        for (let i = start; i < end; i++) {
+          const e = this._sorted[i];
+          if (this._motorways[e] && e !== highlighted) this._tracePath(ctx, e, view);
+        }
         ctx.stroke();
-        ctx.setLineDash([]);
+        ctx.setLineDash(NO_DASH);
       }
-    });
+      start = end;
+    }
+
+    // Highlighted edge on top, thicker
+    if (highlighted !== -1) {
+      ctx.lineWidth = Math.max(1, baseStrokeWidth * this._paletteWidths[this._bucketOf[highlighted]]) * 1.5;
+      ctx.strokeStyle = 'white';
+      ctx.beginPath();
+      this._tracePath(ctx, highlighted, view);
+      ctx.stroke();
+    }
   },
 
-  _onMapClick: function(e) {
-    const containerPoint = this._map.latLngToContainerPoint(e.latlng);
+  // Find the closest edge to a container point, among the edges of the grid cells around it
+  _closestEdge: function(containerPoint) {
+    const view = this._view();
     const x = containerPoint.x;
     const y = containerPoint.y;
+    const tolerance = HIT_TOLERANCE / view.scale;
+    const wx = (x + view.ox) / view.scale;
+    const wy = (y + view.oy) / view.scale;
+    const count = this._queryGrid(wx - tolerance, wy - tolerance, wx + tolerance, wy + tolerance);
 
+    const points = this._points;
     let closestEdge = null;
     let minDist = Infinity;
-
-    this.edges.forEach(edge => {
-      if (!edge.geometry || edge.geometry.length < 2) return;
-
-      for (let i = 0; i < edge.geometry.length - 1; i++) {
-        const p1 = this._map.latLngToContainerPoint([edge.geometry[i].y, edge.geometry[i].x]);
-        const p2 = this._map.latLngToContainerPoint([edge.geometry[i+1].y, edge.geometry[i+1].x]);
-        const dist = this._pointToLineDistancePixels({x, y}, p1, p2);
+    for (let i = 0; i < count; i++) {
+      const e = this._visible[i];
+      const end = 2 * this._offsets[e + 1];
+      for (let k = 2 * this._offsets[e]; k + 2 < end; k += 2) {
+        const dist = this._pointToLineDistancePixels(
+          x, y,
+          points[k] * view.scale - view.ox, points[k + 1] * view.scale - view.oy,
+          points[k + 2] * view.scale - view.ox, points[k + 3] * view.scale - view.oy
+        );
         if (dist < minDist) {
           minDist = dist;
-          closestEdge = edge;
+          closestEdge = this.edges[e];
         }
       }
-    });
+    }
+    return { edge: closestEdge, dist: minDist };
+  },
 
-    if (closestEdge && minDist < 10) { // 10 pixel threshold
+  _onMapClick: function(e) {
+    const containerPoint = this._map.latLngToContainerPoint(e.latlng);
+    const { edge: closestEdge, dist: minDist } = this._closestEdge(containerPoint);
+
+    if (closestEdge && minDist < HIT_TOLERANCE) {
       highlightedEdge = closestEdge.id;
       highlightedNode = null;
       this.setHighlightedEdge(highlightedEdge);
@@ -754,11 +949,11 @@ L.CanvasEdges = L.Layer.extend({
     }
   },
 
-  _pointToLineDistancePixels: function(point, lineStart, lineEnd) {
-    const A = point.x - lineStart.x;
-    const B = point.y - lineStart.y;
-    const C = lineEnd.x - lineStart.x;
-    const D = lineEnd.y - lineStart.y;
+  _pointToLineDistancePixels: function(px, py, x1, y1, x2, y2) {
+    const A = px - x1;
+    const B = py - y1;
+    const C = x2 - x1;
+    const D = y2 - y1;
 
     const dot = A * C + B * D;
     const lenSq = C * C + D * D;
@@ -767,42 +962,26 @@ L.CanvasEdges = L.Layer.extend({
 
     let xx, yy;
     if (param < 0) {
-      xx = lineStart.x;
-      yy = lineStart.y;
+      xx = x1;
+      yy = y1;
     } else if (param > 1) {
-      xx = lineEnd.x;
-      yy = lineEnd.y;
+      xx = x2;
+      yy = y2;
     } else {
-      xx = lineStart.x + param * C;
-      yy = lineStart.y + param * D;
+      xx = x1 + param * C;
+      yy = y1 + param * D;
     }
 
-    const dx = point.x - xx;
-    const dy = point.y - yy;
+    const dx = px - xx;
+    const dy = py - yy;
     return Math.sqrt(dx * dx + dy * dy);
   },
 
   _onMouseMove: function(e) {
     const containerPoint = this._map.latLngToContainerPoint(e.latlng);
-    const x = containerPoint.x;
-    const y = containerPoint.y;
-
-    let minDist = Infinity;
-
-    this.edges.forEach(edge => {
-      if (!edge.geometry || edge.geometry.length < 2) return;
-
-      for (let i = 0; i < edge.geometry.length - 1; i++) {
-        const p1 = this._map.latLngToContainerPoint([edge.geometry[i].y, edge.geometry[i].x]);
-        const p2 = this._map.latLngToContainerPoint([edge.geometry[i+1].y, edge.geometry[i+1].x]);
-        const dist = this._pointToLineDistancePixels({x, y}, p1, p2);
-        if (dist < minDist) {
-          minDist = dist;
-        }
-      }
-    });
+    const { dist: minDist } = this._closestEdge(containerPoint);
 
-    if (minDist < 10) { // Same threshold as click
+    if (minDist < HIT_TOLERANCE) { // Same threshold as click
       this._map.getContainer().style.cursor = 'pointer';
     } else {
       this._map.getContainer().style.cursor = '';
@@ -817,12 +996,20 @@ const g = overlay.append("g").attr("class", "leaflet-zoom-hide");
 
 let edges, densities, globalData;
 let timeStamp = new Date();
+let currentFrameIndex = 0; // index of the displayed frame in densities, set by the time slider
 let highlightedEdge = null;
 let highlightedNode = null;
 let chart;
 let db = null;
 let selectedSimulationId = null;
 
+// Query API of the visualization server (see webapp_server.py): when set, the data is fetched from the server
+// instead of a database file, and density frames are streamed as float32 tiles, only around the displayed time
+let apiBase = null;
+let framesPerChunk = 64; // frames of each tile, set by the tile index
+const MAX_CACHED_CHUNKS = 16;
+let frameChunks = new Map(); // tile index -> request of its frames, least recently used first
+
 function formatTime(date) {
   const year = date.getFullYear();
   const month = (date.getMonth() + 1).toString().padStart(2, '0');
@@ -856,9 +1043,9 @@ function updateNodeHighlight() {
 // Update edge info display with current density
 function updateEdgeInfo(edge) {
   const edgeIndex = edges.indexOf(edge);
-  const currentDensityRow = densities.find(d => d.datetime.getTime() === timeStamp.getTime());
+  const currentDensityRow = densities[currentFrameIndex];
   let density = 'N/A';
-  if (currentDensityRow) {
+  if (currentDensityRow && currentDensityRow.densities) {
     density = currentDensityRow.densities[edgeIndex];
     if (density === undefined || isNaN(density)) density = 0;
     density = parseFloat(density).toFixed(2);
@@ -898,63 +1085,63 @@ function loadEdgesFromDB() {
     columns.forEach((col, i) => {
       edge[col] = row[i];
     });
-    edge.geometry = parseGeometry(edge.geometry);
-    edge.maxspeed = +edge.maxspeed || 0;
-    edge.nlanes = +edge.nlanes || 1;
-    edge.length = +edge.length || 0;
-    return edge;
+    return parseEdge(edge);
   });
 }
 
-// Load road_data from SQLite for selected simulation and transform to density format
+// Parse the geometry and numeric fields of an edge row
+function parseEdge(edge) {
+  edge.geometry = parseGeometry(edge.geometry);
+  edge.maxspeed = +edge.maxspeed || 0;
+  edge.nlanes = +edge.nlanes || 1;
+  edge.length = +edge.length || 0;
+  return edge;
+}
+
+// Load road_data from SQLite for selected simulation and transform to density format:
+// the densities of all frames are packed in one Float32Array, each frame being a view on it, in the order of the edges
 function loadRoadDataFromDB() {
-  // Get edge IDs in order
-  const edgeIds = edges.map(e => e.id);
   console.log("=== LOAD ROAD DATA DEBUG ===");
-  console.log("Edge IDs count:", edgeIds.length);
-  console.log("Edge ID range:", Math.min(...edgeIds), "to", Math.max(...edgeIds));
+  console.log("Edge IDs count:", edges.length);
   console.log("Selected simulation ID:", selectedSimulationId);
-  
-  // Single query to get all data ordered by datetime and street_id
-  const result = db.exec(
-    `SELECT datetime, street_id, density_vpk FROM road_data WHERE simulation_id = ${selectedSimulationId} ORDER BY datetime, street_id`
+
+  const countResult = db.exec(
+    `SELECT COUNT(DISTINCT datetime) FROM road_data WHERE simulation_id = ${selectedSimulationId}`
   );
-  console.log("SQL result rows:", result.length > 0 ? result[0].values.length : 0);
-  if (result.length === 0) {
+  const nFrames = countResult.length > 0 ? countResult[0].values[0][0] : 0;
+  console.log("Density frames:", nFrames);
+  if (nFrames === 0) {
     console.log("NO ROAD DATA FOUND!");
     return [];
   }
-  
+
+  const nEdges = edges.length;
+  const edgeIndex = new Map(edges.map((edge, k) => [edge.id, k]));
+  const packed = new Float32Array(nFrames * nEdges);
   const densityData = [];
+
+  // Stream the rows, ordered by datetime, instead of materializing the whole result
+  const stmt = db.prepare(
+    "SELECT datetime, street_id, density_vpk FROM road_data WHERE simulation_id = ? ORDER BY datetime"
+  );
+  stmt.bind([selectedSimulationId]);
   let currentTs = null;
-  let currentMap = {};
-  
-  for (const row of result[0].values) {
-    const [ts, streetId, density] = row;
+  let offset = -nEdges;
+  while (stmt.step()) {
+    const [ts, streetId, density] = stmt.get();
     if (ts !== currentTs) {
-      if (currentTs !== null) {
-        // Build densities array in same order as edges for previous timestamp
-        const densityArray = edgeIds.map(id => currentMap[id] || 0);
-        densityData.push({
-          datetime: new Date(currentTs),
-          densities: densityArray
-        });
-      }
       currentTs = ts;
-      currentMap = {};
+      offset += nEdges;
+      densityData.push({
+        datetime: new Date(ts),
+        densities: packed.subarray(offset, offset + nEdges)
+      });
     }
-    currentMap[streetId] = density;
+    const k = edgeIndex.get(streetId);
+    if (k !== undefined) packed[offset + k] = density || 0;
   }
-  
-  // Handle the last timestamp
-  if (currentTs !== null) {
-    const densityArray = edgeIds.map(id => currentMap[id] || 0);
-    densityData.push({
-      datetime: new Date(currentTs),
-      densities: densityArray
-    });
-  }
-  
+  stmt.free();
+
   return densityData;
 }
 
@@ -997,12 +1184,101 @@ function getSimulations() {
   }));
 }
 
+// Fetch JSON from the query API of the visualization server
+async function fetchAPI(path) {
+  const response = await fetch(`${apiBase}${path}`);
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${path}: ${response.status} ${response.statusText}`);
+  }
+  return response.json();
+}
+
+// Load edges from the query API, in the order of the density frames
+async function loadEdgesFromAPI() {
+  return (await fetchAPI('/edges')).map(parseEdge);
+}
+
+// Load the tile index of the density frames from the query API: the tiles are streamed by loadFrame
+async function loadRoadDataFromAPI() {
+  const tileIndex = await fetchAPI(`/simulations/${selectedSimulationId}/tiles`);
+  framesPerChunk = tileIndex.frames_per_tile;
+  frameChunks = new Map();
+  return tileIndex.timestamps.map(ts => ({ datetime: new Date(ts), densities: null }));
+}
+
+// Load global data (aggregated statistics per timestamp) from the query API
+async function loadGlobalDataFromAPI() {
+  const rows = await fetchAPI(`/simulations/${selectedSimulationId}/global`);
+  return rows.map(row => {
+    const data = { datetime: new Date(row.datetime) };
+    for (const column of Object.keys(row)) {
+      if (column !== 'datetime') data[column] = +row[column] || 0;
+    }
+    return data;
+  });
+}
+
+// Get available simulations from the query API
+async function getSimulationsFromAPI() {
+  return fetchAPI('/simulations');
+}
+
+// Return a promise resolved when the densities of the frame at the given index are loaded.
+// With the query API, frames are fetched by float32 tiles, and only the most recently used tiles are kept in memory:
+// each frame is a view on its tile, so switching frame allocates nothing.
+function loadFrame(index) {
+  if (!apiBase || densities[index].densities) return Promise.resolve();
+
+  const chunk = Math.floor(index / framesPerChunk);
+  let request = frameChunks.get(chunk);
+  if (request) {
+    // mark the chunk as the most recently used
+    frameChunks.delete(chunk);
+    frameChunks.set(chunk, request);
+    return request;
+  }
+
+  const start = chunk * framesPerChunk;
+  const stop = Math.min(start + framesPerChunk, densities.length);
+  request = fetch(`${apiBase}/simulations/${selectedSimulationId}/tiles/${chunk}`).then(async response => {
+    if (!response.ok) {
+      throw new Error(`Failed to fetch tile ${chunk}: ${response.status} ${response.statusText}`);
+    }
+    const tile = new Float32Array(await response.arrayBuffer());
+    if (frameChunks.get(chunk) !== request) return; // evicted while loading
+    const nEdges = edges.length;
+    for (let i = start; i < stop; i++) {
+      const offset = (i - start) * nEdges;
+      densities[i].densities = tile.subarray(offset, offset + nEdges);
+    }
+  });
+  request.catch(() => frameChunks.delete(chunk));
+  frameChunks.set(chunk, request);
+
+  while (frameChunks.size > MAX_CACHED_CHUNKS) {
+    const [oldest] = frameChunks.keys();
+    frameChunks.delete(oldest);
+    const oldestStop = Math.min((oldest + 1) * framesPerChunk, densities.length);
+    for (let i = oldest * framesPerChunk; i < oldestStop; i++) {
+      densities[i].densities = null;
+    }
+  }
+  return request;
+}
+
 // Initialize the app after database and simulation are loaded
-function initializeApp() {
-  // Load data from database
-  edges = loadEdgesFromDB();
-  densities = loadRoadDataFromDB();
-  globalData = loadGlobalDataFromDB();
+async function initializeApp() {
+  // Load data from the query API or the database
+  if (apiBase) {
+    [edges, densities, globalData] = await Promise.all([
+      loadEdgesFromAPI(), loadRoadDataFromAPI(), loadGlobalDataFromAPI()
+    ]);
+    if (densities.length) await loadFrame(0);
+  } else {
+    edges = loadEdgesFromDB();
+    densities = loadRoadDataFromDB();
+    globalData = loadGlobalDataFromDB();
+  }
 
   console.log("=== INITIALIZATION DEBUG ===");
   console.log("Selected simulation ID:", selectedSimulationId, "(type:", typeof selectedSimulationId, ")");
@@ -1030,6 +1306,7 @@ function initializeApp() {
     return;
   }
 
+  currentFrameIndex = 0;
   timeStamp = densities[0].datetime;
 
     // Calculate median center from edge geometries
@@ -1200,18 +1477,19 @@ function initializeApp() {
     function updateChart() {
         if (!chart || !globalData) return;
         
-        // Find current data point index based on timeStamp
-        const currentIndex = densities.findIndex(d => d.datetime.getTime() === timeStamp.getTime());
-        
-        if (currentIndex !== -1) {
-            const pointData = new Array(globalData.length).fill(null);
-            if (globalData[currentIndex]) {
-                pointData[currentIndex] = globalData[currentIndex][currentChartColumn];
-            }
-            chart.data.datasets[1].data = pointData;
-            chart.update('none');
+        // Move the current time marker to the data point of the displayed frame
+        let pointData = chart.data.datasets[1].data;
+        if (pointData.length !== globalData.length) {
+            pointData = chart.data.datasets[1].data = new Array(globalData.length).fill(null);
+        }
+        if (markedIndex !== -1 && markedIndex < pointData.length) pointData[markedIndex] = null;
+        markedIndex = currentFrameIndex;
+        if (globalData[markedIndex]) {
+            pointData[markedIndex] = globalData[markedIndex][currentChartColumn];
         }
+        chart.update('none');
     }
+    let markedIndex = -1; // data point holding the current time marker
 
     // Function to update edge positions, and color edges based on density
     function update() {
@@ -1226,26 +1504,22 @@ function initializeApp() {
     map.on("zoomend", update);
     update(); // Initial render
 
-    // Update edge colors based on the current time step density data
+    // Update edge colors based on the current time step density data (the layer maps densities to its palette)
     function updateDensityVisualization() {
-      const currentDensityRow = densities.find(d => d.datetime.getTime() === timeStamp.getTime());
+      const currentIndex = currentFrameIndex;
+      const currentDensityRow = densities[currentIndex];
       if (!currentDensityRow) {
         console.error("No density data for time step:", timeStamp);
         return;
       }
-      const currentDensities = currentDensityRow.densities;
-
-      const colors = edges.map((edge, index) => {
-        let density = currentDensities[index];
-        if (density === undefined || isNaN(density)) {
-          density = 0;
-        }
-        const rgb = d3.rgb(colorScale(density));
-        return `rgba(${rgb.r}, ${rgb.g}, ${rgb.b}, 0.69)`;
-      });
-
-      canvasEdges.setColors(colors);
-      canvasEdges.setDensities(currentDensities);
+      if (!currentDensityRow.densities) {
+        // frame not loaded yet: render it when it arrives, if still displayed
+        loadFrame(currentIndex)
+          .then(() => { if (currentFrameIndex === currentIndex) updateDensityVisualization(); })
+          .catch(error => console.error("Failed to load density frame:", error));
+        return;
+      }
+      canvasEdges.setDensities(currentDensityRow.densities);
     }
 
     // Set up the time slider based on the density data's maximum time value
@@ -1308,9 +1582,14 @@ function initializeApp() {
     // Update the visualization when the slider value changes
     timeSlider.addEventListener('input', function() {
       const index = Math.floor(parseInt(timeSlider.value) / dt);
+      currentFrameIndex = index;
       timeStamp = densities[index].datetime;
       timeLabel.textContent = `${formatTime(timeStamp)}`;
       update();
+      // Prefetch the next chunk of frames, for playback
+      if (apiBase && index + framesPerChunk < densities.length) {
+        loadFrame(index + framesPerChunk).catch(error => console.error("Failed to prefetch density frames:", error));
+      }
       // Update edge info if an edge is selected
       if (highlightedEdge) {
         const edge = edges.find(e => e.id === highlightedEdge);
@@ -1500,7 +1779,7 @@ async function autoLoadDatabase(dbUrl) {
     if (simulations.length === 1) {
       selectedSimulationId = simulations[0].id;
       dbModal.classList.add('hidden');
-      initializeApp();
+      await initializeApp();
     } else {
       // Show simulation selector (don't hide modal first!)
       showSimulationSelector(simulations);
@@ -1513,6 +1792,38 @@ async function autoLoadDatabase(dbUrl) {
   }
 }
 
+// Function to auto-load the simulations from the query API of the visualization server
+async function autoLoadFromAPI(baseUrl) {
+  const dbModal = document.getElementById('db-modal');
+
+  try {
+    console.log('Loading simulations from:', baseUrl);
+    apiBase = baseUrl;
+
+    const simulations = await getSimulationsFromAPI();
+    if (simulations.length === 0) {
+      throw new Error("No simulations found in database");
+    }
+
+    console.log(`Found ${simulations.length} simulation(s).`);
+
+    // If only one simulation, auto-select it
+    if (simulations.length === 1) {
+      selectedSimulationId = simulations[0].id;
+      dbModal.classList.add('hidden');
+      await initializeApp();
+    } else {
+      showSimulationSelector(simulations);
+    }
+  } catch (error) {
+    console.error('Loading from the query API error:', error);
+    alert(`Error loading simulations: ${error.message}`);
+    // Show modal for manual selection as fallback
+    apiBase = null;
+    dbModal.classList.remove('hidden');
+  }
+}
+
 // Database loading and simulation selection via modal
 document.addEventListener('DOMContentLoaded', () => {
   const dbFileInput = document.getElementById('dbFileInput');
@@ -1522,8 +1833,12 @@ document.addEventListener('DOMContentLoaded', () => {
   // Check for database parameter in URL
   const urlParams = new URLSearchParams(window.location.search);
   const dbParam = urlParams.get('db');
+  const apiParam = urlParams.get('api');
   
-  if (dbParam) {
+  if (apiParam) {
+    // Query the visualization server, without downloading the database
+    autoLoadFromAPI(apiParam);
+  } else if (dbParam) {
     // Auto-load database from URL parameter
     autoLoadDatabase(dbParam);
   } else {
@@ -1550,6 +1865,7 @@ document.addEventListener('DOMContentLoaded', () => {
       });
       
       // Read the file
+      apiBase = null;
       const arrayBuffer = await file.arrayBuffer();
       const uint8Array = new Uint8Array(arrayBuffer);
       
@@ -1613,6 +1929,9 @@ function showSimulationSelector(simulations) {
   document.getElementById('loadSimBtn').addEventListener('click', () => {
     selectedSimulationId = parseInt(document.getElementById('simulationSelector').value);
     document.getElementById('db-modal').classList.add('hidden');
-    initializeApp();
+    initializeApp().catch(error => {
+      console.error('Simulation loading error:', error);
+      alert(`Error loading simulation: ${error.message}`);
+    });
   });
 }
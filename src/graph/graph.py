@@ -8,7 +8,9 @@ from typing import Literal
 
 from .tools.slow_charge_tool import simulate_slow_charge
 from .tools.simulation_tools import run_simulation
-from .tools.edges_tools import remove_edge, change_number_of_lanes
+from .tools.job_tools import submit_simulation, simulation_status, simulation_result, cancel_simulation
+from .tools.edges_tools import remove_edge, change_number_of_lanes, undo_edits
+from .tools.scenario import merge_scenarios
 from .prompts.prompt import prompt
 from .state import SimulationState
 from datetime import datetime
@@ -33,7 +35,10 @@ def make_graph(
     # instantiate the agent
     agent = create_agent(
         model=ChatOpenAI(model="gpt-4.1-mini", temperature=0.0),
-        tools=[simulate_slow_charge, run_simulation, remove_edge, change_number_of_lanes],
+        tools=[
+            simulate_slow_charge, run_simulation, remove_edge, change_number_of_lanes, undo_edits,
+            submit_simulation, simulation_status, simulation_result, cancel_simulation,
+        ],
         system_prompt=prompt,
         state_schema=SimulationState
     )
@@ -46,9 +51,14 @@ def make_graph(
         result = await agent.ainvoke(state)
         last_msg_content = result['messages'][-1].content
 
-        return Command(
-            update={"messages": [HumanMessage(content=last_msg_content)]}
-        )
+        # the agent starts from the edits of the conversation: its final edits replace them
+        update = {
+            "messages": [HumanMessage(content=last_msg_content)],
+            "scenario": {**merge_scenarios(result.get("scenario")), "replace": True},
+        }
+        if result.get("output_dir"):
+            update["output_dir"] = result["output_dir"]
+        return Command(update=update)
 
     # build graph
     builder = StateGraph(SimulationState)
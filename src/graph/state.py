@@ -11,10 +11,26 @@ def str_replace(left: str | None, right: str | None) -> str | None:
         right = ""
     return right
 
+def add_edits(left: dict | None, right: dict | None) -> dict:
+    """
+    Add the closures and lane changes of the right scenario to the left one.
+
+    If the right scenario has `"replace": True`, it replaces the left one instead (e.g. to undo edits).
+    """
+    left = left or {}
+    right = right or {}
+    if right.get("replace"):
+        left = {}
+    return {
+        "closures": left.get("closures", []) + right.get("closures", []),
+        "lane_changes": left.get("lane_changes", []) + right.get("lane_changes", []),
+    }
+
 class SimulationState(AgentState):
     """
     State for the simulation agent.
     """
     edges_filepath: Annotated[str, str_replace]  # path to the edges file
     nodes_filepath: Annotated[str, str_replace]  # path to the nodes file
-    output_dir: Annotated[str, str_replace]  # path to the output directory
\ No newline at end of file
+    output_dir: Annotated[str, str_replace]  # path to the output directory
+    scenario: Annotated[dict, add_edits]  # closures and lane changes applied to the network (see tools/scenario.py)
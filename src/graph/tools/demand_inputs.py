@@ -0,0 +1,222 @@
+"""
+Process-wide store of the demand inputs (vehicle counts and origin/destination weights).
+
+Inputs are loaded once per process and reloaded only when the files change. Replicas run in workers forked by
+the launcher of the ensemble, so they inherit the inputs it loaded (see `ensemble`).
+"""
+
+import numpy as np
+import pickle
+import os
+
+_DEMAND_INPUTS = {}  # input folder -> (files signature, demand inputs)
+_HOURLY_OD = {}  # (input folder, smoothing hours, norm weights) -> (files signature, hourly origins and destinations)
+
+DEMAND_FILES = [
+    "vehicles10s_2022_mean.npy",
+    "vehicles10s_2022_std.npy",
+    "origin_dicts.pkl",
+    "destination_dicts.pkl",
+]
+
+
+def _files_signature(input_folder: str) -> tuple:
+    """
+    Returns the (modification time, size) of every demand file, used to detect changes.
+    """
+    signature = []
+    for filename in DEMAND_FILES:
+        stat = os.stat(f"{input_folder}/{filename}")
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _load_vehicles(filepath: str) -> np.ndarray:
+    """
+    Loads a vehicles series and derives the one used by the simulation: clipped to >= 0 and shifted ahead of
+    360 points (1 hour). The raw file is memory-mapped, so only the derived array is held in memory.
+    """
+    raw = np.load(filepath, mmap_mode="r")
+    # Ensure it is >= 0, then shift ahead of 360 points (1 hour)
+    vehicles = np.roll(np.clip(raw, 0, None), 360)
+    vehicles.flags.writeable = False  # shared by every caller
+    return vehicles
+
+
+def get_demand_inputs(input_folder: str) -> dict:
+    """
+    Returns the demand inputs of the given folder, loading them only on the first call or when a file changed.
+
+    The returned arrays and dictionaries are shared, not copied: the arrays are read-only, and
+    the dictionaries must not be modified by the caller.
+
+    Args:
+        input_folder: The folder containing the demand files
+    Returns:
+        A dict with the clipped and shifted `vehicles_mean` and `vehicles_std` arrays, and the hourly
+        `origin_nodes` and `destination_nodes` lists of {node id: weight} dictionaries.
+    """
+    signature = _files_signature(input_folder)
+    cached = _DEMAND_INPUTS.get(input_folder)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    print(f">>> Loading input data from {input_folder}...")
+    with open(f"{input_folder}/origin_dicts.pkl", "rb") as f:
+        origin_nodes = pickle.load(f)
+    with open(f"{input_folder}/destination_dicts.pkl", "rb") as f:
+        destination_nodes = pickle.load(f)
+
+    demand_inputs = {
+        "vehicles_mean": _load_vehicles(f"{input_folder}/vehicles10s_2022_mean.npy"),
+        "vehicles_std": _load_vehicles(f"{input_folder}/vehicles10s_2022_std.npy"),
+        "origin_nodes": origin_nodes,
+        "destination_nodes": destination_nodes,
+    }
+    _DEMAND_INPUTS[input_folder] = (signature, demand_inputs)
+    return demand_inputs
+
+
+def od_matrix(hourly_weights: list[dict]) -> tuple[list, np.ndarray, np.ndarray]:
+    """
+    Turns the hourly {node id: weight} dictionaries into a dense node x hour matrix.
+
+    Args:
+        hourly_weights: The list of {node id: weight} dictionaries, one per hour
+    Returns:
+        A tuple with the node ids (the matrix rows), the node x hour weights matrix,
+        and the boolean node x hour matrix telling which node is present in which hour.
+    """
+    nodes = sorted(set().union(*hourly_weights))
+    row = {node: k for k, node in enumerate(nodes)}
+    weights = np.zeros((len(nodes), len(hourly_weights)))
+    present = np.zeros((len(nodes), len(hourly_weights)), dtype=bool)
+    for hour, hour_weights in enumerate(hourly_weights):
+        rows = [row[node] for node in hour_weights]
+        weights[rows, hour] = list(hour_weights.values())
+        present[rows, hour] = True
+    return nodes, weights, present
+
+
+def centered_moving_average(weights: np.ndarray, present: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Averages the weights of every node over a window of hours centered on each hour, in one vectorized pass.
+
+    Only the hours where a node is present (and inside the day) are averaged, so a node missing
+    in some hour of the window is not counted as a zero.
+
+    Args:
+        weights: The node x hour weights matrix
+        present: The boolean node x hour presence matrix
+        window: The number of hours to average over (odd number recommended)
+    Returns:
+        A tuple with the node x hour smoothed weights and the node x hour presence of the smoothed weights.
+    """
+    n_hours = weights.shape[1]
+    half_window = window // 2
+    # cumulative sums along the hours, with a leading zero column: window sums are differences of two columns
+    weight_sums = np.zeros((weights.shape[0], n_hours + 1))
+    np.cumsum(np.where(present, weights, 0.0), axis=1, out=weight_sums[:, 1:])
+    counts = np.zeros((weights.shape[0], n_hours + 1))
+    np.cumsum(present, axis=1, out=counts[:, 1:])
+
+    hours = np.arange(n_hours)
+    lo = np.clip(hours - half_window, 0, n_hours)
+    hi = np.clip(hours + half_window + 1, 0, n_hours)
+    window_sums = weight_sums[:, hi] - weight_sums[:, lo]
+    window_counts = counts[:, hi] - counts[:, lo]
+
+    smoothed_present = window_counts > 0
+    smoothed = np.divide(window_sums, window_counts, out=np.zeros_like(window_sums), where=smoothed_present)
+    return smoothed, smoothed_present
+
+
+def _hourly_dicts(nodes: list, weights: np.ndarray, present: np.ndarray) -> list[dict]:
+    """
+    Turns a node x hour matrix back into the hourly {node id: weight} dictionaries expected by the dynamics.
+    """
+    hourly = []
+    for hour in range(weights.shape[1]):
+        rows = np.flatnonzero(present[:, hour])
+        hourly.append(dict(zip([nodes[r] for r in rows], weights[rows, hour].tolist())))
+    return hourly
+
+
+def get_hourly_od(input_folder: str, smoothing_hours: int = 3, norm_weights: bool = False) -> tuple[list[dict], list[dict]]:
+    """
+    Returns the origin and destination weights to set at each hour of the day.
+
+    Origin weights are averaged over `smoothing_hours` hours centered on each hour. Everything is computed once
+    per input version and smoothing window, so switching origins and destinations is a lookup by hour.
+
+    Args:
+        input_folder: The folder containing the demand files
+        smoothing_hours: The number of hours to average the origin weights over (odd number recommended)
+        norm_weights: Whether to make all the weights 1
+    Returns:
+        A tuple with the hourly origins and the hourly destinations, as lists of {node id: weight} dictionaries.
+        They are shared: the caller must not modify them.
+    """
+    demand_inputs = get_demand_inputs(input_folder)
+    signature = _DEMAND_INPUTS[input_folder][0]
+    key = (input_folder, smoothing_hours, norm_weights)
+    cached = _HOURLY_OD.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    nodes, weights, present = od_matrix(demand_inputs["origin_nodes"])
+    if norm_weights:
+        weights = present.astype(float)
+    smoothed, smoothed_present = centered_moving_average(weights, present, smoothing_hours)
+    origins = _hourly_dicts(nodes, smoothed, smoothed_present)
+
+    destinations = demand_inputs["destination_nodes"]
+    if norm_weights:
+        destinations = [dict.fromkeys(dest_dict, 1) for dest_dict in destinations]
+
+    _HOURLY_OD[key] = (signature, (origins, destinations))
+    return origins, destinations
+
+
+def sample_injection_schedule(
+    vehicles_mean: np.ndarray,
+    vehicles_std: np.ndarray,
+    start: int,
+    end: int,
+    dt_agent: int,
+    scale: float,
+    seed: int,
+) -> tuple[int, np.ndarray]:
+    """
+    Samples the number of agents to inject at every injection step between start and end (both included).
+
+    Only the window of the series used by the simulation is sampled, with a generator local to the replica,
+    so replicas are reproducible and independent of the global NumPy random state.
+
+    Args:
+        vehicles_mean: The mean vehicles series
+        vehicles_std: The standard deviation of the vehicles series
+        start: The first simulated second
+        end: The last simulated second
+        dt_agent: Time interval for agent spawning, in seconds
+        scale: The number of vehicles represented by one agent
+        seed: The seed of the replica
+    Returns:
+        A tuple with the index in the series of the first injection step (at time first * dt_agent),
+        and the int array of agents to inject at each step from there.
+    """
+    first = -(-start // dt_agent)  # first injection step >= start
+    stop = min(end // dt_agent + 1, len(vehicles_mean))
+    rng = np.random.default_rng(seed)
+    # Sample input vehicles from normal distribution, no negative vehicles
+    vehicles = rng.normal(vehicles_mean[first:stop], vehicles_std[first:stop])
+    counts = (np.clip(vehicles, 0, None) / scale).astype(np.int32)
+    return first, counts
+
+
+def clear_demand_cache() -> None:
+    """
+    Drops every demand input loaded by this process.
+    """
+    _DEMAND_INPUTS.clear()
+    _HOURLY_OD.clear()
@@ -0,0 +1,75 @@
+"""
+Event-scheduled driver for the dynamics.
+
+Instead of checking at every simulated second whether something has to happen, the timeline of actions
+(OD switches, path updates, agent injections, ...) is computed up front, and only the seconds with events run
+Python handlers. The dynamics still evolves one second per `evolve` call, so the loop over the simulated
+seconds remains: only the per-second checks of the actions are saved.
+"""
+
+from typing import Callable
+
+
+def build_timeline(
+    start: int,
+    end: int,
+    periods: dict[str, int],
+    limits: dict[str, int] | None = None,
+) -> list[tuple[int, list[str]]]:
+    """
+    Builds the timeline of the periodic actions happening between start and end (both included).
+
+    An action with period p happens at every time t multiple of p. Actions happening at the same time
+    are listed in the same order as in `periods`.
+
+    Args:
+        start: The first simulated second
+        end: The last simulated second
+        periods: The period, in seconds, of each action
+        limits: Optional upper bound (excluded) of t // period for some actions, e.g. the length of the input data
+    Returns:
+        The sorted list of (time, actions) events.
+    """
+    limits = limits or {}
+    events = {}
+    for action, period in periods.items():
+        first = -(-start // period) * period  # first multiple of period >= start
+        stop = end + 1
+        if action in limits:
+            stop = min(stop, limits[action] * period)
+        for t in range(first, stop, period):
+            events.setdefault(t, []).append(action)
+    return sorted(events.items())
+
+
+def run_timeline(
+    simulator,
+    start: int,
+    end: int,
+    timeline: list[tuple[int, list[str]]],
+    handlers: dict[str, Callable[[int], None]],
+) -> None:
+    """
+    Evolves the dynamics from start to end (both included), running the actions of the timeline.
+
+    The actions of an event at time t run right before the dynamics evolves the second t,
+    as in a per-second loop checking every action.
+
+    Args:
+        simulator: The dynamics to evolve
+        start: The first simulated second
+        end: The last simulated second
+        timeline: The (time, actions) events, as built by `build_timeline`
+        handlers: The function to call for each action, taking the time of the event
+    """
+    evolve = simulator.evolve
+    t = start
+    for time, actions in timeline:
+        # seconds without events: nothing to check, one evolve call each
+        for _ in range(time - t):
+            evolve(False)
+        for action in actions:
+            handlers[action](time)
+        t = time
+    for _ in range(end + 1 - t):
+        evolve(False)
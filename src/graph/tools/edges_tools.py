@@ -1,8 +1,6 @@
 from typing import Annotated
-import geopandas as gpd
-import os
-from .utils import fuzzy_match, read_edges_file
-from datetime import datetime
+from .street_index import get_street_index
+from .scenario import merge_scenarios, describe_scenario
 from langchain.tools import tool, ToolRuntime
 from langgraph.types import Command
 from langchain_core.messages import ToolMessage
@@ -10,16 +8,16 @@ from langchain_core.messages import ToolMessage
 @tool 
 def remove_edge(
     runtime : ToolRuntime,
-    street_name: Annotated[str, "The name of the street to remove"]
+    street_names: Annotated[list[str], "The names of the streets to remove"]
 )->Command:
     """
-    Use this tool to remove a street from the simulation's cartography.
+    Use this tool to remove one or more streets from the simulation's cartography.
 
     Args:
-        street_name: The name of the street to remove.
+        street_names: The names of the streets to remove.
 
     Returns:
-        A message indicating that the street has been removed. If no match is found, an error message is returned.
+        A message indicating that the streets have been removed. If a name has no match, an error message is returned and no street is removed.
     """
 
     # (!) ---------------------------------------------------------------------------------------------
@@ -28,49 +26,43 @@ def remove_edge(
 
     # Read from state
     edges_filepath = runtime.state["edges_filepath"]
-    print(f"Reading edges file from {edges_filepath}...")    
-    edges_gdf = read_edges_file(edges_filepath)
 
     # names are saved under the 'name' field like this: via_alessandro_codivilla
     # the llm needs a way to match natural language input with the exact name: use fuzzy match! 
-    match, score = fuzzy_match(edges_gdf, "name", street_name)
-    if match is None or score < 75: # threshold is 75% match
-        tool_err = f"No match found for '{street_name}'"
+    matches, tool_err = _resolve_street_names(edges_filepath, street_names)
+    if tool_err is not None:
         return Command(update={"messages": [ToolMessage(tool_err, tool_call_id=runtime.tool_call_id)]})
 
-    print(f"Removing street '{match}' from the simulation's cartography... (score: {score})")
-
-    # remove the edge from the file - but wrap in geodf because it can degrade to simple df
-    edges_gdf = gpd.GeoDataFrame(edges_gdf[edges_gdf["name"] != match])
-    
-    # save the modified edges file w/ a timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    os.makedirs("./edges", exist_ok=True)
-    edges_filepath = f"./edges/bologna_edges_{timestamp}.geojson"
-    edges_gdf.to_file(edges_filepath, driver="GeoJSON") # NOTE: no need to modify nodes because there's only a warning in dsf mobility if not found
+    closures = []
+    for match, score, ids in matches:
+        print(f"Removing street '{match}' from the simulation's cartography... (score: {score})")
+        closures.append({"name": match, "edge_ids": [int(edge_id) for edge_id in ids]})
 
+    # NOTE: the edges file is not rewritten: the streets are closed on the road network when a simulation starts
+    edits = {"closures": closures, "lane_changes": []}
+    message = f"Streets {_names(matches)} have been removed. Current edits: {describe_scenario(merge_scenarios(runtime.state.get('scenario'), edits))}."
     return Command(
         update={
-            "messages": [ToolMessage(f"Street '{match}' has been removed.", tool_call_id=runtime.tool_call_id)],
-            "edges_filepath" : edges_filepath # save the edges file in state
+            "messages": [ToolMessage(message, tool_call_id=runtime.tool_call_id)],
+            "scenario" : edits # add the edits to the scenario in state
         }
     )
 
 @tool 
 def change_number_of_lanes(
     runtime : ToolRuntime,
-    street_name: Annotated[str, "The name of the street to change the number of lanes of"],
-    number_of_lanes: Annotated[int, "The number of lanes to change the street to"] = 2
+    street_names: Annotated[list[str], "The names of the streets to change the number of lanes of"],
+    number_of_lanes: Annotated[int, "The number of lanes to change the streets to"] = 2
 )->Command:
     """
-    Use this tool to change the number of lanes of a street.
+    Use this tool to change the number of lanes of one or more streets.
 
     Args:
-        street_name: The name of the street to change the number of lanes of
-        number_of_lanes: The number of lanes to change the street to
+        street_names: The names of the streets to change the number of lanes of
+        number_of_lanes: The number of lanes to change the streets to
 
     Returns:
-        A message indicating that the number of lanes has been changed. If no match is found, an error message is returned.
+        A message indicating that the number of lanes has been changed. If a name has no match, an error message is returned and no street is changed.
     """
 
     # check if the lane to change is 0: in that case return a message saying it needs to use the other tool (remove edge entirely)
@@ -80,30 +72,79 @@ def change_number_of_lanes(
 
     # get edges file from state
     edges_filepath = runtime.state["edges_filepath"]
-    print(f"Reading edges file from {edges_filepath}...")    
-    edges_gdf = read_edges_file(edges_filepath)
 
-    # fuzzy match the street name
-    match, score = fuzzy_match(edges_gdf, "name", street_name)
-    if match is None:
-        tool_err = f"No match found for '{street_name}'"
+    # fuzzy match the street names
+    matches, tool_err = _resolve_street_names(edges_filepath, street_names)
+    if tool_err is not None:
         return Command(update={"messages": [ToolMessage(tool_err, tool_call_id=runtime.tool_call_id)]})
 
-    # Fai una copia esplicita per evitare warning di SettingWithCopy
-    edges_gdf = edges_gdf.copy()
+    lane_changes = [
+        {"name": match, "edge_ids": [int(edge_id) for edge_id in ids], "nlanes": number_of_lanes}
+        for match, _, ids in matches
+    ]
+
+    # update state: the lanes are changed on the road network when a simulation starts
+    edits = {"closures": [], "lane_changes": lane_changes}
+    message = f"Number of lanes for streets {_names(matches)} has been changed to {number_of_lanes}. Current edits: {describe_scenario(merge_scenarios(runtime.state.get('scenario'), edits))}."
+    return Command(
+        update={
+            "messages": [ToolMessage(message, tool_call_id=runtime.tool_call_id)],
+            "scenario" : edits # add the edits to the scenario in state
+        }
+    )
+
+@tool
+def undo_edits(
+    runtime : ToolRuntime,
+    street_names: Annotated[list[str] | None, "The names of the streets whose edits to undo. Omit to undo every edit"] = None
+)->Command:
+    """
+    Use this tool to undo the edits to the simulation's cartography: the removed streets and the changed number of lanes.
+
+    Args:
+        street_names: The names of the streets whose edits to undo. Defaults to every street.
 
-    # Assegna i valori
-    edges_gdf.loc[edges_gdf["name"] == match, "nlanes"] = number_of_lanes
+    Returns:
+        A message with the remaining edits. If a name has no match, an error message is returned and nothing is undone.
+    """
+    scenario = merge_scenarios(runtime.state.get("scenario"))
+
+    if street_names:
+        matches, tool_err = _resolve_street_names(runtime.state["edges_filepath"], street_names)
+        if tool_err is not None:
+            return Command(update={"messages": [ToolMessage(tool_err, tool_call_id=runtime.tool_call_id)]})
+        undone = {match for match, _, _ in matches}
+        edits = {
+            "closures": [closure for closure in scenario["closures"] if closure.get("name") not in undone],
+            "lane_changes": [change for change in scenario["lane_changes"] if change.get("name") not in undone],
+        }
+        message = f"Edits of streets {_names(matches)} have been undone."
+    else:
+        edits = {"closures": [], "lane_changes": []}
+        message = "Every edit has been undone."
 
-    # save the modified edges file w/ a timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    edges_filepath = f"./input/bologna_edges_{timestamp}.geojson"
-    edges_gdf.to_file(edges_filepath, driver="GeoJSON")
-    
-    # update state
     return Command(
         update={
-            "messages": [ToolMessage(f"Number of lanes for street '{match}' has been changed to {number_of_lanes}.", tool_call_id=runtime.tool_call_id)],
-            "edges_filepath" : edges_filepath # save the edges file in state
+            "messages": [ToolMessage(f"{message} Current edits: {describe_scenario(edits)}.", tool_call_id=runtime.tool_call_id)],
+            "scenario" : {**edits, "replace": True} # replace the scenario in state
         }
     )
+
+def _resolve_street_names(edges_filepath: str, street_names: list[str]) -> tuple[list, str | None]:
+    """
+    Resolves the street names given by the user with the street name index of the edges file.
+
+    Returns:
+        A tuple with the (name, score, edge ids) match of each street name, and an error message if some names have no match.
+    """
+    if not street_names:
+        return [], "No street names given"
+    index = get_street_index(edges_filepath)
+    matches = index.match_many(street_names)
+    missing = [name for name, match in matches.items() if match is None]
+    if missing:
+        return [], "No match found for " + ", ".join(f"'{name}'" for name in missing)
+    return list(matches.values()), None
+
+def _names(matches: list) -> str:
+    return ", ".join(f"'{match}'" for match, _, _ in matches)
@@ -0,0 +1,376 @@
+"""
+Parallel execution of the simulation ensemble.
+
+Every replica builds its own dynamics and writes to its own database shard, so replicas can run in separate
+processes. The agent process runs an event loop, the visualization server and the job threads, so it never forks:
+the ensemble is run by a launcher process, started from a clean forkserver, which loads the networks and demand
+inputs once (see `network_cache` and `demand_inputs`) and forks one process per replica, which inherits them.
+Shards are merged into a single database at the end.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, CancelledError, wait
+from multiprocessing import Manager, connection, get_context
+from queue import Empty
+from typing import Callable
+from tqdm import tqdm
+from .utils import get_epoch_time
+from .network_cache import get_prepared_network
+from .demand_inputs import get_demand_inputs, get_hourly_od, sample_injection_schedule
+from .driver import build_timeline, run_timeline
+from .turn_counts import TurnCountsWriter
+from .output_writer import connect_output
+import sqlite3
+import threading
+import os
+
+PROGRESS_EVERY = 60  # simulated seconds between two progress reports of a replica
+
+
+def run_replica(task: dict, progress_queue=None) -> str:
+    """
+    Runs a single replica of the ensemble. Meant to be executed in a worker process.
+
+    Args:
+        task: The replica parameters (seed, shard path, simulation parameters), as built by `run_simulation`
+        progress_queue: Optional queue where (replica, simulated seconds) progress reports are put
+    Returns:
+        The path to the database shard written by this replica.
+    """
+    import dsf
+    from dsf import mobility
+
+    # I hate warnings
+    dsf.set_log_level(dsf.LogLevel.ERROR)
+
+    input_folder = task["input_folder"]
+    include_tram = task["include_tram"]
+    dt_agent = task["dt_agent"]
+    SEED = task["seed"]
+
+    # NOTE: loaded once in the launcher process and inherited by the replica processes
+    demand_inputs = get_demand_inputs(input_folder)
+    input_vehicles_mean = demand_inputs["vehicles_mean"]
+    input_vehicles_std = demand_inputs["vehicles_std"]
+    # hourly origins (smoothed) and destinations, precomputed once per smoothing window
+    hourly_origins, hourly_destinations = get_hourly_od(input_folder, task["smoothing_hours"], task["norm_weights"])
+
+    # NOTE: prepared once in the launcher process and inherited by the replica processes, which move it
+    rn = get_prepared_network(task["edges_filepath"], task["nodes_filepath"], task["scenario"])
+
+    simulator = mobility.Dynamics(rn, False, SEED, task["alpha"])
+    if include_tram:
+        simulator.setName(f"sim_{task['day']}_with_tram_{SEED}")
+    else:
+        simulator.setName(f"sim_{task['day']}_no_tram_{SEED}")
+
+    simulator.killStagnantAgents(40.0)
+
+    # start and end times of the saved window, after the warm-up
+    start_time_seconds = task["start_hour"] * 3600
+    end_time_seconds = start_time_seconds + task["duration"]
+    warmup_start_seconds = start_time_seconds - task.get("warmup_hours", 0) * 3600
+
+    # Get the epoch time for the actual day of the simulation
+    epoch_time = get_epoch_time(task["day"], task["start_hour"], include_tram=include_tram) # start minute
+    simulator.setInitTime(epoch_time - (start_time_seconds - warmup_start_seconds))
+
+    # agents to inject at each step of the simulated window (warm-up included), sampled with the replica seed
+    first_step, agents_schedule = sample_injection_schedule(
+        input_vehicles_mean, input_vehicles_std, warmup_start_seconds, end_time_seconds, dt_agent, task["scale"], SEED
+    )
+
+    def set_od(t):
+        simulator.setOriginNodes(hourly_origins[t // 3600])
+        simulator.setDestinationNodes(hourly_destinations[t // 3600])
+
+    def update_paths(t):
+        simulator.updatePaths(False)
+
+    def save_turn_counts(t):
+        turn_counts.write(epoch_time + t - start_time_seconds, simulator.normalizedTurnCounts())
+
+    def add_agents(t):
+        simulator.addAgentsRandomly(int(agents_schedule[t // dt_agent - first_step]))
+
+    def report_progress(t):
+        progress_queue.put((task["replica"], t - start_time_seconds))
+
+    periods = {"od": 3600, "paths": 300, "turn_counts": 3600, "agents": dt_agent}
+    handlers = {"od": set_od, "paths": update_paths, "turn_counts": save_turn_counts, "agents": add_agents}
+    if progress_queue is not None:
+        periods["progress"] = PROGRESS_EVERY
+        handlers["progress"] = report_progress
+    limits = {"od": len(hourly_origins), "agents": first_step + len(agents_schedule)}
+
+    # NOTE: the warm-up loads the network before start_hour, without saving anything
+    warmup_periods = {action: periods[action] for action in ("od", "paths", "agents")}
+    warmup_timeline = build_timeline(warmup_start_seconds, start_time_seconds - 1, warmup_periods, limits)
+    timeline = build_timeline(start_time_seconds, end_time_seconds, periods, limits)
+
+    if warmup_start_seconds < start_time_seconds:
+        run_timeline(simulator, warmup_start_seconds, start_time_seconds - 1, warmup_timeline, handlers)
+
+    # NOTE: every replica saves to its own shard, merged at the end of the ensemble
+    connect_output(simulator, task["shard_path"], task["output"])
+
+    # turn counts are written to the shard as they are taken, not kept in memory
+    turn_counts = TurnCountsWriter(task["shard_path"], task["edges_filepath"])
+
+    # NOTE: simulate from start_hour until start_hour + duration
+    try:
+        run_timeline(simulator, start_time_seconds, end_time_seconds, timeline, handlers)
+    finally:
+        turn_counts.close()
+
+    if progress_queue is not None:
+        progress_queue.put((task["replica"], end_time_seconds - start_time_seconds + 1))
+
+    return task["shard_path"]
+
+
+def _drain_progress(progress_queue, bars: dict, progress_callback=None) -> None:
+    """
+    Moves every pending progress report from the queue to the corresponding progress bar (and callback).
+    """
+    while True:
+        try:
+            replica, done = progress_queue.get_nowait()
+        except Empty:
+            return
+        bar = bars[replica]
+        bar.update(done - bar.n)
+        if progress_callback is not None:
+            progress_callback(replica, done, bar.total)
+
+
+def run_ensemble(
+    tasks: list[dict],
+    n_workers: int,
+    progress_callback: Callable[[int, int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+) -> list[str]:
+    """
+    Runs the replicas of the ensemble in a process pool, showing one progress bar per replica.
+
+    If a replica fails (exception or crashed worker), the remaining ones are cancelled and a RuntimeError is raised.
+    If `cancel_event` is set, the replicas are killed and a CancelledError is raised.
+
+    Args:
+        tasks: The replica parameters, one dict per replica (see `run_replica`)
+        n_workers: The number of worker processes
+        progress_callback: Optional function called with (replica, simulated seconds, total seconds) on progress
+        cancel_event: Optional event to set (from another thread) to cancel the ensemble
+    Returns:
+        The paths to the database shards, in the same order as tasks.
+    """
+    n_workers = max(1, min(n_workers, len(tasks)))
+    print(f">>> Running {len(tasks)} replicas on {n_workers} worker processes...")
+
+    bars = {
+        task["replica"]: tqdm(
+            total=task["duration"] + 1,
+            desc=f"Replica {task['replica']} (seed {task['seed']})",
+            position=position,
+            unit="s",
+        )
+        for position, task in enumerate(tasks)
+    }
+    if progress_callback is not None:
+        for task in tasks:
+            progress_callback(task["replica"], 0, bars[task["replica"]].total)
+
+    with Manager() as manager:
+        progress_queue = manager.Queue()
+        stop_event = manager.Event()
+        # forkserver: the launcher starts from a process without threads, that already imported this module
+        context = get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        launcher = ProcessPoolExecutor(max_workers=1, mp_context=context)
+        try:
+            future = launcher.submit(_launch_replicas, tasks, n_workers, progress_queue, stop_event)
+            while not wait([future], timeout=0.5).done:
+                if cancel_event is not None and cancel_event.is_set():
+                    stop_event.set()
+                _drain_progress(progress_queue, bars, progress_callback)
+            _drain_progress(progress_queue, bars, progress_callback)
+            shard_paths = future.result()
+        except BaseException:
+            # the launcher kills its replicas before returning
+            stop_event.set()
+            raise
+        finally:
+            launcher.shutdown(wait=True)
+            for bar in bars.values():
+                bar.close()
+
+    return shard_paths
+
+
+def _launch_replicas(
+    tasks: list[dict],
+    n_workers: int,
+    progress_queue,
+    stop_event,
+    replica: Callable[[dict, object], str] = run_replica,
+) -> list[str]:
+    """
+    Runs the replicas of the ensemble in worker processes forked from this one, at most `n_workers` at a time.
+    Meant to be executed in the launcher process.
+
+    Every replica runs in its own process: `mobility.Dynamics` moves the network it is built on, so a process
+    running a second replica would get the moved network back from the cache. Forking one process per replica
+    gives each one an untouched copy of the network prepared here.
+
+    If a replica fails (exception or crashed process), the running ones are killed and a RuntimeError is raised.
+
+    Args:
+        tasks: The replica parameters, one dict per replica (see `run_replica`)
+        n_workers: The number of worker processes
+        progress_queue: The queue where the replicas put their progress reports
+        stop_event: The event set by `run_ensemble` to kill the replicas
+        replica: The function running a replica (default: `run_replica`)
+    Returns:
+        The paths to the database shards, in the same order as tasks.
+    """
+    # prepare the networks and load the demand once: the workers inherit them
+    for task in tasks:
+        get_prepared_network(task["edges_filepath"], task["nodes_filepath"], task["scenario"])
+        get_hourly_od(task["input_folder"], task["smoothing_hours"], task["norm_weights"])
+
+    # fork: this process runs no other thread
+    context = get_context("fork")
+    shard_paths = [None] * len(tasks)
+    queued = deque(range(len(tasks)))
+    running = {}  # process sentinel -> (task index, process, result pipe)
+    try:
+        while queued or running:
+            while queued and len(running) < n_workers:
+                k = queued.popleft()
+                reader, writer = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=_run_replica_process, args=(replica, tasks[k], progress_queue, writer), daemon=True
+                )
+                process.start()
+                writer.close()
+                running[process.sentinel] = (k, process, reader)
+
+            ready = connection.wait(list(running), timeout=0.5)
+            if stop_event.is_set():
+                raise CancelledError("The simulation was cancelled")
+            for sentinel in ready:
+                k, process, reader = running.pop(sentinel)
+                # the result is sent before the process exits
+                status, result = reader.recv() if reader.poll() else ("crashed", f"exit code {process.exitcode}")
+                reader.close()
+                process.join()
+                if status != "done":
+                    task = tasks[k]
+                    raise RuntimeError(f"Replica {task['replica']} (seed {task['seed']}) failed: {result}")
+                shard_paths[k] = result
+    except BaseException:
+        for _, process, _ in running.values():
+            process.terminate()
+        for _, process, _ in running.values():
+            process.join()
+        raise
+    return shard_paths
+
+
+def _run_replica_process(replica: Callable[[dict, object], str], task: dict, progress_queue, result_pipe) -> None:
+    """
+    Runs a replica and sends ("done", shard path) or ("failed", error) to the launcher. Target of the replica processes.
+    """
+    try:
+        result = ("done", replica(task, progress_queue))
+    except Exception as e:
+        result = ("failed", repr(e))
+    result_pipe.send(result)
+    result_pipe.close()
+
+
+def merge_shards(shard_paths: list[str], db_path: str) -> None:
+    """
+    Merges the per-replica database shards into a single database.
+
+    Colliding simulation ids are remapped so that they stay unique across shards, and every table with a
+    `simulation_id` column follows the remapping. Tables without it (e.g. `edges`) are the same in every shard, so they are copied once.
+
+    Args:
+        shard_paths: The paths to the shard databases
+        db_path: The path to the merged database
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        # the merged database is rebuilt from the shards if the merge fails: skip the fsyncs and the journal file
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        for shard_path in shard_paths:
+            conn.execute("ATTACH DATABASE ? AS shard", (shard_path,))
+            with conn:
+                _merge_shard(conn)
+            conn.execute("DETACH DATABASE shard")
+    finally:
+        conn.close()
+
+
+def _merge_shard(conn: sqlite3.Connection) -> None:
+    """
+    Copies the attached `shard` database into the main one.
+    """
+    tables = conn.execute(
+        "SELECT name, sql FROM shard.sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall()
+    main_tables = {row[0] for row in conn.execute("SELECT name FROM main.sqlite_master WHERE type='table'")}
+
+    # create the missing tables (and their indexes) with the same schema as the shard
+    for name, sql in tables:
+        if name not in main_tables:
+            conn.execute(sql)
+            for (index_sql,) in conn.execute(
+                "SELECT sql FROM shard.sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", (name,)
+            ).fetchall():
+                conn.execute(index_sql)
+
+    # dsf ids simulations by their start time (YYYYMMDDHHMMSS), so replicas started in the same second collide:
+    # keep the shard ids when they are free, move the colliding ones after the largest merged id
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS sim_id_map (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+    conn.execute("DELETE FROM temp.sim_id_map")
+    if "simulations" in {name for name, _ in tables}:
+        taken = {row[0] for row in conn.execute("SELECT id FROM main.simulations")}
+        next_id = max(taken, default=0) + 1
+        for (old_id,) in conn.execute("SELECT id FROM shard.simulations").fetchall():
+            new_id = old_id
+            if old_id in taken:
+                new_id, next_id = next_id, next_id + 1
+            taken.add(new_id)
+            next_id = max(next_id, new_id + 1)
+            conn.execute("INSERT INTO temp.sim_id_map (old, new) VALUES (?, ?)", (old_id, new_id))
+
+    for name, _ in tables:
+        columns = [row[1] for row in conn.execute(f'PRAGMA shard.table_info("{name}")')]
+        if name == "simulations":
+            select = ", ".join("m.new" if c == "id" else f's."{c}"' for c in columns)
+            join = 'JOIN temp.sim_id_map AS m ON m.old = s."id"'
+        elif "simulation_id" in columns:
+            # row ids are surrogate keys: let the main table assign new ones
+            columns = [c for c in columns if c != "id"]
+            select = ", ".join("m.new" if c == "simulation_id" else f's."{c}"' for c in columns)
+            join = 'JOIN temp.sim_id_map AS m ON m.old = s."simulation_id"'
+        else:
+            if name in main_tables and conn.execute(f'SELECT 1 FROM main."{name}" LIMIT 1').fetchone():
+                continue
+            select = ", ".join(f's."{c}"' for c in columns)
+            join = ""
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        conn.execute(f'INSERT INTO main."{name}" ({column_list}) SELECT {select} FROM shard."{name}" AS s {join}')
+
+
+def remove_shards(shard_paths: list[str]) -> None:
+    """
+    Removes the database shards once they have been merged.
+    """
+    for shard_path in shard_paths:
+        for path in (shard_path, f"{shard_path}-wal", f"{shard_path}-shm", f"{shard_path}-journal"):
+            if os.path.exists(path):
+                os.remove(path)
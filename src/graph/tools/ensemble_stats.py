@@ -0,0 +1,161 @@
+"""
+Reduction of the ensemble: statistics of each street at each timestamp across the replicas of a simulation.
+
+`road_data` is read once, in windows of consecutive timestamps: the values of every replica in a window are
+stacked in a (replica, timestamp, street, column) array and reduced with NumPy, so memory is bounded by the
+window and not by the length of the simulation.
+
+The statistics are written to the `ensemble_stats` table, and their means as the `road_data` of a synthetic
+simulation named `ENSEMBLE_NAME`, which the webapp displays as any other simulation.
+"""
+
+import numpy as np
+import sqlite3
+import warnings
+
+ENSEMBLE_NAME = "ensemble"
+ENSEMBLE_COLUMNS = ["density_vpk", "avg_speed_kph", "counts"]  # road_data columns reduced across the replicas
+QUANTILES = [0.1, 0.5, 0.9]
+WINDOW_FRAMES = 16  # timestamps reduced at a time
+
+
+def reduce_ensemble(
+    conn: sqlite3.Connection,
+    window_frames: int = WINDOW_FRAMES,
+    quantiles: list[float] = QUANTILES,
+) -> int | None:
+    """
+    Computes the mean, standard deviation and quantiles across the replicas of the density, speed and counts
+    of each street at each timestamp.
+
+    Writes them to the `ensemble_stats` table, and writes their means as the synthetic ensemble simulation.
+    Both are rewritten from scratch, so the reduction can run again on the same database.
+
+    Args:
+        conn: The connection to the simulation database
+        window_frames: The number of timestamps reduced at a time
+        quantiles: The quantiles to compute, between 0 and 1
+    Returns:
+        The id of the ensemble simulation, or None if there are less than two replicas.
+    """
+    # drop the results of a previous reduction
+    for (old_id,) in conn.execute("SELECT id FROM simulations WHERE name = ?", (ENSEMBLE_NAME,)).fetchall():
+        conn.execute("DELETE FROM road_data WHERE simulation_id = ?", (old_id,))
+        conn.execute("DELETE FROM simulations WHERE id = ?", (old_id,))
+
+    replicas = [sim_id for (sim_id,) in conn.execute("SELECT id FROM simulations ORDER BY id")]
+    street_ids = np.array([street_id for (street_id,) in conn.execute("SELECT id FROM edges ORDER BY id")], dtype=np.int64)
+    # dsf numbers its saves by time step (NOT NULL in its schema): the ensemble takes the one of the replicas
+    has_time_step = "time_step" in {row[1] for row in conn.execute("PRAGMA table_info(road_data)")}
+    time_steps = dict(
+        conn.execute(f"SELECT datetime, {'MIN(time_step)' if has_time_step else 'NULL'} FROM road_data GROUP BY datetime")
+    )
+    timestamps = sorted(time_steps)
+
+    stats_columns = [f"mean_{c}" for c in ENSEMBLE_COLUMNS] + [f"std_{c}" for c in ENSEMBLE_COLUMNS]
+    stats_columns += [f"q{round(100 * q)}_{c}" for q in quantiles for c in ENSEMBLE_COLUMNS]
+    conn.execute("DROP TABLE IF EXISTS ensemble_stats")
+    conn.execute(
+        f"""
+        CREATE TABLE ensemble_stats (
+            datetime TEXT NOT NULL,
+            street_id INTEGER NOT NULL,
+            n_replicas INTEGER NOT NULL,
+            {", ".join(f"{column} REAL" for column in stats_columns)},
+            PRIMARY KEY (datetime, street_id)
+        )
+        """
+    )
+    insert_stats = (
+        f"INSERT INTO ensemble_stats (datetime, street_id, n_replicas, {', '.join(stats_columns)}) "
+        f"VALUES ({', '.join('?' * (len(stats_columns) + 3))})"
+    )
+
+    ensemble_id = _add_ensemble_simulation(conn, replicas) if len(replicas) >= 2 else None
+    mean_columns = ["simulation_id", "datetime", *(["time_step"] if has_time_step else []), "street_id", *ENSEMBLE_COLUMNS]
+    insert_means = f"INSERT INTO road_data ({', '.join(mean_columns)}) VALUES ({', '.join('?' * len(mean_columns))})"
+
+    print(f">>> Reducing {len(replicas)} replicas over {len(timestamps)} timestamps...")
+    for start in range(0, len(timestamps), window_frames):
+        window = timestamps[start:start + window_frames]
+        values, present = _read_window(conn, replicas, window, street_ids)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # streets without data in some (or all) replicas
+            mean = np.nanmean(values, axis=0)
+            std = np.nanstd(values, axis=0, ddof=1)
+            quantile_values = np.nanquantile(values, quantiles, axis=0)
+
+        # one row per street with data in at least one replica
+        frames, streets = np.nonzero(present.any(axis=0))
+        if not len(frames):
+            continue
+        datetimes = [window[frame] for frame in frames]
+        ids = street_ids[streets].tolist()
+        stats = np.concatenate(
+            [mean[frames, streets], std[frames, streets]] + [q[frames, streets] for q in quantile_values], axis=1
+        )
+        stats = np.where(np.isnan(stats), None, stats)
+        n_replicas = present.sum(axis=0)[frames, streets].tolist()
+        conn.executemany(insert_stats, [(d, i, n, *row) for d, i, n, row in zip(datetimes, ids, n_replicas, stats.tolist())])
+        if ensemble_id is not None:
+            means = np.where(np.isnan(mean[frames, streets]), None, mean[frames, streets]).tolist()
+            conn.executemany(
+                insert_means,
+                [
+                    (ensemble_id, d, *([time_steps[d]] if has_time_step else []), i, *row)
+                    for d, i, row in zip(datetimes, ids, means)
+                ],
+            )
+
+    return ensemble_id
+
+
+def _read_window(
+    conn: sqlite3.Connection, replicas: list[int], window: list[str], street_ids: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the road_data of every replica in a window of timestamps.
+
+    Returns:
+        The values, as a (replica, timestamp, street, column) array, NaN where missing,
+        and whether each replica has data for each (timestamp, street), as a (replica, timestamp, street) array.
+    """
+    frame_of = {timestamp: k for k, timestamp in enumerate(window)}
+    values = np.full((len(replicas), len(window), len(street_ids), len(ENSEMBLE_COLUMNS)), np.nan)
+    present = np.zeros(values.shape[:3], dtype=bool)
+    for replica, sim_id in enumerate(replicas):
+        rows = conn.execute(
+            f"SELECT datetime, street_id, {', '.join(ENSEMBLE_COLUMNS)} FROM road_data "
+            "WHERE simulation_id = ? AND datetime BETWEEN ? AND ?",
+            (sim_id, window[0], window[-1]),
+        ).fetchall()
+        if not rows or not len(street_ids):
+            continue
+        frames = np.array([frame_of[row[0]] for row in rows])
+        ids = np.array([row[1] for row in rows], dtype=np.int64)
+        streets = np.minimum(np.searchsorted(street_ids, ids), len(street_ids) - 1)
+        known = street_ids[streets] == ids
+        row_values = np.array([row[2:] for row in rows], dtype=np.float64)  # NULLs become NaN
+        values[replica, frames[known], streets[known]] = row_values[known]
+        present[replica, frames[known], streets[known]] = True
+    return values, present
+
+
+def _add_ensemble_simulation(conn: sqlite3.Connection, replicas: list[int]) -> int:
+    """
+    Adds the synthetic ensemble simulation, copying the parameters of the first replica.
+
+    Returns:
+        The id of the ensemble simulation, after the largest replica id.
+    """
+    ensemble_id = max(replicas) + 1
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(simulations)")]
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    select = ", ".join("?" if c in ("id", "name") else f'"{c}"' for c in columns)
+    params = [ensemble_id if c == "id" else ENSEMBLE_NAME for c in columns if c in ("id", "name")]
+    conn.execute(
+        f"INSERT INTO simulations ({column_list}) SELECT {select} FROM simulations WHERE id = ?",
+        (*params, replicas[0]),
+    )
+    return ensemble_id
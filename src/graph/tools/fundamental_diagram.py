@@ -0,0 +1,65 @@
+"""
+Fundamental diagram of a simulation: the flow of the streets as a function of their density.
+
+Every (street, timestamp) row of `road_data` is an observation, whose flow is its density times its average
+speed. Observations are binned by density and reduced with `np.bincount`, in a single pass over the arrays.
+"""
+
+from contextlib import closing
+import numpy as np
+import pandas as pd
+import sqlite3
+
+N_BINS = 50
+MAX_DENSITY = 200  # vehicles per km, upper edge of the last bin (denser observations are clipped into it)
+
+
+def fundamental_diagram(
+    db_path: str,
+    simulation_id: int | None = None,
+    n_bins: int = N_BINS,
+    max_density: float = MAX_DENSITY,
+) -> pd.DataFrame:
+    """
+    Computes the fundamental diagram (density vs flow) of a simulation from its road_data.
+
+    Args:
+        db_path: The path to the simulation database
+        simulation_id: The id of the simulation. Defaults to the last simulation of the database
+        n_bins: The number of density bins
+        max_density: The upper edge of the last density bin, in vehicles per km
+    Returns:
+        A DataFrame with one row per density bin with observations: the bin center `density_vpk`,
+        the `mean_flow_vph` and `std_flow_vph` of its observations in vehicles per hour,
+        their `mean_speed_kph` and their number `n_observations`.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        if simulation_id is None:
+            (simulation_id,) = conn.execute("SELECT MAX(id) FROM simulations").fetchone()
+        rows = conn.execute(
+            "SELECT density_vpk, avg_speed_kph FROM road_data "
+            "WHERE simulation_id = ? AND density_vpk IS NOT NULL AND avg_speed_kph IS NOT NULL",
+            (simulation_id,),
+        ).fetchall()
+
+    values = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    density, speed = values[:, 0], values[:, 1]
+    flow = density * speed
+
+    bin_width = max_density / n_bins
+    bins = np.clip((density / bin_width).astype(np.int64), 0, n_bins - 1)
+    n_observations = np.bincount(bins, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_flow = np.bincount(bins, flow, n_bins) / n_observations
+        mean_square_flow = np.bincount(bins, flow * flow, n_bins) / n_observations
+        mean_speed = np.bincount(bins, speed, n_bins) / n_observations
+    std_flow = np.sqrt(np.maximum(mean_square_flow - mean_flow**2, 0))
+
+    observed = n_observations > 0
+    return pd.DataFrame({
+        "density_vpk": ((np.arange(n_bins) + 0.5) * bin_width)[observed],
+        "mean_flow_vph": mean_flow[observed],
+        "std_flow_vph": std_flow[observed],
+        "mean_speed_kph": mean_speed[observed],
+        "n_observations": n_observations[observed],
+    })
@@ -0,0 +1,176 @@
+"""
+Agent tools to run simulations in the background: submit a job, poll its status and fetch its results.
+"""
+
+from langchain.tools import tool, ToolRuntime
+from langgraph.types import Command
+from langchain_core.messages import ToolMessage
+from typing import Annotated
+from .jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED
+from .scenario import describe_scenario
+from .simulation_tools import simulate_ensemble, _open_visualization, N_WORKERS
+import threading
+import os
+
+JOBS_DB = os.getenv("DSF_JOBS_DB", "./jobs.db")  # persistent queue of the simulation jobs
+MAX_JOBS = int(os.getenv("DSF_MAX_JOBS", 2))  # jobs running at the same time, sharing the worker processes
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Returns the job queue of this process, creating it and starting its workers on the first call.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(JOBS_DB, _run_job, MAX_JOBS)
+            _job_queue.start()
+    return _job_queue
+
+
+def _run_job(**params) -> tuple[str, bool]:
+    """
+    Runs a simulation job: the worker processes are split among the jobs running at the same time.
+    """
+    return simulate_ensemble(**params, n_workers=max(1, N_WORKERS // MAX_JOBS), visualize=False)
+
+
+def _describe(job: dict) -> str:
+    """
+    Returns a one-line description of a job for the agent.
+    """
+    params = ", ".join(
+        f"{name}={value}" for name, value in job["params"].items() if name not in ("edges_filepath", "nodes_filepath", "scenario")
+    )
+    params += f", edits: {describe_scenario(job['params'].get('scenario'))}"
+    description = f"Job {job['id']} ({params}): {job['status']}"
+    if job["status"] == QUEUED:
+        description += f", {get_job_queue().queue_position(job['id'])} jobs ahead in the queue"
+    elif job["status"] == RUNNING:
+        description += f", {job['progress']:.0f}% done"
+    elif job["status"] == DONE:
+        description += f", results in {job['output_dir']}"
+    elif job["status"] == FAILED:
+        description += f": {job['error']}"
+    return description
+
+
+@tool
+def submit_simulation(
+    runtime : ToolRuntime,
+    dt_agent : Annotated[int, "Time interval for agent spawning"] = 10,
+    duration : Annotated[int, "Duration of the simulation, in seconds"] = 60 * 60,
+    day : Annotated[str, "The day of the simulation in the format YYYY-MM-DD"] = '2022-01-31',
+    start_hour: Annotated[int, "The hour of the day to start the simulation at, as an integer between 0 and 23"] = 0,
+    include_tram: Annotated[bool, "Whether to include trams in the simulation"] = False,
+    seed: Annotated[int, "Seed of the ensemble of simulations. Change it only to get a new, independent ensemble"] = 42,
+    warmup_hours: Annotated[int, "Hours simulated before start_hour to fill the network, without saving results. Every replica simulates them: they take as long as saved hours"] = 0,
+)-> Command:
+    """
+    Use this tool to run the mobility simulation in the background, without waiting for its results.
+
+    Args:
+        dt_agent: Time interval for agent spawning. Defaults to 10 seconds
+        duration: Duration of the simulation, in seconds. Defaults to 1 hour
+        day: The day of the simulation in the format YYYY-MM-DD. Default: 2022-01-31
+        start_hour: The hour of the day to start the simulation at, as an integer between 0 and 23. Defaults to 0.
+        include_tram: Wether to consider the new tram line or not in the simulaiton. Defaults to False
+        seed: Seed of the ensemble, from which the seeds of the replicas are drawn. Defaults to 42.
+        warmup_hours: Hours simulated before `start_hour` to fill the network with traffic, whose results are not saved.
+            Every replica simulates them, so they add to the running time as much as saved hours do.
+            Defaults to 0 (the simulation starts from an empty network).
+    Returns:
+        The id of the simulation job, to poll with `simulation_status` and `simulation_result`.
+    """
+    params = {
+        "dt_agent": dt_agent,
+        "duration": duration,
+        "day": day,
+        "start_hour": start_hour,
+        "include_tram": include_tram,
+        "seed": seed,
+        "warmup_hours": warmup_hours,
+        "edges_filepath": runtime.state["edges_filepath"],
+        "nodes_filepath": runtime.state["nodes_filepath"],
+        "scenario": runtime.state.get("scenario"),
+    }
+    job_queue = get_job_queue()
+    job_id = job_queue.submit(params)
+    print(f">>> Submitted simulation job {job_id}")
+
+    message = f"Simulation job {job_id} submitted, {job_queue.queue_position(job_id)} jobs ahead in the queue."
+    return Command(update={"messages": [ToolMessage(message, tool_call_id=runtime.tool_call_id)]})
+
+
+@tool
+def simulation_status(
+    runtime : ToolRuntime,
+    job_id: Annotated[int | None, "The id of the simulation job. If not given, the most recent jobs are listed"] = None,
+)-> Command:
+    """
+    Use this tool to get the status and progress of the simulation jobs submitted with `submit_simulation`.
+
+    Args:
+        job_id: The id of the simulation job. If not given, the most recent jobs are listed.
+    Returns:
+        The status of the job (queued, running, done, failed or cancelled), with its progress or results.
+    """
+    job_queue = get_job_queue()
+    if job_id is None:
+        jobs = job_queue.list()
+        message = "\n".join(_describe(job) for job in jobs) if jobs else "No simulation jobs submitted."
+    else:
+        job = job_queue.get(job_id)
+        message = _describe(job) if job is not None else f"No simulation job with id {job_id}"
+    return Command(update={"messages": [ToolMessage(message, tool_call_id=runtime.tool_call_id)]})
+
+
+@tool
+def simulation_result(
+    runtime : ToolRuntime,
+    job_id: Annotated[int, "The id of the simulation job"],
+)-> Command:
+    """
+    Use this tool to get the results of a completed simulation job, and open their visualization.
+
+    Args:
+        job_id: The id of the simulation job.
+    Returns:
+        The path to the output directory containing the simulation results, or the status of the job if not completed.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None or job["status"] != DONE:
+        tool_err = f"No simulation job with id {job_id}" if job is None else f"Results not available. {_describe(job)}"
+        return Command(update={"messages": [ToolMessage(tool_err, tool_call_id=runtime.tool_call_id)]})
+
+    _open_visualization(job["output_dir"])
+
+    return Command(
+        update={
+            "messages": [ToolMessage(f"Results of job {job_id} are in {job['output_dir']} directory. Visualization opened in browser.", tool_call_id=runtime.tool_call_id)],
+            "output_dir" : job["output_dir"] # save the output directory in state
+        }
+    )
+
+
+@tool
+def cancel_simulation(
+    runtime : ToolRuntime,
+    job_id: Annotated[int, "The id of the simulation job"],
+)-> Command:
+    """
+    Use this tool to cancel a queued or running simulation job.
+
+    Args:
+        job_id: The id of the simulation job.
+    Returns:
+        A message indicating whether the job has been cancelled.
+    """
+    if get_job_queue().cancel(job_id):
+        message = f"Simulation job {job_id} cancelled."
+    else:
+        message = f"Simulation job {job_id} is not queued nor running: nothing to cancel."
+    return Command(update={"messages": [ToolMessage(message, tool_call_id=runtime.tool_call_id)]})
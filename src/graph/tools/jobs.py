@@ -0,0 +1,262 @@
+"""
+Background queue of simulation jobs.
+
+Jobs are persisted in a SQLite database, so the queue survives restarts of the agent, and are run by a bounded
+pool of worker threads, each running one ensemble at a time (the replicas of the ensemble run in worker processes).
+The agent submits jobs and polls them with the tools in `job_tools`, while the conversation goes on.
+
+Job states: queued -> running -> done | failed | cancelled.
+Running jobs record the pid of the process running them: a job whose process died is queued again by the next
+queue opened on the database, while the jobs of the processes still alive are left to them.
+"""
+
+from concurrent.futures import CancelledError
+from contextlib import closing
+from datetime import datetime
+from typing import Callable
+import json
+import os
+import sqlite3
+import threading
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    output_dir TEXT,
+    cached INTEGER,
+    error TEXT,
+    owner_pid INTEGER,
+    submitted TEXT NOT NULL,
+    started TEXT,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class JobQueue:
+    """
+    Persistent queue of simulation jobs, run by a bounded pool of worker threads.
+
+    Args:
+        db_path: The path to the SQLite database of the queue
+        run_job: The function running a job, called with the job parameters as keyword arguments and
+            `progress_callback` and `cancel_event`. It returns a tuple with the output directory and whether
+            the result was cached, raises CancelledError when cancelled and any other exception on failure.
+        max_jobs: The number of jobs running at the same time
+    """
+
+    def __init__(self, db_path: str, run_job: Callable[..., tuple[str, bool]], max_jobs: int = 1):
+        self.db_path = db_path
+        self.run_job = run_job
+        self.max_jobs = max(1, max_jobs)
+        self._cancel_events = {}  # job id -> cancel event of the running jobs
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._workers = []
+
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+            if "owner_pid" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+            # jobs running when their process died are run again (identical runs are cached anyway)
+            orphans = [
+                row["id"]
+                for row in conn.execute("SELECT id, owner_pid FROM jobs WHERE status=?", (RUNNING,))
+                if row["owner_pid"] is None or not _process_alive(row["owner_pid"])
+            ]
+            conn.executemany(
+                "UPDATE jobs SET status=?, progress=0, started=NULL, owner_pid=NULL WHERE id=? AND status=?",
+                [(QUEUED, job_id, RUNNING) for job_id in orphans],
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start(self) -> None:
+        """
+        Starts the worker threads, if not started yet.
+        """
+        with self._lock:
+            while len(self._workers) < self.max_jobs:
+                worker = threading.Thread(target=self._work, name=f"simulation-job-worker-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, params: dict) -> int:
+        """
+        Queues a job.
+
+        Args:
+            params: The keyword arguments of the job (JSON serializable)
+        Returns:
+            The id of the job.
+        """
+        with closing(self._connect()) as conn, conn:
+            job_id = conn.execute(
+                "INSERT INTO jobs (params, status, submitted) VALUES (?, ?, ?)",
+                (json.dumps(params), QUEUED, datetime.now().isoformat()),
+            ).lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: int) -> dict | None:
+        """
+        Returns the job with the given id as a dict, or None if there is no such job.
+        """
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return _job_dict(row) if row is not None else None
+
+    def list(self, limit: int = 20) -> list[dict]:
+        """
+        Returns the most recent jobs, newest first.
+        """
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [_job_dict(row) for row in rows]
+
+    def queue_position(self, job_id: int) -> int:
+        """
+        Returns the number of queued jobs that will start before the given one.
+        """
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE status=? AND id<?", (QUEUED, job_id)).fetchone()[0]
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancels a queued or running job.
+
+        Returns:
+            Whether the job was still queued or running.
+        """
+        # under the lock, so that the job is not claimed by a worker in the meantime
+        with self._lock:
+            with closing(self._connect()) as conn, conn:
+                cancelled = conn.execute(
+                    "UPDATE jobs SET status=?, finished=? WHERE id=? AND status=?",
+                    (CANCELLED, datetime.now().isoformat(), job_id, QUEUED),
+                ).rowcount
+            cancel_event = self._cancel_events.get(job_id)
+        if cancelled:
+            return True
+        if cancel_event is None:
+            return False
+        cancel_event.set()  # the worker marks the job as cancelled once the ensemble is stopped
+        return True
+
+    def _claim(self) -> tuple[dict, threading.Event] | None:
+        """
+        Marks the oldest queued job as running and returns it with its cancel event, or returns None if the queue is empty.
+        """
+        with self._lock:
+            job = self._claim_next()
+            if job is None:
+                return None
+            cancel_event = threading.Event()
+            self._cancel_events[job["id"]] = cancel_event
+        return job, cancel_event
+
+    def _claim_next(self) -> dict | None:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT * FROM jobs WHERE status=? ORDER BY id LIMIT 1", (QUEUED,)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status=?, started=?, owner_pid=? WHERE id=?",
+                    (RUNNING, datetime.now().isoformat(), os.getpid(), row["id"]),
+                )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return _job_dict(row) if row is not None else None
+
+    def _finish(self, job_id: int, status: str, **fields) -> None:
+        fields.update(status=status, finished=datetime.now().isoformat())
+        assignments = ", ".join(f"{name}=?" for name in fields)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id=?", (*fields.values(), job_id))
+
+    def _progress_callback(self, job_id: int) -> Callable[[int, int, int], None]:
+        """
+        Returns a progress callback saving the mean progress of the replicas of a job, by steps of 1%.
+        """
+        replicas = {}
+        last_saved = [0]
+
+        def progress_callback(replica: int, done: int, total: int) -> None:
+            replicas[replica] = done / total if total else 1.0
+            progress = round(100 * sum(replicas.values()) / max(len(replicas), 1))
+            if progress > last_saved[0]:
+                last_saved[0] = progress
+                with closing(self._connect()) as conn, conn:
+                    conn.execute("UPDATE jobs SET progress=? WHERE id=?", (progress, job_id))
+
+        return progress_callback
+
+    def _work(self) -> None:
+        """
+        Loop of a worker thread: runs the queued jobs one at a time.
+        """
+        while True:
+            claimed = self._claim()
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=5)  # also polls the database, for jobs submitted by other processes
+                continue
+
+            job, cancel_event = claimed
+            print(f">>> Starting simulation job {job['id']}...")
+            try:
+                output_dir, cached = self.run_job(
+                    **job["params"],
+                    progress_callback=self._progress_callback(job["id"]),
+                    cancel_event=cancel_event,
+                )
+            except CancelledError:
+                self._finish(job["id"], CANCELLED)
+                print(f">>> Simulation job {job['id']} cancelled")
+            except Exception as e:
+                self._finish(job["id"], FAILED, error=str(e))
+                print(f"ERROR: simulation job {job['id']} failed: {e}")
+            else:
+                self._finish(job["id"], DONE, progress=100, output_dir=output_dir, cached=int(cached))
+                print(f">>> Simulation job {job['id']} completed, results in {output_dir}")
+            finally:
+                with self._lock:
+                    self._cancel_events.pop(job["id"], None)
+
+
+def _process_alive(pid: int) -> bool:
+    """
+    Returns whether a process with the given pid is running.
+    """
+    try:
+        os.kill(pid, 0)  # checks the process without signalling it
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running, as another user
+        return True
+    return True
+
+
+def _job_dict(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    if job["cached"] is not None:
+        job["cached"] = bool(job["cached"])
+    return job
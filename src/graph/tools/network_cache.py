@@ -0,0 +1,99 @@
+"""
+Cache of prepared road networks.
+
+Importing the edges and node properties, applying the scenario edits and preparing the network (lanes, priorities,
+traffic lights) is identical for every replica of a scenario, so it is done once per scenario and process.
+Edits are applied in memory, so the base input files are shared by every scenario. Every replica runs in a process
+forked by the launcher of the ensemble, which inherits the network it prepared: each gets its own copy of it for free.
+At most `MAX_PREPARED_NETWORKS` networks are kept (env DSF_NETWORK_CACHE_SIZE), the least recently used is dropped first.
+"""
+
+from .utils import file_hash
+from .network_store import as_csv
+from .scenario import Scenario, apply_scenario, scenario_hash, describe_scenario
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+import hashlib
+import json
+import os
+
+if TYPE_CHECKING:  # dsf is imported where the simulator runs, so that the rest of the module works without it
+    from dsf import mobility
+
+MAX_PREPARED_NETWORKS = int(os.getenv("DSF_NETWORK_CACHE_SIZE", 4))  # prepared networks kept per process
+
+_PREPARED_NETWORKS = OrderedDict()  # network key -> prepared mobility.RoadNetwork, least recently used first
+
+
+def network_key(edges_filepath: str, nodes_filepath: str, scenario: Scenario | None) -> str:
+    """
+    Returns the key identifying a prepared network: the hash of the input files contents and of the scenario edits.
+
+    Args:
+        edges_filepath: The path to the edges file
+        nodes_filepath: The path to the node properties file
+        scenario: The edits applied to the network
+    Returns:
+        The key of the prepared network.
+    """
+    content = {
+        "edges": file_hash(edges_filepath),
+        "nodes": file_hash(nodes_filepath),
+        "scenario": scenario_hash(scenario),
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def get_prepared_network(edges_filepath: str, nodes_filepath: str, scenario: Scenario | None = None) -> "mobility.RoadNetwork":
+    """
+    Returns the prepared road network for the given scenario, building it only if it is not cached yet.
+
+    NOTE: the returned network is shared, and `mobility.Dynamics` moves the network it is built on:
+    build the dynamics only in a process forked for a single replica (see `ensemble._launch_replicas`), so that
+    the cached copy is never emptied, neither in this process nor for a later replica.
+
+    Args:
+        edges_filepath: The path to the edges file
+        nodes_filepath: The path to the node properties file
+        scenario: The edits to apply to the network (see `scenario`)
+    Returns:
+        The prepared road network.
+    """
+    key = network_key(edges_filepath, nodes_filepath, scenario)
+    if key in _PREPARED_NETWORKS:
+        _PREPARED_NETWORKS.move_to_end(key)
+    else:
+        print(f">>> Preparing road network from {edges_filepath} (edits: {describe_scenario(scenario)})...")
+        _PREPARED_NETWORKS[key] = _prepare_network(edges_filepath, nodes_filepath, scenario)
+        while len(_PREPARED_NETWORKS) > max(1, MAX_PREPARED_NETWORKS):
+            _PREPARED_NETWORKS.popitem(last=False)
+    return _PREPARED_NETWORKS[key]
+
+
+def _prepare_network(edges_filepath: str, nodes_filepath: str, scenario: Scenario | None = None) -> "mobility.RoadNetwork":
+    """
+    Imports the network and applies the scenario edits and the automatic preparation steps.
+    """
+    from dsf import mobility
+
+    rn = mobility.RoadNetwork()
+    # the simulator imports CSVs only: Arrow network files are converted (once)
+    rn.importEdges(as_csv(edges_filepath))
+    rn.importNodeProperties(as_csv(nodes_filepath))
+
+    # closures and lane changes of the scenario (e.g. the tram line), before the automatic preparation
+    apply_scenario(rn, scenario)
+
+    rn.adjustNodeCapacities()
+    rn.autoMapStreetLanes()
+    rn.autoAssignRoadPriorities()
+    rn.autoInitTrafficLights()
+
+    return rn
+
+
+def clear_network_cache() -> None:
+    """
+    Drops every prepared network of this process.
+    """
+    _PREPARED_NETWORKS.clear()
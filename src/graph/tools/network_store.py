@@ -0,0 +1,110 @@
+"""
+Columnar storage of the network files (edges and node properties).
+
+Network files can be stored as Arrow IPC (Feather v2) files instead of semicolon separated CSVs. They are smaller
+to parse, typed, and memory-mapped when read, so reading a few columns does not load the whole file.
+Geometries are kept as WKT strings, and the CSV written back keeps the types of the columns: integer columns
+with missing values (e.g. `nlanes`, `coilcode`) stay integers, so the simulator reads the same values.
+The CSV is not byte-identical to the original one: e.g. strings are quoted and `1e3` is written `1000`.
+
+`mobility.RoadNetwork` imports CSVs only: `as_csv` writes the CSV of an Arrow file when a simulation starts,
+once per version of the file.
+
+Convert the input files with:
+    python -m src.graph.tools.network_store updated_input/edges.csv updated_input/node_props.csv
+"""
+
+from .utils import file_hash
+from pathlib import Path
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import pandas as pd
+import argparse
+import os
+
+ARROW_SUFFIXES = (".arrow", ".feather")
+CSV_CACHE_FOLDER = "./.network_cache"  # CSVs written for the simulator
+
+
+def is_arrow(filepath: str) -> bool:
+    """
+    Returns whether the file is an Arrow IPC file, from its extension.
+    """
+    return Path(filepath).suffix in ARROW_SUFFIXES
+
+
+def network_file(folder: str, name: str) -> str:
+    """
+    Returns the path to a network file of the folder, preferring its Arrow version if there is one.
+
+    Args:
+        folder: The folder containing the network files
+        name: The name of the file, without extension (e.g. "edges")
+    Returns:
+        The path to `<name>.arrow` if it exists, otherwise to `<name>.csv`.
+    """
+    arrow_filepath = f"{folder}/{name}.arrow"
+    return arrow_filepath if os.path.exists(arrow_filepath) else f"{folder}/{name}.csv"
+
+
+def csv_to_arrow(csv_filepath: str, arrow_filepath: str | None = None) -> str:
+    """
+    Converts a semicolon separated network CSV to an Arrow IPC file.
+
+    The file is not compressed, so that it can be memory-mapped.
+
+    Args:
+        csv_filepath: The path to the CSV file
+        arrow_filepath: The path to the Arrow file. Defaults to the CSV path with the `.arrow` extension
+    Returns:
+        The path to the Arrow file.
+    """
+    arrow_filepath = arrow_filepath or str(Path(csv_filepath).with_suffix(".arrow"))
+    table = pa_csv.read_csv(csv_filepath, parse_options=pa_csv.ParseOptions(delimiter=";"))
+    feather.write_feather(table, arrow_filepath, compression="uncompressed")
+    return arrow_filepath
+
+
+def read_arrow(arrow_filepath: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Reads the given columns of an Arrow IPC file, memory-mapping it.
+    """
+    return feather.read_table(arrow_filepath, columns=columns, memory_map=True).to_pandas()
+
+
+def as_csv(filepath: str) -> str:
+    """
+    Returns the path to a semicolon separated CSV version of a network file, as expected by `mobility.RoadNetwork`.
+
+    CSV files are returned as they are. Arrow files are converted once per version of the file,
+    in CSV_CACHE_FOLDER.
+
+    Args:
+        filepath: The path to the network file (CSV or Arrow)
+    Returns:
+        The path to the CSV file.
+    """
+    if not is_arrow(filepath):
+        return filepath
+
+    csv_filepath = Path(CSV_CACHE_FOLDER) / f"{Path(filepath).stem}_{file_hash(filepath)[:16]}.csv"
+    if csv_filepath.exists():
+        return str(csv_filepath)
+
+    print(f">>> Writing {filepath} as CSV to {csv_filepath}...")
+    csv_filepath.parent.mkdir(parents=True, exist_ok=True)
+    # write then rename, so that concurrent simulations never read a partial file
+    # NOTE: written from the Arrow types, not through pandas, which turns integer columns with nulls into floats
+    tmp_filepath = csv_filepath.with_suffix(f".{os.getpid()}.tmp")
+    table = feather.read_table(filepath, memory_map=True)
+    pa_csv.write_csv(table, tmp_filepath, pa_csv.WriteOptions(delimiter=";", quoting_style="needed"))
+    os.replace(tmp_filepath, csv_filepath)
+    return str(csv_filepath)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert network CSV files to Arrow IPC files.")
+    parser.add_argument("csv_files", nargs="+", help="The semicolon separated CSV files to convert")
+    args = parser.parse_args()
+    for csv_file in args.csv_files:
+        print(f"{csv_file} -> {csv_to_arrow(csv_file)}")
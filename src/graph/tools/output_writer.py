@@ -0,0 +1,75 @@
+"""
+Configuration of the simulation output: how often the replicas save their data, and which tables.
+
+Every replica saves to its own database shard (see `ensemble`), so replicas never wait for each other's locks.
+Shards are written in WAL mode: commits append to the log instead of rewriting pages through the rollback journal,
+which saves most of the fsyncs of frequent saves. The journal mode is set by the queries the simulator runs when
+it connects, which replace the default ones of dsf (that always set WAL).
+
+The default configuration is read from the environment:
+    DSF_SAVE_INTERVAL: simulated seconds between two saves (default: 300)
+    DSF_SAVE_TABLES: comma separated tables to save, among OUTPUT_TABLES, at least one (default: all)
+    DSF_SAVE_WAL: whether to use WAL mode, 0 or 1 (default: 1)
+"""
+
+from typing import TYPE_CHECKING, TypedDict
+import os
+
+if TYPE_CHECKING:  # dsf is imported where the simulator runs, so that the rest of the module works without it
+    from dsf import mobility
+
+OUTPUT_TABLES = ("avg_stats", "road_data", "travel_data")  # in the order of the flags of `Dynamics.saveData`
+# the pragmas dsf runs by default when connecting, but the journal mode
+CONNECTION_PRAGMAS = ("busy_timeout = 5000", "synchronous = NORMAL", "temp_store = MEMORY", "cache_size = -20000")
+
+
+class OutputConfig(TypedDict):
+    interval: int  # simulated seconds between two saves
+    tables: list[str]  # tables to save, among OUTPUT_TABLES
+    wal: bool  # whether to write the shards in WAL mode
+
+
+def output_config(interval: int | None = None, tables: list[str] | None = None, wal: bool | None = None) -> OutputConfig:
+    """
+    Returns an output configuration, with the values from the environment for the missing arguments.
+
+    Raises:
+        ValueError: If the interval is not positive, no table is given or a table is unknown
+    """
+    if interval is None:
+        interval = int(os.getenv("DSF_SAVE_INTERVAL", 300))
+    if tables is None:
+        tables = [t.strip() for t in os.getenv("DSF_SAVE_TABLES", ",".join(OUTPUT_TABLES)).split(",") if t.strip()]
+    if wal is None:
+        wal = os.getenv("DSF_SAVE_WAL", "1") != "0"
+
+    if interval <= 0:
+        raise ValueError(f"The save interval must be positive, got {interval}")
+    if not tables:
+        # the simulator would never save, leaving the database without simulations to merge and postprocess
+        raise ValueError(f"At least one output table is required, among {list(OUTPUT_TABLES)}")
+    unknown = set(tables) - set(OUTPUT_TABLES)
+    if unknown:
+        raise ValueError(f"Unknown output tables {sorted(unknown)}, expected some of {list(OUTPUT_TABLES)}")
+    return {"interval": interval, "tables": [t for t in OUTPUT_TABLES if t in tables], "wal": wal}
+
+
+def connect_output(simulator: "mobility.Dynamics", db_path: str, config: OutputConfig) -> None:
+    """
+    Connects the simulator to its output database and schedules its saves.
+
+    Args:
+        simulator: The dynamics of the replica
+        db_path: The path to the database shard of the replica
+        config: The output configuration
+    """
+    simulator.connectDataBase(db_path, connection_queries(config["wal"]))
+    simulator.saveData(config["interval"], *(table in config["tables"] for table in OUTPUT_TABLES))
+
+
+def connection_queries(wal: bool) -> str:
+    """
+    Returns the queries the simulator runs when connecting to its database, with the given journal mode.
+    """
+    journal_mode = "WAL" if wal else "DELETE"
+    return "".join(f"PRAGMA {pragma};" for pragma in (f"journal_mode = {journal_mode}", *CONNECTION_PRAGMAS))
@@ -0,0 +1,69 @@
+"""
+Post-processing of the simulation output database, once the ensemble has been merged.
+
+Indexes `road_data` for the queries by simulation and time, and materializes the aggregates that the webapp and
+any analysis would otherwise compute with full scans of `road_data`:
+    - `global_stats`: the network-wide statistics of each simulation at each timestamp
+    - `ensemble_stats`: the mean, standard deviation and quantiles across the replicas of the statistics of each
+      street at each timestamp, whose means are also written as the synthetic "ensemble" simulation
+      (see `ensemble_stats`)
+"""
+
+from contextlib import closing
+from .ensemble_stats import reduce_ensemble
+import sqlite3
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS road_data_simulation_datetime ON road_data (simulation_id, datetime, street_id)",
+]
+
+
+def postprocess_database(db_path: str) -> None:
+    """
+    Indexes the simulation output database and writes its aggregate tables, then optimizes it.
+
+    Aggregate tables are rewritten from scratch, so the database can be post-processed again.
+
+    Args:
+        db_path: The path to the SQLite database of the simulation
+    """
+    print(f">>> Post-processing {db_path}...")
+    with closing(sqlite3.connect(db_path)) as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='road_data'").fetchone():
+            print(">>> No road_data in the database (see `output_writer`), nothing to aggregate")
+            return
+        with conn:
+            for index_sql in INDEXES:
+                conn.execute(index_sql)
+            # the ensemble simulation first, so that it has its global statistics too
+            reduce_ensemble(conn)
+            write_global_stats(conn)
+        conn.execute("ANALYZE")
+        conn.execute("VACUUM")
+
+
+def write_global_stats(conn: sqlite3.Connection) -> None:
+    """
+    Writes the `global_stats` table: mean density, mean speed and total counts of each simulation at each timestamp.
+    """
+    conn.execute("DROP TABLE IF EXISTS global_stats")
+    conn.execute(
+        """
+        CREATE TABLE global_stats (
+            simulation_id INTEGER NOT NULL,
+            datetime TEXT NOT NULL,
+            mean_density_vpk REAL,
+            mean_speed_kph REAL,
+            total_counts INTEGER,
+            PRIMARY KEY (simulation_id, datetime)
+        )
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO global_stats (simulation_id, datetime, mean_density_vpk, mean_speed_kph, total_counts)
+        SELECT simulation_id, datetime, AVG(density_vpk), AVG(avg_speed_kph), SUM(counts)
+        FROM road_data
+        GROUP BY simulation_id, datetime
+        """
+    )
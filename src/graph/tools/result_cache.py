@@ -0,0 +1,119 @@
+"""
+Content-addressed cache of simulation results.
+
+Every output directory written by `run_simulation` holds a manifest with the key of the run: the hash of its
+parameters, of its input files and of the replica seeds. Running again with the same key returns the existing
+output directory. Output directories are evicted least recently used first, by count and by size on disk.
+"""
+
+from .utils import file_hash
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import shutil
+
+MANIFEST = "run.json"
+
+
+def result_key(params: dict, input_files: list[str]) -> str:
+    """
+    Returns the key of a run.
+
+    Args:
+        params: The parameters of the run (JSON serializable), including the replica seeds
+        input_files: The paths to the input files of the run
+    Returns:
+        The hex digest identifying the run.
+    """
+    content = {
+        "params": params,
+        "inputs": {Path(f).name: file_hash(f) for f in input_files},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def _manifests(root: str = ".", prefix: str = "output") -> list[tuple[Path, dict]]:
+    """
+    Returns the (output directory, manifest) of every cached run.
+    """
+    manifests = []
+    for manifest_path in Path(root).glob(f"{prefix}_*/{MANIFEST}"):
+        try:
+            manifests.append((manifest_path.parent, json.loads(manifest_path.read_text())))
+        except (OSError, json.JSONDecodeError):
+            continue  # incomplete or corrupted run: not a cache entry
+    return manifests
+
+
+def lookup_result(key: str, root: str = ".", prefix: str = "output") -> str | None:
+    """
+    Returns the output directory of a completed run with the given key, if any, and marks it as recently used.
+
+    Args:
+        key: The key of the run, see `result_key`
+        root: The folder containing the output directories
+        prefix: The prefix of the output directories
+    Returns:
+        The path to the output directory, or None if the run is not cached.
+    """
+    for output_dir, manifest in _manifests(root, prefix):
+        if manifest.get("key") == key and (output_dir / "database.db").exists():
+            manifest["last_used"] = datetime.now().isoformat()
+            (output_dir / MANIFEST).write_text(json.dumps(manifest, indent=2))
+            return str(output_dir)
+    return None
+
+
+def store_result(output_dir: str, key: str, params: dict) -> None:
+    """
+    Writes the manifest of a completed run, making it available to `lookup_result`.
+
+    Args:
+        output_dir: The output directory of the run
+        key: The key of the run, see `result_key`
+        params: The parameters of the run, saved for reference
+    """
+    now = datetime.now().isoformat()
+    manifest = {"key": key, "params": params, "created": now, "last_used": now}
+    (Path(output_dir) / MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+
+def _dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def evict_results(
+    max_runs: int,
+    max_bytes: int,
+    keep: tuple[str, ...] = (),
+    root: str = ".",
+    prefix: str = "output",
+) -> list[str]:
+    """
+    Removes the least recently used runs until at most `max_runs` runs and `max_bytes` bytes are cached.
+
+    Args:
+        max_runs: The maximum number of cached runs
+        max_bytes: The maximum size on disk of the cached runs
+        keep: Output directories never to evict (e.g. the run just returned)
+        root: The folder containing the output directories
+        prefix: The prefix of the output directories
+    Returns:
+        The evicted output directories.
+    """
+    runs = sorted(_manifests(root, prefix), key=lambda run: run[1].get("last_used", ""))
+    sizes = {output_dir: _dir_size(output_dir) for output_dir, _ in runs}
+    total = sum(sizes.values())
+    keep = {Path(k).resolve() for k in keep}
+
+    evicted = []
+    for output_dir, _ in runs:
+        if len(runs) - len(evicted) <= max_runs and total <= max_bytes:
+            break
+        if output_dir.resolve() in keep:
+            continue
+        shutil.rmtree(output_dir, ignore_errors=True)
+        total -= sizes[output_dir]
+        evicted.append(str(output_dir))
+    return evicted
@@ -0,0 +1,133 @@
+"""
+Scenarios: the edits to the road network (closures and lane changes) on top of the base edges file.
+
+Edge tools do not rewrite the edges file: they add closures and lane changes to the scenario in the state
+(see `SimulationState.scenario`). The simulation tools apply the scenario directly to the road network after
+importing the base edges file (see `network_cache`), so editing the network never touches the disk.
+
+Streets are selected by the ids of their edges or, when no ids are given, by name (every street whose name
+contains the given one, as `RoadNetwork.setStreetStatusByName` does).
+"""
+
+from typing import TYPE_CHECKING, TypedDict
+import hashlib
+import json
+
+if TYPE_CHECKING:  # dsf is imported where the simulator runs, so that the rest of the module works without it
+    from dsf import mobility
+
+
+class Closure(TypedDict, total=False):
+    name: str  # street name
+    edge_ids: list[int]  # ids of the closed edges; if missing, every street matching the name is closed
+
+
+class LaneChange(TypedDict, total=False):
+    name: str  # street name
+    edge_ids: list[int]  # ids of the changed edges; if missing, every street matching the name is changed
+    nlanes: int  # new number of lanes
+    speed_factor: float | None  # optional factor applied to the max speed of the street
+
+
+class Scenario(TypedDict):
+    closures: list[Closure]
+    lane_changes: list[LaneChange]
+
+
+# Streets closed and narrowed by the new tram line
+TRAM_SCENARIO: Scenario = {
+    "closures": [
+        {"edge_ids": [6285]},  # Piece of via_serena
+        {"edge_ids": [5637]},
+        {"edge_ids": [4645]},
+        {"edge_ids": [1750]},
+    ],
+    "lane_changes": [
+        {"name": name, "nlanes": 1, "speed_factor": 0.5}
+        for name in [
+            "viale_della_fiera",
+            "viale_europa",
+            "viale_della_repubblica",
+            "saffi",
+            "ponente",
+            "sabotino",
+            "di_reno",
+            "liberazione",
+        ]
+    ],
+}
+
+
+def empty_scenario() -> Scenario:
+    """
+    Returns the scenario of the base network, without edits.
+    """
+    return {"closures": [], "lane_changes": []}
+
+
+def merge_scenarios(*scenarios: Scenario | None) -> Scenario:
+    """
+    Returns the scenario applying the edits of the given scenarios, in order.
+    """
+    merged = empty_scenario()
+    for scenario in scenarios:
+        if scenario:
+            merged["closures"] += scenario.get("closures", [])
+            merged["lane_changes"] += scenario.get("lane_changes", [])
+    return merged
+
+
+def is_empty(scenario: Scenario | None) -> bool:
+    return not scenario or not (scenario.get("closures") or scenario.get("lane_changes"))
+
+
+def scenario_hash(scenario: Scenario | None) -> str:
+    """
+    Returns the hash of the edits of a scenario.
+    """
+    return hashlib.sha256(json.dumps(merge_scenarios(scenario), sort_keys=True).encode()).hexdigest()
+
+
+def apply_scenario(rn: "mobility.RoadNetwork", scenario: Scenario | None) -> None:
+    """
+    Applies the closures and lane changes of a scenario to an imported road network, in place.
+
+    Call it before the automatic preparation steps (node capacities, lanes mapping, priorities, traffic lights),
+    so that they account for the edits.
+
+    Args:
+        rn: The road network
+        scenario: The scenario to apply
+    """
+    if is_empty(scenario):
+        return
+    from dsf import mobility
+
+    for closure in scenario.get("closures", []):
+        if closure.get("edge_ids"):
+            for street_id in closure["edge_ids"]:
+                rn.setStreetStatusById(street_id, mobility.RoadStatus.CLOSED)
+        else:
+            rn.setStreetStatusByName(closure["name"], mobility.RoadStatus.CLOSED)
+    for change in scenario.get("lane_changes", []):
+        speed_factor = change.get("speed_factor")
+        if change.get("edge_ids"):
+            for street_id in change["edge_ids"]:
+                rn.changeStreetNLanesById(street_id, change["nlanes"], speed_factor)
+        else:
+            rn.changeStreetNLanesByName(change["name"], change["nlanes"], speed_factor)
+
+
+def describe_scenario(scenario: Scenario | None) -> str:
+    """
+    Returns a human readable summary of the edits of a scenario.
+    """
+    if is_empty(scenario):
+        return "no edits"
+    lines = [f"closed {_street(closure)}" for closure in scenario.get("closures", [])]
+    lines += [f"{_street(change)} set to {change['nlanes']} lanes" for change in scenario.get("lane_changes", [])]
+    return "; ".join(lines)
+
+
+def _street(edit: Closure | LaneChange) -> str:
+    return f"'{edit['name']}'" if edit.get("name") else f"edges {edit['edge_ids']}"
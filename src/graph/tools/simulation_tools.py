@@ -1,33 +1,51 @@
 import dsf
-from dsf import mobility
 from langchain.tools import tool, ToolRuntime
 from langgraph.types import Command
 from langchain_core.messages import ToolMessage
-from typing import Annotated
-from tqdm.rich import trange
-from .utils import get_epoch_time, create_output_dir, copy_as_csv
-import numpy as np 
-import pickle
+from concurrent.futures import CancelledError
+from contextlib import closing
+from typing import Annotated, Callable
+from .utils import create_output_dir, stream_progress
+from .ensemble import run_ensemble, merge_shards, remove_shards
+from .postprocess import postprocess_database
+from .ensemble_stats import ENSEMBLE_NAME
+from .output_writer import OutputConfig, output_config
+from .demand_inputs import DEMAND_FILES
+from .network_store import network_file
+from .scenario import Scenario, TRAM_SCENARIO, merge_scenarios
+from .result_cache import result_key, lookup_result, store_result, evict_results
+import numpy as np
+import asyncio
+import shutil
+import sqlite3
+import threading
+import os
 
 # I hate warnings
 dsf.set_log_level(dsf.LogLevel.ERROR)
 
-from ...visualization import open_visualization
+from ...visualization import open_visualization, write_all_tiles, render_database
 
 INPUT_FOLDER="./updated_input"
+N_WORKERS = int(os.getenv("DSF_N_WORKERS", os.cpu_count() or 1))  # size of the process pool running the replicas
+RESULT_CACHE_MAX_RUNS = int(os.getenv("DSF_RESULT_CACHE_MAX_RUNS", 20))  # output directories kept on disk
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("DSF_RESULT_CACHE_MAX_GB", 10)) * 1024**3)
+RENDER_VIDEOS = os.getenv("DSF_RENDER_VIDEOS", "0") != "0"  # render the density animation once the run completes
 
-@tool 
-def run_simulation(
+@tool
+async def run_simulation(
     runtime : ToolRuntime,
     dt_agent : Annotated[int, "Time interval for agent spawning"] = 10,
     duration : Annotated[int, "Duration of the simulation, in seconds"] = 60 * 60,  # 1 hour default
     day : Annotated[str, "The day of the simulation in the format YYYY-MM-DD"] = '2022-01-31',
     start_hour: Annotated[int, "The hour of the day to start the simulation at, as an integer between 0 and 23"] = 0,
     include_tram: Annotated[bool, "Whether to include trams in the simulation"] = False,
+    seed: Annotated[int, "Seed of the ensemble of simulations. Change it only to get a new, independent ensemble"] = 42,
+    warmup_hours: Annotated[int, "Hours simulated before start_hour to fill the network, without saving results. Every replica simulates them: they take as long as saved hours"] = 0,
     # start_minute: Annotated[int, "The minute of the hour to start the simulation at, as an integer between 0 and 59"] = 0,  array is hourly computed so no need for minutes now
 )-> Command:
     """
-    Use this tool to run the mobility simulation. 
+    Use this tool to run the mobility simulation.
 
     Args:
         dt_agent: Time interval for agent spawning. Defaults to 10 seconds
@@ -35,150 +53,239 @@ def run_simulation(
         day: The day of the simulation in the format YYYY-MM-DD. Default: 2022-01-31
         start_hour: The hour of the day to start the simulation at, as an integer between 0 and 23. Defaults to 0.
         include_tram: Wether to consider the new tram line or not in the simulaiton. Defaults to False
+        seed: Seed of the ensemble, from which the seeds of the replicas are drawn. Defaults to 42.
+            Runs with the same parameters, seed and inputs are cached, and return the previous results.
+        warmup_hours: Hours simulated before `start_hour` to fill the network with traffic, whose results are not saved.
+            Every replica simulates them, so they add to the running time as much as saved hours do.
+            Defaults to 0 (the simulation starts from an empty network).
     Returns:
         A message indicating that the simulation has been run.
         The path to the output directory containing the simulation results.
     """
 
-    print(f"\n=== RUNNING SIMULATION ===\n\nAttempting to run simulation with parameters: dt_agent={dt_agent}, duration={duration}, day={day}, start_hour={start_hour}\n")
+    # the ensemble runs in a worker thread (and its replicas in worker processes): the event loop stays free
+    cancel_event = threading.Event()
+    progress_callback = stream_progress(runtime.stream_writer, "run_simulation")
+    try:
+        output_dir, cached = await asyncio.to_thread(
+            simulate_ensemble,
+            dt_agent=dt_agent,
+            duration=duration,
+            day=day,
+            start_hour=start_hour,
+            include_tram=include_tram,
+            seed=seed,
+            warmup_hours=warmup_hours,
+            edges_filepath=runtime.state["edges_filepath"],
+            nodes_filepath=runtime.state["nodes_filepath"],
+            scenario=runtime.state.get("scenario"),
+            progress_callback=progress_callback,
+            cancel_event=cancel_event,
+        )
+    except asyncio.CancelledError:
+        # cancelled from the chat loop: stop the replicas too
+        cancel_event.set()
+        raise
+    except RuntimeError as e:
+        tool_err = f"Simulation failed: {e}"
+        print(f"ERROR: {tool_err}")
+        return Command(update={"messages": [ToolMessage(tool_err, tool_call_id=runtime.tool_call_id)]})
 
-    # Create output directory
-    output_dir = create_output_dir()
+    if cached:
+        message = f"An identical simulation was already run: results are in {output_dir} directory. Visualization opened in browser."
+    else:
+        message = f"Simulation completed successfully. Results saved to {output_dir} directory. Visualization opened in browser."
+
+    return Command(
+        update={
+            "messages": [ToolMessage(message, tool_call_id=runtime.tool_call_id)],
+            "output_dir" : output_dir # save the output directory in state
+        }
+    )
+
+def simulate_ensemble(
+    dt_agent: int = 10,
+    duration: int = 60 * 60,
+    day: str = '2022-01-31',
+    start_hour: int = 0,
+    include_tram: bool = False,
+    seed: int = 42,
+    warmup_hours: int = 0,
+    edges_filepath: str = network_file(INPUT_FOLDER, "edges"),
+    nodes_filepath: str = network_file(INPUT_FOLDER, "node_props"),
+    scenario: Scenario | None = None,
+    progress_callback: Callable[[int, int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    n_workers: int = N_WORKERS,
+    visualize: bool = True,
+    output: OutputConfig | None = None,
+    render: bool = RENDER_VIDEOS,
+) -> tuple[str, bool]:
+    """
+    Runs the ensemble of simulations, or returns the results of an identical previous run.
+
+    This is blocking: call it from a worker thread when running inside an event loop.
 
-    edges_filepath = runtime.state["edges_filepath"]
-    print(f">>> Loading edges from {edges_filepath}...")
+    Args:
+        dt_agent: Time interval for agent spawning
+        duration: Duration of the simulation, in seconds
+        day: The day of the simulation in the format YYYY-MM-DD
+        start_hour: The hour of the day to start the simulation at, as an integer between 0 and 23
+        include_tram: Whether to include the new tram line in the simulation
+        seed: Seed of the ensemble, from which the seeds of the replicas are drawn
+        warmup_hours: Hours simulated before `start_hour`, without saving results, so that the saved window
+            starts from a loaded network. Every replica simulates its own warm-up (the state of the dynamics
+            cannot be copied), so it costs as much as saved hours. The warm-up starts at midnight at the earliest
+        edges_filepath: The path to the base edges file
+        nodes_filepath: The path to the node properties file
+        scenario: The closures and lane changes of the user, applied to the base network (see `scenario`)
+        progress_callback: Optional function called with (replica, simulated seconds, total seconds) on progress
+        cancel_event: Optional event to set (from another thread) to cancel the simulation
+        n_workers: The number of worker processes running the replicas
+        visualize: Whether to open the visualization webapp on the results
+        output: The save cadence and tables of the replicas. Defaults to the configuration of the environment
+            (see `output_writer`)
+        render: Whether to render the density animation of the results to video (see `visualization.renderer`)
+    Returns:
+        A tuple with the path to the output directory and whether the results come from the cache.
+    Raises:
+        RuntimeError: if a replica fails
+        CancelledError: if the simulation is cancelled through `cancel_event`
+    """
 
-    SCALE = 25  # hardcoded 
+    print(f"\n=== RUNNING SIMULATION ===\n\nAttempting to run simulation with parameters: dt_agent={dt_agent}, duration={duration}, day={day}, start_hour={start_hour}, warmup_hours={warmup_hours}\n")
+
+    SCALE = 25  # hardcoded
     N_SIMULATIONS = 10  # hardcoded
     ALPHA = 0.9  # hardcoded
     NORM_WEIGHTS = False
     SMOOTHING_HOURS = 3  # Number of hours to average over (odd number recommended)
 
-    print(f">>> Loading input data from {INPUT_FOLDER}...")
-    input_vehicles_mean = np.load(f"{INPUT_FOLDER}/vehicles10s_2022_mean.npy")
-    input_vehicles_std = np.load(f"{INPUT_FOLDER}/vehicles10s_2022_std.npy")
-    # Ensure both are >= 0
-    input_vehicles_mean = np.clip(input_vehicles_mean, 0, None)
-    input_vehicles_std = np.clip(input_vehicles_std, 0, None)
-    # Shift input vehicles ahead of 360 points (1 hour)
-    input_vehicles_mean = np.roll(input_vehicles_mean, 360)
-    input_vehicles_std = np.roll(input_vehicles_std, 360)
-
-    origin_nodes = pickle.load(open(f"{INPUT_FOLDER}/origin_dicts.pkl", "rb"))
-    destination_nodes = pickle.load(open(f"{INPUT_FOLDER}/destination_dicts.pkl", "rb"))
-
-    # Make all weights 1
-    if NORM_WEIGHTS:
-        for origin_dict in origin_nodes:
-            for key in origin_dict:
-                origin_dict[key] = 1
-        for dest_dict in destination_nodes:
-            for key in dest_dict:
-                dest_dict[key] = 1
-
-    
-    for _ in trange(N_SIMULATIONS, desc="Simulations"):
-        # Generate random seed for each simulation
-        SEED = np.random.randint(0, 1000000)
-        # Set np seed for reproducibility
-        np.random.seed(SEED)
-        # Generate input_vehicles for this simulation by sampling from normal distribution
-        input_vehicles = np.random.normal(input_vehicles_mean, input_vehicles_std)
-        input_vehicles = np.clip(input_vehicles, 0, None)  # No negative vehicles
-        rn = mobility.RoadNetwork()
-        rn.importEdges(f"{INPUT_FOLDER}/edges.csv")
-        rn.importNodeProperties(f"{INPUT_FOLDER}/node_props.csv")
-
-        # if we consider the tram: update the network accordingly
-        if include_tram:
-            rn.setStreetStatusById(
-                6285, dsf.mobility.RoadStatus.CLOSED
-            )  # Piece of via_serena
-            rn.setStreetStatusById(5637, dsf.mobility.RoadStatus.CLOSED)
-            rn.setStreetStatusById(4645, dsf.mobility.RoadStatus.CLOSED)
-            rn.setStreetStatusById(1750, dsf.mobility.RoadStatus.CLOSED)
-            rn.changeStreetNLanesByName("viale_della_fiera", 1, 0.5)
-            rn.changeStreetNLanesByName("viale_europa", 1, 0.5)
-            rn.changeStreetNLanesByName("viale_della_repubblica", 1, 0.5)
-            rn.changeStreetNLanesByName("saffi", 1, 0.5)
-            rn.changeStreetNLanesByName("ponente", 1, 0.5)
-            rn.changeStreetNLanesByName("sabotino", 1, 0.5)
-            rn.changeStreetNLanesByName("di_reno", 1, 0.5)
-            rn.changeStreetNLanesByName("liberazione", 1, 0.5)
-
-        rn.adjustNodeCapacities()
-        rn.autoMapStreetLanes()
-        rn.autoAssignRoadPriorities()
-        rn.autoInitTrafficLights()
-
-        simulator = mobility.Dynamics(rn, False, SEED, ALPHA)
-        if include_tram:
-            simulator.setName(f"sim_{day}_with_tram_{SEED}")
-        else: 
-            simulator.setName(f"sim_{day}_no_tram_{SEED}")
-
-        simulator.killStagnantAgents(40.0)
-
-        # Get the epoch time for the actual day of the simulation
-        epoch_time = get_epoch_time(day, start_hour, include_tram=include_tram) # start minute
-        simulator.setInitTime(epoch_time)
-
-        # NOTE: now saving data to a database
-        simulator.connectDataBase(f"{output_dir}/database.db")
-        simulator.saveData(300, True, True, True)
-
-        turn_counts = []
-
-        # start and end times
-        start_time_seconds = start_hour * 3600
-        end_time_seconds = start_time_seconds + duration
-
-        # NOTE: simulate from start_hour until start_hour + duration 
-        for i in trange(start_time_seconds, end_time_seconds + 1, desc="Simulating flows"):
-            if i % 3600 == 0 and i // 3600 < len(origin_nodes):
-                # do a mean over the weights for SMOOTHING_HOURS hours (centered on current hour)
-                origins = origin_nodes[
-                    i // 3600
-                ].copy()  # Create a copy to avoid modifying original
-                destinations = destination_nodes[i // 3600]
-
-                # Collect all unique keys from the smoothing window
-                all_keys = set(origins.keys())
-                half_window = SMOOTHING_HOURS // 2
-                for offset in range(-half_window, half_window + 1):
-                    hour_idx = i // 3600 + offset
-                    if 0 <= hour_idx < len(origin_nodes):
-                        all_keys.update(origin_nodes[hour_idx].keys())
-
-                # For each key, average available values from the smoothing window
-                for key in all_keys:
-                    values = []
-                    for offset in range(-half_window, half_window + 1):
-                        hour_idx = i // 3600 + offset
-                        if 0 <= hour_idx < len(origin_nodes) and key in origin_nodes[hour_idx]:
-                            values.append(origin_nodes[hour_idx][key])
-
-                    if values:
-                        origins[key] = sum(values) / len(values)
-
-                simulator.setOriginNodes(origins)
-                simulator.setDestinationNodes(destinations)
-
-            if i % 300 == 0:
-                simulator.updatePaths(False)
-                
-            if i >= 0:
-                if i % 3600 == 0:
-                    turn_counts.append(simulator.normalizedTurnCounts())
-            if i % dt_agent == 0 and i // dt_agent < len(input_vehicles):
-                n_agents = int(input_vehicles[i // dt_agent] / SCALE)
-                simulator.addAgentsRandomly(n_agents if n_agents > 0 else 0)
-                
-            simulator.evolve(False)
+    # Generate the seeds of the simulations from the ensemble seed
+    seed_rng = np.random.default_rng(seed)
+    seeds = [int(seed_rng.integers(0, 1000000)) for _ in range(N_SIMULATIONS)]
+
+    # the edits of the user (and the tram line) are applied to the network in memory: the input files are the base ones
+    edges_file = edges_filepath
+    nodes_file = nodes_filepath
+    scenario = merge_scenarios(scenario)
+    network_scenario = merge_scenarios(TRAM_SCENARIO, scenario) if include_tram else scenario
+    output = output or output_config()
+    # the demand is hourly within the day: the warm-up cannot start before midnight
+    warmup_hours = max(0, min(warmup_hours, start_hour))
+    print(f">>> Loading edges from {edges_file}...")
+
+    # Look for a previous run with the same parameters, seeds and inputs
+    run_params = {
+        "dt_agent": dt_agent,
+        "duration": duration,
+        "day": day,
+        "start_hour": start_hour,
+        "warmup_hours": warmup_hours,
+        "include_tram": include_tram,
+        "scale": SCALE,
+        "alpha": ALPHA,
+        "norm_weights": NORM_WEIGHTS,
+        "smoothing_hours": SMOOTHING_HOURS,
+        "seeds": seeds,
+        "scenario": scenario,
+        # the journal mode does not change the results
+        "output": {"interval": output["interval"], "tables": output["tables"]},
+    }
+    run_key = result_key(run_params, [edges_file, nodes_file] + [f"{INPUT_FOLDER}/{f}" for f in DEMAND_FILES])
+    cached_dir = lookup_result(run_key)
+    if cached_dir is not None:
+        print(f">>> Found results of an identical simulation in {cached_dir}, skipping the simulation.")
+        if render and not os.path.exists(f"{cached_dir}/renders"):
+            _render_videos(cached_dir)
+        if visualize:
+            _open_visualization(cached_dir)
+        return cached_dir, True
+
+    # Create output directory
+    output_dir = create_output_dir()
+
+    # one seed and one database shard per replica: replicas run in parallel and are merged at the end
+    shards_dir = f"{output_dir}/shards"
+    os.mkdir(shards_dir)
+    tasks = []
+    for replica, SEED in enumerate(seeds):
+        tasks.append({
+            "replica": replica,
+            "seed": SEED,
+            "shard_path": f"{shards_dir}/database_{replica}_{SEED}.db",
+            "input_folder": INPUT_FOLDER,
+            "edges_filepath": edges_file,
+            "nodes_filepath": nodes_file,
+            "dt_agent": dt_agent,
+            "duration": duration,
+            "day": day,
+            "start_hour": start_hour,
+            "warmup_hours": warmup_hours,
+            "include_tram": include_tram,
+            "scenario": network_scenario,
+            "scale": SCALE,
+            "alpha": ALPHA,
+            "norm_weights": NORM_WEIGHTS,
+            "smoothing_hours": SMOOTHING_HOURS,
+            "output": output,
+        })
+
+    try:
+        shard_paths = run_ensemble(tasks, n_workers, progress_callback, cancel_event)
+    except CancelledError:
+        print(f">>> Simulation cancelled, removing {output_dir}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    except RuntimeError as e:
+        raise RuntimeError(f"{e}. Partial results left in {shards_dir}") from e
+
+    print(f">>> Merging {len(shard_paths)} database shards...")
+    merge_shards(shard_paths, f"{output_dir}/database.db")
+    remove_shards(shard_paths)
+    os.rmdir(shards_dir)
+
+    # index the database and precompute the aggregates read by the webapp and the analyses
+    try:
+        postprocess_database(f"{output_dir}/database.db")
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Post-processing of the results failed: {e!r}. Merged results left in {output_dir}") from e
+
+    # pack the densities for the visualization webapp, so that it does not have to on the first request
+    write_all_tiles(f"{output_dir}/database.db")
+
+    if render:
+        _render_videos(output_dir)
 
     print("\n=== SIMULATION COMPLETED SUCCESSFULLY ===\n")
 
-    # Open visualization webapp
+    # Make the run available to identical requests, and drop the least recently used ones
+    store_result(output_dir, run_key, run_params)
+    for evicted_dir in evict_results(RESULT_CACHE_MAX_RUNS, RESULT_CACHE_MAX_BYTES, keep=(output_dir,)):
+        print(f">>> Removed old simulation results in {evicted_dir}")
+
+    if visualize:
+        _open_visualization(output_dir)
+
+    return output_dir, False
+
+def _render_videos(output_dir: str) -> None:
+    """
+    Renders the density animation of the ensemble simulation of the given output directory, or of every replica
+    if there is no ensemble simulation, to the `renders` folder of the output directory.
+    """
+    db_path = f"{output_dir}/database.db"
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            simulation_ids = [sim_id for (sim_id,) in conn.execute("SELECT id FROM simulations WHERE name = ?", (ENSEMBLE_NAME,))]
+        render_database(db_path, simulation_ids or None)
+    except Exception as e:
+        print(f"WARNING: Could not render the simulation: {e}")
+
+def _open_visualization(output_dir: str) -> None:
+    """
+    Opens the visualization webapp on the database of the given output directory.
+    """
     print(">>> Opening visualization webapp...")
     try:
         db_path = f"{output_dir}/database.db"
@@ -186,10 +293,3 @@ def run_simulation(
     except Exception as e:
         print(f"WARNING: Could not open visualization: {e}")
         print(">>> You can manually open the visualization later")
-
-    return Command(
-        update={
-            "messages": [ToolMessage(f"Simulation completed successfully. Results saved to {output_dir} directory. Visualization opened in browser.", tool_call_id=runtime.tool_call_id)],
-            "output_dir" : output_dir # save the output directory in state
-        }
-    )
\ No newline at end of file
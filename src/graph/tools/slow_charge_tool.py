@@ -1,18 +1,33 @@
-import pathlib
+"""
+Implementing the slow charge simulation logic in a langchain tool.
+
+Every run saves to the `database.db` of its own timestamped output directory, through the same output path
+as `run_simulation` (see `output_writer` and `postprocess`), so runs never overwrite each other.
+The fundamental diagram of a run can be extracted from its database (see `fundamental_diagram`).
+"""
+
 import shutil
 from dsf import mobility
 from langchain.tools import tool, ToolRuntime
 from langgraph.types import Command
 from langchain_core.messages import ToolMessage
-from typing import Annotated
-from tqdm.rich import trange
-from .utils import get_epoch_time
-"""
-Implementing the slow charge simulation logic in a langchain tool.
-"""
+from concurrent.futures import CancelledError
+from typing import Annotated, Callable
+from tqdm.rich import tqdm
+from .utils import create_output_dir, get_epoch_time, stream_progress
+from .driver import build_timeline, run_timeline
+from .scenario import Scenario, apply_scenario
+from .network_store import as_csv
+from .output_writer import OutputConfig, connect_output, output_config
+from .postprocess import postprocess_database
+from ...visualization import write_all_tiles
+import asyncio
+import threading
+
+OUT_FOLDER = "output_slow_charge"  # prefix of the output directories
 
 @tool
-def simulate_slow_charge(
+async def simulate_slow_charge(
     runtime : ToolRuntime,
     dt_agent : Annotated[int, "Time interval for agent spawning"] = 10,
     num_hours : Annotated[int, "Number of hours to simulate"] = 7,
@@ -31,21 +46,76 @@ def simulate_slow_charge(
         The path to the output directory containing the simulation results.
     """
 
-    OUT_FOLDER = "output_slow_charge"
-    EDGES_FILE = runtime.state["edges_filepath"]
+    # the simulation runs in a worker thread: the event loop stays free to stream the progress
+    cancel_event = threading.Event()
+    progress_callback = stream_progress(runtime.stream_writer, "simulate_slow_charge")
+    try:
+        output_dir = await asyncio.to_thread(
+            slow_charge,
+            edges_filepath=runtime.state["edges_filepath"],
+            scenario=runtime.state.get("scenario"),
+            dt_agent=dt_agent,
+            num_hours=num_hours,
+            day=day,
+            start_hour=start_hour,
+            progress_callback=progress_callback,
+            cancel_event=cancel_event,
+        )
+    except asyncio.CancelledError:
+        # cancelled from the chat loop: stop the simulation thread too
+        cancel_event.set()
+        raise
+
+    return Command(
+        update = {
+            "messages" : [ToolMessage(content=f"Simulation completed successfully. Results saved to {output_dir}.", tool_call_id=runtime.tool_call_id)]
+        }
+    )
+
+def slow_charge(
+    edges_filepath: str,
+    dt_agent: int = 10,
+    num_hours: int = 7,
+    day: str = '2022-01-31',
+    start_hour: int = 0,
+    scenario: Scenario | None = None,
+    progress_callback: Callable[[int, int, int], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    output: OutputConfig | None = None,
+) -> str:
+    """
+    Runs the slow charge simulation, saving the results in a new output directory.
+
+    This is blocking: call it from a worker thread when running inside an event loop.
+
+    Args:
+        edges_filepath: The path to the edges file
+        dt_agent: Time interval for agent spawning
+        num_hours: Number of hours to simulate
+        day: The day of the simulation in the format YYYY-MM-DD
+        start_hour: The hour of the day to start the simulation at, as an integer between 0 and 23
+        scenario: The closures and lane changes to apply to the network (see `scenario`)
+        progress_callback: Optional function called with (0, simulated seconds, total seconds) on progress
+        cancel_event: Optional event to set (from another thread) to cancel the simulation
+        output: The save cadence and tables. Defaults to the configuration of the environment (see `output_writer`)
+    Returns:
+        The path to the output directory, named after OUT_FOLDER and the start time of the run.
+    Raises:
+        CancelledError: if the simulation is cancelled through `cancel_event`
+    """
+
+    EDGES_FILE = as_csv(edges_filepath)  # the simulator imports CSVs only
     # NODES_FILE = runtime.state["nodes_filepath"]
 
     print("Constructing road network...")
     rn = mobility.RoadNetwork()
     rn.importEdges(EDGES_FILE)
     # rn.importNodeProperties(NODES_FILE)  
+    apply_scenario(rn, scenario)
 
-    # Clear output directory
-    output_dir = pathlib.Path(f"./{OUT_FOLDER}")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    for file in output_dir.glob("*"):
-        if file.is_file():
-            file.unlink()
+    # a new output directory per run
+    output_dir = create_output_dir(f"./{OUT_FOLDER}")
+    db_path = f"{output_dir}/database.db"
 
     rn.adjustNodeCapacities()
     rn.autoMapStreetLanes()
@@ -53,7 +123,7 @@ def simulate_slow_charge(
     print("Road network constructed successfully.")
 
     # Copy edges file to output directory for reference
-    shutil.copy(EDGES_FILE, f"./{OUT_FOLDER}/edges.geojson")
+    shutil.copy(EDGES_FILE, f"{output_dir}/edges.geojson")
 
     simulator = mobility.Dynamics(rn, False, 69, 0.6)
     simulator.setMaxDistance(5e3)
@@ -62,24 +132,54 @@ def simulate_slow_charge(
     # Get the epoch time for the actual day of the simulation
     epoch_time = get_epoch_time(day, start_hour)
     simulator.setInitTime(epoch_time)
+    connect_output(simulator, db_path, output or output_config())
     n_agents = 1
 
-    for i in trange(start_hour * 3600, num_hours * 3600, desc="Simulating flows"):
-        if i >= 0:
-            if i % 300 == 0:
-                simulator.saveStreetDensities(f"./{OUT_FOLDER}/densities.csv", True)
-                simulator.saveTravelData(f"./{OUT_FOLDER}/speeds.csv")
-                simulator.saveMacroscopicObservables(f"./{OUT_FOLDER}/data.csv")
-        if i % dt_agent == 0 and n_agents > 0:
+    start_time_seconds = start_hour * 3600
+    end_time_seconds = num_hours * 3600 - 1
+
+    def add_agents(t):
+        nonlocal n_agents
+        if n_agents > 0:
             simulator.addRandomAgents(n_agents)
-            if i * num_hours:
+            if t * num_hours:
                 n_agents += 1  # gradually increase number of agents added
             else:
                 n_agents = 0
-        simulator.evolve(False)
 
-    return Command(
-        update = {
-            "messages" : [ToolMessage(content=f"Simulation completed successfully. Results saved to {OUT_FOLDER}.", tool_call_id=runtime.tool_call_id)]
-        }
-    )
\ No newline at end of file
+    progress_bar = tqdm(total=max(end_time_seconds + 1 - start_time_seconds, 0), desc="Simulating flows")
+
+    def update_progress(t):
+        if cancel_event is not None and cancel_event.is_set():
+            progress_bar.close()
+            raise CancelledError("The simulation was cancelled")
+        progress_bar.update(t - start_time_seconds - progress_bar.n)
+        if progress_callback is not None:
+            progress_callback(0, progress_bar.n, progress_bar.total)
+
+    timeline = build_timeline(
+        start_time_seconds,
+        end_time_seconds,
+        {"agents": dt_agent, "progress": 60},
+    )
+    try:
+        run_timeline(
+            simulator,
+            start_time_seconds,
+            end_time_seconds,
+            timeline,
+            {"agents": add_agents, "progress": update_progress},
+        )
+    except CancelledError:
+        print(f">>> Simulation cancelled, removing {output_dir}")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    progress_bar.update(progress_bar.total - progress_bar.n)
+    progress_bar.close()
+    if progress_callback is not None:
+        progress_callback(0, progress_bar.total, progress_bar.total)
+
+    del simulator  # close the connection of the simulator before post-processing
+    postprocess_database(db_path)
+    write_all_tiles(db_path)
+    return output_dir
@@ -0,0 +1,163 @@
+"""
+Index of the street names of an edges file, to resolve the street names given by the user.
+
+Names are normalized (lowercase, no accents, no underscores or punctuation) and indexed by character trigrams:
+a lookup shortlists the names sharing the most trigrams with the query, and fuzzy matches only those.
+Each name maps to the ids of its edges. Indexes are built once per edges file version (see `get_street_index`),
+or once per content of the name columns already in memory (see `get_name_index`).
+"""
+
+from rapidfuzz import process, fuzz
+from .utils import file_hash, read_edges_file
+from collections import OrderedDict, defaultdict
+import hashlib
+import numpy as np
+import pandas as pd
+import unicodedata
+import re
+
+NGRAM = 3
+SHORTLIST_SIZE = 64  # names fuzzy matched after the trigram blocking
+MIN_SCORE = 75  # minimum score of a match, in [0, 100]
+
+MAX_NAME_INDEXES = 8  # indexes of in-memory name columns kept, the least recently used is dropped first
+
+_STREET_INDEXES = {}  # edges file hash -> StreetNameIndex
+_NAME_INDEXES = OrderedDict()  # names hash -> StreetNameIndex, least recently used first
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a street name: lowercase, no accents, words separated by single spaces.
+
+    Example: "Via dell'Indipendenza" and "via_dell_indipendenza" both become "via dell indipendenza".
+    """
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[\W_]+", " ", name.lower()).split())
+
+
+def _ngrams(name: str) -> set[str]:
+    padded = f" {name} "
+    return {padded[k:k + NGRAM] for k in range(max(len(padded) - NGRAM + 1, 1))}
+
+
+class StreetNameIndex:
+    """
+    Trigram-blocked fuzzy index of street names, mapping each name to the ids of its edges.
+
+    Args:
+        names: The name of each edge
+        edge_ids: The id of each edge
+    """
+
+    def __init__(self, names: pd.Series, edge_ids: pd.Series):
+        edges = pd.DataFrame({"name": names.values, "id": edge_ids.values}).dropna(subset=["name"])
+        edges["name"] = edges["name"].astype(str)
+        edges["normalized"] = edges["name"].map(normalize_name)
+        edges = edges[edges["normalized"] != ""]
+
+        groups = edges.groupby("normalized", sort=True)
+        self.normalized = list(groups.groups)
+        self.names = groups["name"].first().tolist()  # original spelling of each name
+        self.edge_ids = groups["id"].agg(list).tolist()
+        self._exact = {name: k for k, name in enumerate(self.normalized)}
+
+        postings = defaultdict(list)
+        for k, name in enumerate(self.normalized):
+            for ngram in _ngrams(name):
+                postings[ngram].append(k)
+        self._postings = {ngram: np.array(rows, dtype=np.int32) for ngram, rows in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.normalized)
+
+    def _shortlist(self, query: str) -> np.ndarray:
+        """
+        Returns the rows of the names sharing the most trigrams with the query.
+        """
+        hits = [self._postings[ngram] for ngram in _ngrams(query) if ngram in self._postings]
+        if not hits:
+            return np.arange(len(self.normalized))  # nothing in common: fall back to a full scan
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.normalized))
+        if np.count_nonzero(counts) <= SHORTLIST_SIZE:
+            return np.flatnonzero(counts)
+        return np.argpartition(counts, -SHORTLIST_SIZE)[-SHORTLIST_SIZE:]
+
+    def match(self, query: str, min_score: float = MIN_SCORE) -> tuple[str, float, list] | None:
+        """
+        Finds the street name best matching the query.
+
+        Args:
+            query: The street name to look for, as given by the user
+            min_score: The minimum score of the match, in [0, 100]
+        Returns:
+            A tuple with the matched street name (as spelled in the edges file), the score of the match and
+            the ids of the edges of the street, or None if no name scores at least `min_score`.
+        """
+        query = normalize_name(query)
+        if not query or not self.normalized:
+            return None
+        row = self._exact.get(query)
+        if row is not None:
+            return self.names[row], 100.0, self.edge_ids[row]
+
+        rows = self._shortlist(query)
+        result = process.extractOne(
+            query,
+            [self.normalized[r] for r in rows],
+            scorer=fuzz.ratio,   # maybe there are others that work better w/ street names?
+            score_cutoff=min_score,
+        )
+        if result is None:
+            return None
+        _, score, position = result
+        row = rows[position]
+        return self.names[row], score, self.edge_ids[row]
+
+    def match_many(self, queries: list[str], min_score: float = MIN_SCORE) -> dict[str, tuple[str, float, list] | None]:
+        """
+        Finds the street name best matching each query, see `match`.
+
+        Returns:
+            A dict mapping each query to its match, or to None if it has no match.
+        """
+        return {query: self.match(query, min_score) for query in queries}
+
+
+def get_street_index(edges_filepath: str) -> StreetNameIndex:
+    """
+    Returns the street name index of an edges file, building it only once per version of the file.
+
+    Only the `id` and `name` columns are read: geometries are never parsed.
+
+    Args:
+        edges_filepath: The path to the edges file
+    Returns:
+        The street name index.
+    """
+    key = file_hash(edges_filepath)
+    if key not in _STREET_INDEXES:
+        edges = read_edges_file(edges_filepath, columns=["id", "name"], geometry=False)
+        _STREET_INDEXES[key] = StreetNameIndex(edges["name"], edges["id"])
+    return _STREET_INDEXES[key]
+
+
+def get_name_index(names: pd.Series) -> StreetNameIndex:
+    """
+    Returns the street name index of a column of names, building it only once per content of the column.
+
+    Edges are identified by their position in the column. Prefer `get_street_index` for the names of an edges file.
+
+    Args:
+        names: The name of each edge
+    Returns:
+        The street name index.
+    """
+    key = hashlib.sha256(pd.util.hash_pandas_object(names, index=False).values.tobytes()).hexdigest()
+    if key in _NAME_INDEXES:
+        _NAME_INDEXES.move_to_end(key)
+    else:
+        _NAME_INDEXES[key] = StreetNameIndex(names, pd.Series(range(len(names))))
+        if len(_NAME_INDEXES) > MAX_NAME_INDEXES:
+            _NAME_INDEXES.popitem(last=False)
+    return _NAME_INDEXES[key]
@@ -0,0 +1,115 @@
+"""
+Persistence of the turn counts of the replicas.
+
+Every replica writes the snapshots of `Dynamics.normalizedTurnCounts` to the `turn_counts` table of its database
+shard as soon as they are taken, so memory does not grow with the duration of the simulation. Turns are stored
+sparsely, one row per (from street, to street) pair with a non-zero count, together with the node where the turn
+happens (the target of the from street), and indexed by node.
+
+Shards are merged as any other table with a `simulation_id` column (see `ensemble.merge_shards`).
+"""
+
+from contextlib import closing
+from datetime import datetime
+from .utils import read_edges_file
+import pandas as pd
+import sqlite3
+
+TURN_COUNTS_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS turn_counts (
+        simulation_id INTEGER,
+        datetime TEXT NOT NULL,
+        node_id INTEGER,
+        from_street_id INTEGER NOT NULL,
+        to_street_id INTEGER NOT NULL,
+        normalized_count REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS turn_counts_node ON turn_counts (simulation_id, node_id, datetime)",
+]
+
+
+class TurnCountsWriter:
+    """
+    Writes the turn counts snapshots of a replica to its database shard.
+
+    The simulation id is assigned by the simulator when it saves its data, so it is filled in on `close`.
+    """
+
+    def __init__(self, db_path: str, edges_filepath: str):
+        """
+        Args:
+            db_path: The path to the database shard of the replica
+            edges_filepath: The path to the edges file, mapping streets to the node they lead to
+        """
+        edges = read_edges_file(edges_filepath, columns=["id", "target"], geometry=False)
+        self.street_targets = dict(zip(edges["id"].tolist(), edges["target"].tolist()))
+        # the simulator writes to the same database: wait for its locks instead of failing
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        with self.conn:
+            for sql in TURN_COUNTS_SCHEMA:
+                self.conn.execute(sql)
+
+    def write(self, epoch_time: int, turn_counts: dict[int, dict[int, float]]) -> None:
+        """
+        Writes a snapshot of the turn counts, committing it.
+
+        Args:
+            epoch_time: The simulated time of the snapshot, as an epoch
+            turn_counts: The normalized turn counts, as {from street id: {to street id: count}}
+        """
+        # in local time, as dsf formats the datetimes of its tables, so that the snapshots join with them
+        timestamp = datetime.fromtimestamp(epoch_time).strftime("%Y-%m-%d %H:%M:%S")
+        rows = [
+            (timestamp, self.street_targets.get(from_id), from_id, to_id, count)
+            for from_id, turns in turn_counts.items()
+            for to_id, count in turns.items()
+            if count
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO turn_counts (datetime, node_id, from_street_id, to_street_id, normalized_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def close(self) -> None:
+        """
+        Assigns the snapshots to the simulation of the shard and closes the connection.
+
+        If the simulator never saved, the shard has no simulation: the snapshots stay unassigned, and are not merged.
+        """
+        try:
+            has_simulations = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='simulations'"
+            ).fetchone()
+            if not has_simulations:
+                print(">>> WARNING: no simulation saved to the shard, the turn counts are not assigned")
+                return
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE turn_counts SET simulation_id = (SELECT MAX(id) FROM simulations) WHERE simulation_id IS NULL"
+                )
+        finally:
+            self.conn.close()
+
+
+def read_turn_counts(db_path: str, simulation_id: int, node_id: int | None = None) -> pd.DataFrame:
+    """
+    Reads the turn counts of a simulation, optionally only those of the turns at a node.
+
+    Args:
+        db_path: The path to the simulation database
+        simulation_id: The id of the simulation (replica)
+        node_id: The id of the node. Defaults to every node
+    Returns:
+        A DataFrame with the datetime, node_id, from_street_id, to_street_id and normalized_count of each turn.
+    """
+    query = "SELECT datetime, node_id, from_street_id, to_street_id, normalized_count FROM turn_counts WHERE simulation_id = ?"
+    params = [simulation_id]
+    if node_id is not None:
+        query += " AND node_id = ?"
+        params.append(node_id)
+    with closing(sqlite3.connect(db_path)) as conn:
+        return pd.read_sql_query(query + " ORDER BY datetime", conn, params=params)
@@ -1,10 +1,14 @@
 import os
-from rapidfuzz import process, fuzz
 import geopandas as gpd
 from datetime import datetime, timezone
 import pandas as pd
-from shapely import wkt
+import shapely
 import shutil
+import hashlib
+import tempfile
+import asyncio
+from collections import OrderedDict
+from typing import Callable
 
 def fuzzy_match(gdf : gpd.GeoDataFrame, column_name : str, input_str : str) -> tuple[str, int]: 
     """
@@ -13,30 +17,22 @@ def fuzzy_match(gdf : gpd.GeoDataFrame, column_name : str, input_str : str) -> t
 
     Returns the best matching string and score,
 
+    NOTE: the street name index of the column is cached per content (see `street_index.get_name_index`):
+    to resolve names of an edges file, `street_index.get_street_index` also avoids reading the file.
+
     Args: 
         gdf: The geodataframe to search in
         column_name: The column to search in
         input_str: The input string to match
 
     Returns:
-        A tuple containing the best matching string and score. 
+        A tuple containing the best matching string and score, or None if nothing matches.
         
         Example: input "torre del orologio" returns ("Torre dell'Orologio", 92)
     """
+    from .street_index import get_name_index  # street_index depends on this module
 
-    known_strs = (
-        gdf[column_name]
-        .dropna()
-        .astype(str)
-        .str.lower()
-        .str.strip().unique()
-    )
-
-    match_result = process.extractOne(
-        input_str.lower().strip(),
-        known_strs,
-        scorer=fuzz.ratio   # maybe there are others that work better w/ street names?
-    )
+    match_result = get_name_index(gdf[column_name]).match(input_str, min_score=0)
 
     if match_result is None:
         return None
@@ -45,22 +41,51 @@ def fuzzy_match(gdf : gpd.GeoDataFrame, column_name : str, input_str : str) -> t
 
     return match, score
 
-def read_edges_file(filepath: str) -> gpd.GeoDataFrame:
+MAX_EDGES_FRAMES = int(os.getenv("DSF_EDGES_CACHE_SIZE", 8))  # edges frames kept per process
+_EDGES_FRAMES = OrderedDict()  # (file hash, columns, geometry) -> edges frame, least recently used first
+
+
+def read_edges_file(filepath: str, columns: list[str] | None = None, geometry: bool = True) -> pd.DataFrame | gpd.GeoDataFrame:
     """
-    Reads the edges file from the given filepath and returns a GeoDataFrame.
+    Reads the edges file (CSV or Arrow, see `network_store`) from the given filepath and returns a GeoDataFrame.
 
-    We need to read the file as a DataFrame first, then convert the string column to real geometric objects, and then create a GeoDataFrame.
+    Only the requested columns are read (memory-mapping Arrow files, and with the pyarrow CSV parser, if available), and the geometries are parsed
+    only if requested, in one vectorized pass. Frames are cached per file content: they are shared, so
+    the caller must copy them before modifying them. At most `MAX_EDGES_FRAMES` frames are kept
+    (env DSF_EDGES_CACHE_SIZE), the least recently used is dropped first.
 
     Args:
         filepath: The path to the edges file
+        columns: The columns to read. Defaults to all the columns
+        geometry: Whether to parse the WKT `geometry` column and return a GeoDataFrame.
+            If False, a DataFrame is returned, with the geometries (if read) as WKT strings.
     Returns:
-        A GeoDataFrame containing the edges data.
+        A GeoDataFrame (or DataFrame) containing the edges data.
     """
-    edges_df = pd.read_csv(filepath, sep=";")
-    # convert the string column to real geometric objects
-    edges_df['geometry'] = edges_df['geometry'].apply(wkt.loads)
-    # create a GeoDataFrame
-    return gpd.GeoDataFrame(edges_df, geometry='geometry', crs="EPSG:4326")
+    if geometry and columns is not None and "geometry" not in columns:
+        columns = [*columns, "geometry"]
+    key = (file_hash(filepath), tuple(columns) if columns is not None else None, geometry)
+    if key in _EDGES_FRAMES:
+        _EDGES_FRAMES.move_to_end(key)
+        return _EDGES_FRAMES[key]
+
+    from .network_store import is_arrow, read_arrow  # network_store depends on this module
+
+    if is_arrow(filepath):
+        edges_df = read_arrow(filepath, columns)
+    else:
+        try:
+            edges_df = pd.read_csv(filepath, sep=";", usecols=columns, engine="pyarrow")
+        except ImportError:  # pyarrow is optional
+            edges_df = pd.read_csv(filepath, sep=";", usecols=columns)
+    if geometry:
+        # convert the string column to real geometric objects, create a GeoDataFrame
+        edges_df = gpd.GeoDataFrame(edges_df, geometry=shapely.from_wkt(edges_df["geometry"].to_numpy()), crs="EPSG:4326")
+
+    _EDGES_FRAMES[key] = edges_df
+    while len(_EDGES_FRAMES) > max(1, MAX_EDGES_FRAMES):
+        _EDGES_FRAMES.popitem(last=False)
+    return edges_df
 
 def get_epoch_time(day: str, start_hour: int, start_minute: int = 0, include_tram = False) -> int:
     """
@@ -92,29 +117,89 @@ def get_epoch_time(day: str, start_hour: int, start_minute: int = 0, include_tra
 
 def create_output_dir(output_dir: str = "output") -> str:
     """
-    Creates the output directory if it does not exist, with a timestamp in the name.
+    Creates a new output directory, with a timestamp and a random suffix in the name.
+
+    The directory is created atomically and never reused, so runs started in the same second
+    (e.g. concurrent jobs) never share their output directory.
 
     Args:
         output_dir: The path to the output directory (Optional: default is "output")
     Returns:
-        The path to the output directory with the timestamp in the name
+        The path to the output directory, e.g. "output_20240101_120000_k3j2x8qa"
     """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    os.makedirs(f"{output_dir}_{timestamp}", exist_ok=True)
-    return f"{output_dir}_{timestamp}"
+    parent, name = os.path.split(output_dir)
+    path = tempfile.mkdtemp(prefix=f"{name}_{timestamp}_", dir=parent or ".")
+    return os.path.join(parent, os.path.basename(path))
 
 def copy_as_csv(source_path: str, destination_path: str) -> None:
     """
     Copies a file from the source path to the destination path as a csv file.
-    Made to copy edges file, which can be a geojson or a csv.
-    If it is a geojson, we convert it to csv.
+    Made to copy edges file, which can be a geojson, an Arrow file or a csv.
+    If it is a geojson or an Arrow file, we convert it to csv.
 
     Args:
         source_path: The path to the source file
         destination_path: The path to the destination file
     """
+    from .network_store import as_csv  # network_store depends on this module
+
     if source_path.endswith(".geojson"):
         df = gpd.read_file(source_path)
         df.to_csv(destination_path, index=False, sep=";")
     else:
-        shutil.copy(source_path, destination_path)
\ No newline at end of file
+        source_path = as_csv(source_path)
+        shutil.copy(source_path, destination_path)
+
+
+_FILE_HASHES = {}  # (path, mtime, size) -> sha256, to avoid re-hashing unchanged files
+
+
+def file_hash(filepath: str) -> str:
+    """
+    Returns the sha256 hash of the content of a file.
+
+    Hashes are memoized on (path, modification time, size), so unchanged files are hashed only once per process.
+
+    Args:
+        filepath: The path to the file
+    Returns:
+        The hex digest of the file content.
+    """
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+    if key not in _FILE_HASHES:
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        _FILE_HASHES[key] = digest.hexdigest()
+    return _FILE_HASHES[key]
+
+def stream_progress(stream_writer: Callable, tool_name: str, step: int = 10) -> Callable[[int, int, int], None]:
+    """
+    Returns a progress callback that sends progress events to the LangGraph stream (`custom` stream mode).
+
+    The callback can be called from any thread: events are handed to the event loop of the caller.
+    Only one event per `step` percent of each replica is sent.
+
+    Args:
+        stream_writer: The stream writer of the tool runtime
+        tool_name: The name of the tool, sent with every event
+        step: The percentage between two events of the same replica
+    Returns:
+        The progress callback, taking (replica, simulated seconds, total seconds).
+    """
+    loop = asyncio.get_running_loop()
+    last_sent = {}
+
+    def progress_callback(replica: int, done: int, total: int) -> None:
+        percent = int(100 * done / total) if total else 100
+        last = last_sent.get(replica, -step)
+        if percent == last or (percent - last < step and percent < 100):
+            return
+        last_sent[replica] = percent
+        event = {"tool": tool_name, "replica": replica, "done": done, "total": total, "percent": percent}
+        loop.call_soon_threadsafe(stream_writer, event)
+
+    return progress_callback
@@ -1,9 +1,35 @@
 from langchain_core.messages import HumanMessage
 from langgraph.checkpoint.memory import InMemorySaver
 import asyncio
+import signal
 from dotenv import load_dotenv
 
 from .graph.graph import make_graph
+from .graph.tools.network_store import network_file
+
+async def stream_response(graph, init_state: dict, config: dict) -> None:
+    """
+    Streams the response of the graph, printing the messages of the agent and the progress of the simulations.
+
+    Args:
+        graph: The compiled graph
+        init_state: The input state of the graph
+        config: The config of the run
+    """
+    async for namespace, mode, chunk in graph.astream(
+        init_state, config=config, stream_mode=["updates", "custom"], subgraphs=True
+    ):
+        if mode == "custom":
+            # progress events sent by the simulation tools
+            print(f">>> [{chunk['tool']}] replica {chunk['replica']}: {chunk['percent']}% ({chunk['done']}/{chunk['total']} s)")
+            continue
+        if namespace:
+            continue  # updates of the agent subgraph: only the final answer is printed
+        for node_name, values in chunk.items():
+            if values and 'messages' in values:
+                print("\n" + "*"*25 + f" {node_name} " + "*"*25 + "\n")
+                print(values['messages'][-1].content)
+                print("\n" + "*"*66 + "\n")
 
 async def main():
 
@@ -42,17 +68,20 @@ async def main():
         # Create initial state 
         init_state = {
             "messages": [HumanMessage(content=user_input)], 
-            "edges_filepath" : f"{INPUT_FOLDER}/edges.csv",   # default edges file
-            "nodes_filepath" : f"{INPUT_FOLDER}/node_props.csv"  # default nodes file
+            "edges_filepath" : network_file(INPUT_FOLDER, "edges"),   # default edges file (Arrow if converted, else CSV)
+            "nodes_filepath" : network_file(INPUT_FOLDER, "node_props")  # default nodes file
             }
         
-        # Stream agent response
-        async for chunk in graph.astream(init_state, config=config):
-            for node_name, values in chunk.items():
-                if 'messages' in values:
-                    print("\n" + "*"*25 + f" {node_name} " + "*"*25 + "\n")
-                    print(values['messages'][-1].content)
-                    print("\n" + "*"*66 + "\n")
+        # Stream agent response, running in a task so that Ctrl+C cancels the request (and its simulations)
+        loop = asyncio.get_running_loop()
+        stream_task = asyncio.create_task(stream_response(graph, init_state, config))
+        loop.add_signal_handler(signal.SIGINT, stream_task.cancel)
+        try:
+            await stream_task
+        except asyncio.CancelledError:
+            print("\n\nRequest cancelled.")
+        finally:
+            loop.remove_signal_handler(signal.SIGINT)
         
         print()  # Add spacing between conversations
 
@@ -1,5 +1,7 @@
 """Visualization module for webapp integration"""
 
 from .webapp_server import open_visualization
+from .tiles import write_all_tiles
+from .renderer import render_database, render_simulation
 
-__all__ = ["open_visualization"]
+__all__ = ["open_visualization", "write_all_tiles", "render_database", "render_simulation"]
@@ -0,0 +1,131 @@
+"""
+Queries of the visualization webapp on the simulation database.
+
+The webapp does not download the whole database: it asks the server for the edges, the frame timestamps,
+the density frames of the time window it is displaying and the global series, which are computed here
+with indexed SQLite queries.
+"""
+
+import sqlite3
+from pathlib import Path
+
+
+# Indexes used by the queries of the webapp, created when the database is first served
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS road_data_simulation_datetime ON road_data (simulation_id, datetime, street_id)",
+]
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """
+    Opens the database read-only.
+    """
+    return sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def ensure_indexes(db_path: str) -> None:
+    """
+    Creates the indexes used by the queries of the webapp, if missing.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for index_sql in INDEXES:
+                conn.execute(index_sql)
+    finally:
+        conn.close()
+
+
+def list_simulations(conn: sqlite3.Connection) -> list[dict]:
+    """
+    Returns the id and name of every simulation in the database.
+    """
+    rows = conn.execute("SELECT id, name FROM simulations ORDER BY id").fetchall()
+    return [{"id": sim_id, "name": name or f"Simulation {sim_id}"} for sim_id, name in rows]
+
+
+def load_edges(conn: sqlite3.Connection) -> list[dict]:
+    """
+    Returns the edges of the network, ordered by id, with their geometries as WKT strings.
+
+    The density frames list the densities of the edges in this same order.
+    """
+    columns = ["id", "source", "target", "length", "maxspeed", "name", "nlanes", "geometry"]
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM edges ORDER BY id").fetchall()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def has_table(conn: sqlite3.Connection, name: str) -> bool:
+    """
+    Returns whether the database has the given table.
+    """
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)).fetchone() is not None
+
+
+def frame_timestamps(conn: sqlite3.Connection, simulation_id: int) -> list[str]:
+    """
+    Returns the timestamps of the density frames of a simulation, in order.
+    """
+    table = "global_stats" if has_table(conn, "global_stats") else "road_data"
+    rows = conn.execute(
+        f"SELECT DISTINCT datetime FROM {table} WHERE simulation_id = ? ORDER BY datetime", (simulation_id,)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def density_frames(conn: sqlite3.Connection, simulation_id: int, start: str, end: str) -> dict:
+    """
+    Returns the density frames of a simulation between two timestamps.
+
+    Args:
+        conn: The connection to the database
+        simulation_id: The id of the simulation
+        start: The timestamp of the first frame, as returned by `frame_timestamps`
+        end: The timestamp of the last frame, as returned by `frame_timestamps`
+    Returns:
+        A dict with the `datetimes` of the frames and, for each frame, the list of the `densities` of the edges
+        (ordered as in `load_edges`, 0 for the edges without data).
+    """
+    edge_row = {edge_id: k for k, (edge_id,) in enumerate(conn.execute("SELECT id FROM edges ORDER BY id"))}
+    rows = conn.execute(
+        "SELECT datetime, street_id, density_vpk FROM road_data "
+        "WHERE simulation_id = ? AND datetime BETWEEN ? AND ? ORDER BY datetime",
+        (simulation_id, start, end),
+    )
+    datetimes, densities = [], []
+    for timestamp, street_id, density in rows:
+        if not datetimes or datetimes[-1] != timestamp:
+            datetimes.append(timestamp)
+            densities.append([0.0] * len(edge_row))
+        k = edge_row.get(street_id)
+        if k is not None:
+            densities[-1][k] = density or 0.0
+    return {"datetimes": datetimes, "densities": densities}
+
+
+def global_series(conn: sqlite3.Connection, simulation_id: int) -> list[dict]:
+    """
+    Returns the aggregated statistics of a simulation at each timestamp.
+
+    They are read from the `global_stats` table of post-processed databases, and computed from `road_data` otherwise.
+    """
+    columns = ["datetime", "mean_density_vpk", "mean_speed_kph", "total_counts"]
+    if has_table(conn, "global_stats"):
+        rows = conn.execute(
+            f"SELECT {', '.join(columns)} FROM global_stats WHERE simulation_id = ? ORDER BY datetime", (simulation_id,)
+        ).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+    rows = conn.execute(
+        """
+        SELECT datetime,
+               AVG(density_vpk) AS mean_density_vpk,
+               AVG(avg_speed_kph) AS mean_speed_kph,
+               SUM(counts) AS total_counts
+        FROM road_data
+        WHERE simulation_id = ?
+        GROUP BY datetime
+        ORDER BY datetime
+        """,
+        (simulation_id,),
+    ).fetchall()
+    return [dict(zip(columns, row)) for row in rows]
@@ -0,0 +1,325 @@
+"""
+Headless rendering of the density animation of a simulation, without a browser.
+
+The edges are projected (Web Mercator) and rasterized once into the pixels they cover. Each frame then colors
+those pixels with the densities of the frame, on the green-yellow-red scale of the webapp, where every pixel
+shows the densest edge crossing it. Frames are read from the density tiles (see `tiles`) and rendered to PNG
+by a process pool, one tile per task, so memory is bounded by a tile per worker.
+
+The PNG sequence is encoded to MP4 with ffmpeg when it is on the PATH, and kept as is otherwise.
+
+Render the simulations of a database from the root directory of the project with
+
+    python -m src.visualization.renderer output_dir/database.db --fps 20
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import subprocess
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from . import db_api
+from .tiles import get_tile_index, tiles_dir
+
+
+RENDERS_FOLDER = "renders"
+MAX_DENSITY = 200  # vehicles per km, where the color scale saturates (as in the webapp)
+PALETTE_SIZE = 256
+PALETTE_STOPS = np.array([[0, 128, 0], [255, 255, 0], [255, 0, 0]], dtype=np.float64)  # green, yellow, red
+BACKGROUND = (24, 24, 24)
+TIME_BAR_HEIGHT = 4  # pixels of the bar showing the progress of the simulation, at the bottom of the frames
+PADDING = 16  # pixels around the network
+PNG_LEVEL = 1  # zlib level of the frames: the fastest, as they are usually re-encoded to video
+
+_raster = {}  # the raster of the worker processes, set by `_init_worker`
+
+
+def _palette() -> np.ndarray:
+    """
+    Returns the colors of the density scale, as a (PALETTE_SIZE, 3) uint8 array.
+    """
+    t = np.linspace(0, len(PALETTE_STOPS) - 1, PALETTE_SIZE)
+    lower = np.minimum(t.astype(int), len(PALETTE_STOPS) - 2)
+    frac = (t - lower)[:, None]
+    return np.round(PALETTE_STOPS[lower] * (1 - frac) + PALETTE_STOPS[lower + 1] * frac).astype(np.uint8)
+
+
+def _parse_linestring(wkt: str | None) -> np.ndarray:
+    """
+    Returns the (lon, lat) points of a WKT LINESTRING, as an (n, 2) array (empty if missing).
+    """
+    if not wkt:
+        return np.empty((0, 2))
+    numbers = re.findall(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?", wkt)
+    return np.array(numbers, dtype=np.float64).reshape(-1, 2)
+
+
+def rasterize_edges(geometries: list[str | None], width: int, line_width: int = 2) -> dict:
+    """
+    Rasterizes the edges of the network: the pixels covered by each edge, once for all the frames.
+
+    Args:
+        geometries: The WKT geometries of the edges, in the order of the densities of the frames
+        width: The width of the frames in pixels; the height follows from the extent of the network
+        line_width: The width of the edges in pixels
+    Returns:
+        The `width` and `height` of the frames, and the flat indices of the covered `pixels`
+        with the `pixel_edges` covering them.
+    """
+    points = [_parse_linestring(wkt) for wkt in geometries]
+    lengths = np.array([len(p) for p in points])
+    coords = np.concatenate([p for p in points if len(p)]) if lengths.any() else np.zeros((1, 2))
+
+    # Web Mercator, up to a scale factor
+    x = np.radians(coords[:, 0])
+    y = np.log(np.tan(np.pi / 4 + np.radians(np.clip(coords[:, 1], -85, 85)) / 2))
+    span_x = max(x.max() - x.min(), 1e-12)
+    span_y = max(y.max() - y.min(), 1e-12)
+    scale = (width - 2 * PADDING) / span_x
+    height = int(math.ceil(span_y * scale)) + 2 * PADDING + TIME_BAR_HEIGHT
+    height += height % 2  # video encoders want even sizes
+    px = PADDING + (x - x.min()) * scale
+    py = PADDING + (y.max() - y) * scale
+
+    # the segments of the polylines, as consecutive points of the same edge
+    point_edges = np.repeat(np.arange(len(points)), lengths)
+    starts = np.flatnonzero(point_edges[:-1] == point_edges[1:])
+    seg_edges = point_edges[starts]
+    x0, y0 = px[starts], py[starts]
+    dx, dy = px[starts + 1] - x0, py[starts + 1] - y0
+
+    # sample every segment about once per pixel along its longest side
+    n_samples = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    seg = np.repeat(np.arange(len(starts)), n_samples)
+    t = (np.arange(n_samples.sum()) - np.repeat(np.cumsum(n_samples) - n_samples, n_samples)) / np.maximum(
+        n_samples[seg] - 1, 1
+    )
+    sx = np.round(x0[seg] + t * dx[seg]).astype(np.int64)
+    sy = np.round(y0[seg] + t * dy[seg]).astype(np.int64)
+    sample_edges = seg_edges[seg]
+
+    # square brush of the line width
+    offsets = np.arange(line_width) - (line_width - 1) // 2
+    ox, oy = (o.ravel() for o in np.meshgrid(offsets, offsets))
+    bx = (sx[:, None] + ox).ravel()
+    by = (sy[:, None] + oy).ravel()
+    brush_edges = np.repeat(sample_edges, len(ox))
+    inside = (bx >= 0) & (bx < width) & (by >= 0) & (by < height - TIME_BAR_HEIGHT)
+
+    # one entry per (pixel, edge) pair
+    keys = np.unique((by[inside] * width + bx[inside]) * len(points) + brush_edges[inside])
+    return {
+        "width": width,
+        "height": height,
+        "pixels": keys // len(points) if len(points) else keys,
+        "pixel_edges": (keys % len(points)).astype(np.int32) if len(points) else keys.astype(np.int32),
+    }
+
+
+def render_frame(raster: dict, densities: np.ndarray, progress: float, palette: np.ndarray) -> np.ndarray:
+    """
+    Renders a frame: every covered pixel takes the color of the densest edge crossing it.
+
+    Args:
+        raster: The raster of the edges, as returned by `rasterize_edges`
+        densities: The densities of the edges in the frame
+        progress: The fraction of the simulation elapsed at the frame, between 0 and 1
+        palette: The colors of the density scale
+    Returns:
+        The frame, as a (height, width, 3) uint8 array.
+    """
+    width, height = raster["width"], raster["height"]
+    image = np.empty((height * width, 3), dtype=np.uint8)
+    image[:] = BACKGROUND
+
+    pixel_density = np.full(height * width, -1.0, dtype=np.float32)
+    np.maximum.at(pixel_density, raster["pixels"], np.nan_to_num(densities)[raster["pixel_edges"]])
+    drawn = np.flatnonzero(pixel_density >= 0)
+    buckets = np.minimum(pixel_density[drawn] * ((PALETTE_SIZE - 1) / MAX_DENSITY), PALETTE_SIZE - 1)
+    image[drawn] = palette[buckets.astype(np.int64)]
+
+    image = image.reshape(height, width, 3)
+    image[height - TIME_BAR_HEIGHT:, : int(round(progress * width))] = palette[-1]
+    return image
+
+
+def encode_png(image: np.ndarray, level: int = PNG_LEVEL) -> bytes:
+    """
+    Encodes an RGB image as PNG.
+
+    Args:
+        image: The image, as a (height, width, 3) uint8 array
+        level: The zlib compression level
+    Returns:
+        The PNG file contents.
+    """
+    height, width, _ = image.shape
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    # filter type 0 (none) at the start of every row
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, width * 3)], axis=1)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _init_worker(raster: dict) -> None:
+    """
+    Stores the raster of the edges in the worker process, so that it is sent once and not with every tile.
+    """
+    _raster.update(raster)
+    _raster["palette"] = _palette()
+
+
+def _render_tile(tile_path: str, first_frame: int, n_frames: int, frames_dir: str) -> int:
+    """
+    Renders the frames of a density tile to PNG files, named after their frame number.
+
+    Returns:
+        The number of frames rendered.
+    """
+    n_edges = _raster["n_edges"]
+    tile = np.fromfile(tile_path, dtype="<f4").reshape(-1, n_edges) if n_edges else np.zeros((0, 0))
+    for k, densities in enumerate(tile):
+        frame = first_frame + k
+        image = render_frame(_raster, densities, frame / max(n_frames - 1, 1), _raster["palette"])
+        Path(frames_dir, f"frame_{frame:06d}.png").write_bytes(encode_png(image))
+    return len(tile)
+
+
+def render_simulation(
+    db_path: str,
+    simulation_id: int,
+    output_dir: str | None = None,
+    width: int = 1280,
+    line_width: int = 2,
+    fps: int = 10,
+    n_workers: int | None = None,
+    video: bool = True,
+) -> str:
+    """
+    Renders the density animation of a simulation to a PNG sequence, and encodes it to MP4 if ffmpeg is available.
+
+    Args:
+        db_path: The path to the SQLite database of the simulation
+        simulation_id: The id of the simulation
+        output_dir: The directory of the renders. Defaults to `renders/` next to the database
+        width: The width of the frames in pixels
+        line_width: The width of the edges in pixels
+        fps: The frames per second of the video
+        n_workers: The number of worker processes. Defaults to the number of CPUs
+        video: Whether to encode the frames to MP4 (the PNG files are removed once encoded)
+    Returns:
+        The path to the video, or to the directory of the frames if it is not encoded.
+    """
+    output_dir = Path(output_dir or Path(db_path).resolve().parent / RENDERS_FOLDER)
+    frames_dir = output_dir / f"simulation_{simulation_id}"
+    shutil.rmtree(frames_dir, ignore_errors=True)
+    frames_dir.mkdir(parents=True)
+
+    index = get_tile_index(db_path, simulation_id)
+    with closing(db_api.connect(db_path)) as conn:
+        geometries = [edge["geometry"] for edge in db_api.load_edges(conn)]
+    raster = rasterize_edges(geometries, width, line_width)
+    raster["n_edges"] = len(index["edge_ids"])
+    n_frames = len(index["timestamps"])
+    print(f">>> Rendering {n_frames} frames of simulation {simulation_id} at {raster['width']}x{raster['height']}...")
+
+    tile_paths = [str(tiles_dir(db_path, simulation_id) / f"{k}.f32") for k in range(index["n_tiles"])]
+    n_workers = max(1, min(n_workers or os.cpu_count() or 1, len(tile_paths)))
+    # forkserver, not fork: the calling process may run threads (e.g. the agent). The raster is sent once per worker
+    with ProcessPoolExecutor(
+        max_workers=n_workers, mp_context=get_context("forkserver"), initializer=_init_worker, initargs=(raster,)
+    ) as executor:
+        futures = [
+            executor.submit(_render_tile, path, k * index["frames_per_tile"], n_frames, str(frames_dir))
+            for k, path in enumerate(tile_paths)
+        ]
+        for future in futures:
+            future.result()
+    # the timestamp of each frame, as frames carry no text
+    (output_dir / f"simulation_{simulation_id}.json").write_text(json.dumps(index["timestamps"]))
+
+    ffmpeg = shutil.which("ffmpeg")
+    if not video or not n_frames:
+        return str(frames_dir)
+    if ffmpeg is None:
+        print(f">>> ffmpeg not found, the frames are left in {frames_dir}")
+        return str(frames_dir)
+
+    video_path = output_dir / f"simulation_{simulation_id}.mp4"
+    subprocess.run(
+        [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-framerate", str(fps), "-i", str(frames_dir / "frame_%06d.png"),
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", str(video_path),
+        ],
+        check=True,
+    )
+    shutil.rmtree(frames_dir)
+    print(f">>> Rendered simulation {simulation_id} to {video_path}")
+    return str(video_path)
+
+
+def render_database(db_path: str, simulation_ids: list[int] | None = None, **kwargs) -> list[str]:
+    """
+    Renders the density animations of the simulations of a database (see `render_simulation` for the options).
+
+    Args:
+        db_path: The path to the SQLite database
+        simulation_ids: The ids of the simulations to render. Defaults to every simulation
+    Returns:
+        The paths to the renders, in the order of the simulations.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        if not db_api.has_table(conn, "road_data"):
+            print(">>> No road_data in the database, nothing to render")
+            return []
+        if simulation_ids is None:
+            simulation_ids = [sim["id"] for sim in db_api.list_simulations(conn)]
+    return [render_simulation(db_path, simulation_id, **kwargs) for simulation_id in simulation_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db_path", help="path to the simulation database")
+    parser.add_argument("--simulations", type=int, nargs="+", help="ids of the simulations to render (default: all)")
+    parser.add_argument("--output-dir", help="directory of the renders (default: renders/ next to the database)")
+    parser.add_argument("--width", type=int, default=1280, help="width of the frames in pixels")
+    parser.add_argument("--line-width", type=int, default=2, help="width of the edges in pixels")
+    parser.add_argument("--fps", type=int, default=10, help="frames per second of the video")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--frames", action="store_true", help="keep the PNG sequence instead of encoding a video")
+    args = parser.parse_args()
+
+    render_database(
+        args.db_path,
+        args.simulations,
+        output_dir=args.output_dir,
+        width=args.width,
+        line_width=args.line_width,
+        fps=args.fps,
+        n_workers=args.workers,
+        video=not args.frames,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Density tiles: the road_data densities of a simulation packed into dense float32 (time x edge) arrays.
+
+Each tile holds `FRAMES_PER_TILE` consecutive frames, frame after frame, with the densities of every edge
+ordered by edge id (0 for the edges without data), as raw little-endian float32. The webapp streams the tiles
+of the time window it is displaying and views each frame in place, as a `Float32Array`.
+
+Tiles are written next to the database, in `tiles/<simulation id>/`, at the end of a simulation or
+on the first request of the webapp. The `index.json` of a simulation lists its timestamps and edge ids,
+and is written last, so a missing index means missing or partial tiles.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+
+
+TILES_FOLDER = "tiles"
+FRAMES_PER_TILE = 64
+FETCH_ROWS = 100_000  # road_data rows read at a time
+
+_TILE_INDEXES = {}  # (db path, db mtime, db size, simulation id) -> tile index
+_tiles_lock = threading.Lock()
+
+
+def tiles_dir(db_path: str, simulation_id: int) -> Path:
+    """
+    Returns the directory holding the tiles of a simulation.
+    """
+    return Path(db_path).resolve().parent / TILES_FOLDER / str(simulation_id)
+
+
+def _signature(conn: sqlite3.Connection, simulation_id: int) -> list:
+    """
+    Returns a summary of the data of a simulation, to detect tiles written from different data.
+    """
+    n_rows, first, last = conn.execute(
+        "SELECT COUNT(*), MIN(datetime), MAX(datetime) FROM road_data WHERE simulation_id = ?", (simulation_id,)
+    ).fetchone()
+    (n_edges,) = conn.execute("SELECT COUNT(*) FROM edges").fetchone()
+    return [n_rows, first, last, n_edges]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """
+    Writes a file through a temporary file, so that readers never see it partially written.
+    """
+    tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def write_tiles(db_path: str, simulation_id: int, frames_per_tile: int = FRAMES_PER_TILE) -> dict:
+    """
+    Packs the densities of a simulation into tiles.
+
+    The road_data rows are streamed in time order, so memory scales with one tile, not with the simulation.
+
+    Args:
+        db_path: The path to the SQLite database
+        simulation_id: The id of the simulation
+        frames_per_tile: The number of frames of each tile
+    Returns:
+        The tile index: the `timestamps` of the frames, the `edge_ids` ordering the densities of each frame,
+        `frames_per_tile` and `n_tiles`.
+    """
+    out_dir = tiles_dir(db_path, simulation_id)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        signature = _signature(conn, simulation_id)
+        edge_ids = np.array([edge_id for (edge_id,) in conn.execute("SELECT id FROM edges ORDER BY id")], dtype=np.int64)
+        tile = np.zeros((frames_per_tile, len(edge_ids)), dtype="<f4")
+        timestamps = []
+        n_tiles = 0
+
+        def flush(n_frames: int) -> None:
+            nonlocal n_tiles
+            _write_atomic(out_dir / f"{n_tiles}.f32", tile[:n_frames].tobytes())
+            n_tiles += 1
+            tile[:] = 0
+
+        cursor = conn.execute(
+            "SELECT datetime, street_id, density_vpk FROM road_data WHERE simulation_id = ? ORDER BY datetime",
+            (simulation_id,),
+        )
+        while rows := cursor.fetchmany(FETCH_ROWS):
+            datetimes, street_ids, densities = zip(*rows)
+            street_ids = np.array(street_ids, dtype=np.int64)
+            densities = np.nan_to_num(np.array(densities, dtype=np.float64))
+            cols = np.minimum(np.searchsorted(edge_ids, street_ids), len(edge_ids) - 1)
+            known = edge_ids[cols] == street_ids if len(edge_ids) else np.zeros(len(rows), dtype=bool)
+
+            # rows are ordered by datetime: split them into frames
+            datetimes = np.array(datetimes, dtype=object)
+            bounds = [0, *(np.flatnonzero(datetimes[1:] != datetimes[:-1]) + 1), len(rows)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                if not timestamps or timestamps[-1] != datetimes[start]:
+                    if timestamps and len(timestamps) % frames_per_tile == 0:
+                        flush(frames_per_tile)
+                    timestamps.append(datetimes[start])
+                frame = (len(timestamps) - 1) % frames_per_tile
+                mask = known[start:stop]
+                tile[frame, cols[start:stop][mask]] = densities[start:stop][mask]
+
+        if timestamps:
+            flush((len(timestamps) - 1) % frames_per_tile + 1)
+
+    index = {
+        "timestamps": timestamps,
+        "edge_ids": edge_ids.tolist(),
+        "frames_per_tile": frames_per_tile,
+        "n_tiles": n_tiles,
+        "signature": signature,
+    }
+    _write_atomic(out_dir / "index.json", json.dumps(index).encode())
+    print(f">>> Packed {len(timestamps)} density frames of simulation {simulation_id} into {n_tiles} tiles")
+    return index
+
+
+def write_all_tiles(db_path: str) -> None:
+    """
+    Packs the densities of every simulation of a database into tiles.
+    """
+    with closing(sqlite3.connect(db_path)) as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='road_data'").fetchone():
+            return  # densities not saved
+        simulation_ids = [sim_id for (sim_id,) in conn.execute("SELECT id FROM simulations")]
+    for simulation_id in simulation_ids:
+        write_tiles(db_path, simulation_id)
+
+
+def get_tile_index(db_path: str, simulation_id: int) -> dict:
+    """
+    Returns the tile index of a simulation, writing its tiles if missing or written from different data.
+    """
+    stat = os.stat(db_path)
+    key = (str(Path(db_path).resolve()), stat.st_mtime_ns, stat.st_size, simulation_id)
+    with _tiles_lock:
+        if key not in _TILE_INDEXES:
+            index_path = tiles_dir(db_path, simulation_id) / "index.json"
+            index = json.loads(index_path.read_text()) if index_path.exists() else None
+            with closing(sqlite3.connect(db_path)) as conn:
+                if index is None or index["signature"] != _signature(conn, simulation_id):
+                    index = None
+            _TILE_INDEXES[key] = index or write_tiles(db_path, simulation_id)
+        return _TILE_INDEXES[key]
+
+
+def read_tile(db_path: str, simulation_id: int, tile: int) -> bytes:
+    """
+    Returns the raw float32 densities of a tile of a simulation.
+
+    Raises:
+        IndexError: If the simulation has no such tile
+    """
+    index = get_tile_index(db_path, simulation_id)
+    if not 0 <= tile < index["n_tiles"]:
+        raise IndexError(f"Simulation {simulation_id} has no tile {tile}")
+    return (tiles_dir(db_path, simulation_id) / f"{tile}.f32").read_bytes()
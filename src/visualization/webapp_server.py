@@ -1,113 +1,266 @@
 """
 Flask server wrapper for webapp visualization.
 
-This module starts a lightweight Flask server that serves the webapp files
-and opens a browser window to display the visualization.
+This module runs a single lightweight Flask server per process, that serves the webapp files
+and the databases of any number of runs, and opens a browser window to display the visualization.
+
+Runs are registered by id (the name of their output directory) and served under `/runs/<run id>`:
+the database file at `/db/<run id>`, with range requests, and its JSON endpoints under `/api/<run id>`
+(see `db_api`), which stream the density frames the webapp displays as binary float32 tiles (see `tiles`).
+Responses are gzip-compressed and validated by ETag.
 """
 
-from flask import Flask, send_from_directory, redirect
+from flask import Flask, Response, abort, request, send_file, send_from_directory, redirect
+from werkzeug.serving import make_server
+from contextlib import closing
+from . import db_api, tiles
 import webbrowser
 import threading
-import time
+import hashlib
+import sqlite3
+import gzip
+import json
 from pathlib import Path
 
 
-def open_visualization(db_path: str, port: int = 8000, auto_open: bool = True):
+WEBAPP_PATH = Path(__file__).parent.parent.parent / "db_webapp"
+RUN_MAX_AGE = 3600  # seconds the browser reuses the responses of a run before revalidating them
+
+_RUNS = {}  # run id -> resolved database path
+_runs_lock = threading.Lock()
+_server = None  # the server of the process, started by the first `open_visualization`
+_server_lock = threading.Lock()
+
+# the webapp files are served by `serve_static`, with their cache headers
+app = Flask(__name__, static_folder=None)
+
+
+def register_run(db_path: str) -> str:
+    """
+    Makes the database of a run available to the visualization server.
+
+    Args:
+        db_path: Path to the SQLite database file containing simulation results
+    Returns:
+        The id of the run, the name of the directory of the database.
+    """
+    resolved_db_path = Path(db_path).resolve()
+    run_id = resolved_db_path.parent.name
+    with _runs_lock:
+        # the latest registration of a run goes last, so that it is the default one
+        _RUNS.pop(run_id, None)
+        _RUNS[run_id] = resolved_db_path
+    return run_id
+
+
+def _run_db_path(run_id: str) -> Path:
+    """Return the database path of a registered run, or answer 404"""
+    with _runs_lock:
+        db_path = _RUNS.get(run_id)
+    if db_path is None or not db_path.exists():
+        abort(404, f"Unknown run {run_id}")
+    return db_path
+
+
+def _start_server(port: int) -> bool:
+    """
+    Start the server of the process on a daemon thread, if not running yet.
+
+    The socket is bound before returning, so the server accepts connections as soon as this returns.
+
+    Returns:
+        Whether the server is running.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            print(f"\n>>> Starting Flask server on http://localhost:{port}")
+            _server = make_server("127.0.0.1", port, app, threaded=True)
+        except (OSError, SystemExit) as e:
+            print(f"ERROR: Failed to start Flask server: {e}")
+            return False
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return True
+
+
+def open_visualization(db_path: str, port: int = 8000, auto_open: bool = True) -> str | None:
     """
-    Start Flask server and open webapp visualization in browser.
-    
+    Register a database with the visualization server, starting it if needed, and open the webapp in browser.
+
     Args:
         db_path: Path to the SQLite database file containing simulation results
-        port: Port to run Flask server on (default: 8000)
+        port: Port to run Flask server on, if not running yet (default: 8000)
         auto_open: Whether to automatically open browser (default: True)
-    
+
     Returns:
-        None (runs in background thread)
-    
+        The URL of the visualization of the database, or None if it could not be served
+        (the server runs in a background thread)
+
     Example:
         >>> from src.visualization import open_visualization
         >>> open_visualization(db_path="./output_20240101_120000/database.db")
     """
-    
-    # Get absolute path to webapp folder
-    webapp_path = Path(__file__).parent.parent.parent / "db_webapp"
-    
-    if not webapp_path.exists():
-        print(f"ERROR: Webapp folder not found at {webapp_path}")
-        return
-    
+
+    if not WEBAPP_PATH.exists():
+        print(f"ERROR: Webapp folder not found at {WEBAPP_PATH}")
+        return None
+
     # Resolve the database path
     resolved_db_path = Path(db_path).resolve()
     if not resolved_db_path.exists():
         print(f"ERROR: Database file not found at {resolved_db_path}")
-        return
-    
-    print(f">>> Webapp folder: {webapp_path}")
+        return None
+
+    print(f">>> Webapp folder: {WEBAPP_PATH}")
     print(f">>> Database file: {resolved_db_path}")
-    
-    # Create Flask app
-    app = Flask(
-        __name__,
-        static_folder=str(webapp_path),
-        static_url_path=""
-    )
-    
-    # Store database path for route handlers
-    db_dir = resolved_db_path.parent
-    db_filename = resolved_db_path.name
-    
-    # Route to serve main index with database path as URL parameter
-    @app.route("/")
-    def index():
-        """Serve main HTML file with database path as URL parameter"""
-        return redirect(f"/index.html?db=/db/{db_filename}")
-    
-    # Route to serve database files from the output directory
-    @app.route("/db/<path:filename>")
-    def serve_db_files(filename):
-        """Serve database files from the output directory"""
-        print(f">>> Serving database file: {filename} from {db_dir}")
-        return send_from_directory(str(db_dir), filename)
-    
-    # Route to serve static files (CSS, JS)
-    @app.route("/<path:filename>")
-    def serve_static(filename):
-        """Serve static files (CSS, JS, etc)"""
-        return send_from_directory(app.static_folder, filename)
-    
-    # Start server in daemon thread
-    def run_server():
-        try:
-            print(f"\n>>> Starting Flask server on http://localhost:{port}")
-            app.run(
-                host="127.0.0.1",
-                port=port,
-                debug=False,
-                use_reloader=False,
-                threaded=True
-            )
-        except Exception as e:
-            print(f"ERROR: Failed to start Flask server: {e}")
-    
-    server_thread = threading.Thread(target=run_server, daemon=True)
-    server_thread.start()
-    
-    # Give server a moment to start
-    time.sleep(1)
-    
+
+    try:
+        db_api.ensure_indexes(str(resolved_db_path))
+    except sqlite3.Error as e:
+        print(f"WARNING: Failed to index the database, queries will be slower: {e}")
+
+    run_id = register_run(str(resolved_db_path))
+    if not _start_server(port):
+        return None
+    url = f"http://localhost:{_server.server_port}/runs/{run_id}"
+
     # Open browser
     if auto_open:
         try:
-            url = f"http://localhost:{port}/"
             print(f">>> Opening browser at {url}")
             webbrowser.open(url)
         except Exception as e:
             print(f"ERROR: Failed to open browser: {e}")
-            print(f">>> You can manually open: http://localhost:{port}/")
-    
-    print("\n>>> Visualization server is running")
-    print(">>> Press Ctrl+C to stop the server\n")
+            print(f">>> You can manually open: {url}")
+
+    print(f"\n>>> Visualization server is running, run {run_id} at {url}\n")
+    return url
+
+
+# Route to serve main index of the latest run
+@app.route("/")
+def index():
+    """Redirect to the latest registered run"""
+    with _runs_lock:
+        run_id = next(reversed(_RUNS), None)
+    if run_id is None:
+        return redirect("/index.html")
+    return redirect(f"/runs/{run_id}")
+
+
+# Route to serve main index with database paths as URL parameters
+@app.route("/runs/<run_id>")
+def run_index(run_id):
+    """Serve main HTML file with the database and API of a run as URL parameters"""
+    _run_db_path(run_id)
+    return redirect(f"/index.html?db=/db/{run_id}&api=/api/{run_id}")
+
+
+# Route to serve the database files of the runs
+@app.route("/db/<run_id>")
+def serve_db_file(run_id):
+    """Serve the database file of a run, with range requests and ETag"""
+    response = send_file(_run_db_path(run_id), mimetype="application/vnd.sqlite3", conditional=True, etag=True)
+    response.headers["Cache-Control"] = f"private, max-age={RUN_MAX_AGE}"
+    return response
+
+
+def cached_response(db_path, render, mimetype):
+    """Serve a body rendered from the database of a run, compressed and validated by ETag"""
+    stat = db_path.stat()
+    etag = hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}:{request.full_path}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        body = render()
+        response = Response(body, mimetype=mimetype)
+        if "gzip" in request.accept_encodings:
+            response.set_data(gzip.compress(body, compresslevel=5))
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    # the URLs identify the run, whose database does not change once simulated
+    response.headers["Cache-Control"] = f"private, max-age={RUN_MAX_AGE}"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+
+def api_response(run_id, query):
+    """Serve the result of a query on the database of a run as JSON"""
+    db_path = _run_db_path(run_id)
+    def render():
+        with closing(db_api.connect(str(db_path))) as conn:
+            return json.dumps(query(conn), separators=(",", ":")).encode()
+    return cached_response(db_path, render, "application/json")
+
+
+@app.route("/api/<run_id>/simulations")
+def api_simulations(run_id):
+    """List the simulations in the database"""
+    return api_response(run_id, db_api.list_simulations)
+
+
+@app.route("/api/<run_id>/edges")
+def api_edges(run_id):
+    """List the edges of the network"""
+    return api_response(run_id, db_api.load_edges)
+
+
+@app.route("/api/<run_id>/simulations/<int:simulation_id>/timestamps")
+def api_timestamps(run_id, simulation_id):
+    """List the timestamps of the density frames of a simulation"""
+    return api_response(run_id, lambda conn: db_api.frame_timestamps(conn, simulation_id))
+
+
+@app.route("/api/<run_id>/simulations/<int:simulation_id>/frames")
+def api_frames(run_id, simulation_id):
+    """Serve the density frames of a simulation between the `start` and `end` timestamps"""
+    start, end = request.args.get("start"), request.args.get("end")
+    if start is None or end is None:
+        abort(400, "Missing start or end timestamp")
+    return api_response(run_id, lambda conn: db_api.density_frames(conn, simulation_id, start, end))
+
+
+@app.route("/api/<run_id>/simulations/<int:simulation_id>/global")
+def api_global(run_id, simulation_id):
+    """Serve the aggregated statistics of a simulation at each timestamp"""
+    return api_response(run_id, lambda conn: db_api.global_series(conn, simulation_id))
+
+
+@app.route("/api/<run_id>/simulations/<int:simulation_id>/tiles")
+def api_tile_index(run_id, simulation_id):
+    """Serve the index of the density tiles of a simulation, packing them on the first request"""
+    db_path = _run_db_path(run_id)
+    def query(conn):
+        index = tiles.get_tile_index(str(db_path), simulation_id)
+        return {name: value for name, value in index.items() if name != "signature"}
+    return api_response(run_id, query)
+
+
+@app.route("/api/<run_id>/simulations/<int:simulation_id>/tiles/<int:tile>")
+def api_tile(run_id, simulation_id, tile):
+    """Serve a density tile of a simulation as raw float32"""
+    db_path = _run_db_path(run_id)
+    def render():
+        try:
+            return tiles.read_tile(str(db_path), simulation_id, tile)
+        except IndexError as e:
+            abort(404, str(e))
+    return cached_response(db_path, render, "application/octet-stream")
+
+
+# Route to serve static files (CSS, JS)
+@app.route("/<path:filename>")
+def serve_static(filename):
+    """Serve static files (CSS, JS, etc), with range requests and ETag"""
+    response = send_from_directory(WEBAPP_PATH, filename)
+    # the webapp may be updated while the server runs
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 
 if __name__ == "__main__":
-    open_visualization()
+    import sys
+    open_visualization(sys.argv[1], auto_open=False)
+    threading.Event().wait()
@@ -0,0 +1,84 @@
+"""
+Fixtures shared by the tests: database shards with the schema written by dsf.
+"""
+
+import sqlite3
+
+import pytest
+
+
+# the tables written by dsf (FirstOrderDynamics, dsf-mobility 5.8), as read by the post-processing
+DSF_SCHEMA = [
+    """
+    CREATE TABLE simulations (
+        id INTEGER PRIMARY KEY, name TEXT, speed_function TEXT, error_probability REAL, passage_probability REAL,
+        mean_travel_distance_m REAL, mean_travel_time_s REAL, stagnant_tolerance_factor REAL,
+        force_priorities BOOLEAN, save_avg_stats BOOLEAN, save_road_data BOOLEAN, save_travel_data BOOLEAN,
+        save_agent_data BOOLEAN
+    )
+    """,
+    """
+    CREATE TABLE road_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, simulation_id INTEGER NOT NULL, datetime TEXT NOT NULL,
+        time_step INTEGER NOT NULL, street_id INTEGER NOT NULL, coil TEXT, density_vpk REAL, avg_speed_kph REAL,
+        std_speed_kph REAL, n_observations INTEGER, counts INTEGER, queue_length INTEGER
+    )
+    """,
+    """
+    CREATE TABLE avg_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, simulation_id INTEGER NOT NULL, datetime TEXT NOT NULL,
+        time_step INTEGER NOT NULL, n_ghost_agents INTEGER NOT NULL, n_agents INTEGER NOT NULL,
+        mean_speed_kph REAL, std_speed_kph REAL, mean_density_vpk REAL NOT NULL, std_density_vpk REAL NOT NULL,
+        mean_travel_time_s REAL, mean_queue_length REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE edges (
+        id INTEGER PRIMARY KEY, source INTEGER NOT NULL, target INTEGER NOT NULL, length REAL NOT NULL,
+        maxspeed REAL NOT NULL, name TEXT, nlanes INTEGER NOT NULL, coilcode TEXT, geometry TEXT NOT NULL
+    )
+    """,
+    "CREATE TABLE nodes (id INTEGER PRIMARY KEY, type TEXT, geometry TEXT)",
+]
+
+N_EDGES = 3
+TIME_STEPS = [300, 600, 900]
+
+
+def timestamp(time_step: int) -> str:
+    """The datetime written by dsf for a time step of a simulation starting at midnight"""
+    return f"2022-01-31 {time_step // 3600:02d}:{time_step % 3600 // 60:02d}:{time_step % 60:02d}"
+
+
+@pytest.fixture
+def make_database(tmp_path):
+    """
+    Returns a function writing a database with the dsf schema, holding the simulations with the given ids,
+    where the density of street s at the k-th save of a simulation is `offset + 10 * k + s`.
+    """
+    def make(simulations: dict[int, float], name: str = "database.db") -> str:
+        path = str(tmp_path / name)
+        conn = sqlite3.connect(path)
+        with conn:
+            for sql in DSF_SCHEMA:
+                conn.execute(sql)
+            conn.executemany(
+                "INSERT INTO edges (id, source, target, length, maxspeed, name, nlanes, geometry) "
+                "VALUES (?, ?, ?, 100, 13.9, ?, 1, ?)",
+                [(s, s, s + 1, f"street {s}", f"LINESTRING ({11 + s / 100} 44.5, {11.01 + s / 100} 44.5)") for s in range(N_EDGES)],
+            )
+            for simulation_id, offset in simulations.items():
+                conn.execute("INSERT INTO simulations (id, name) VALUES (?, ?)", (simulation_id, f"sim_{simulation_id}"))
+                conn.executemany(
+                    "INSERT INTO road_data (simulation_id, datetime, time_step, street_id, density_vpk, avg_speed_kph, counts) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (simulation_id, timestamp(t), t, s, offset + 10 * k + s, 50 - s, int(offset) + k)
+                        for k, t in enumerate(TIME_STEPS)
+                        for s in range(N_EDGES)
+                    ],
+                )
+        conn.close()
+        return path
+
+    return make
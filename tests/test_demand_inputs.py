@@ -0,0 +1,75 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from src.graph.tools import demand_inputs
+from src.graph.tools.demand_inputs import (
+    DEMAND_FILES,
+    centered_moving_average,
+    get_hourly_od,
+    od_matrix,
+    sample_injection_schedule,
+)
+
+HOURLY_ORIGINS = [{1: 2.0, 2: 1.0}, {1: 4.0}, {1: 6.0, 2: 3.0}, {2: 5.0}]
+
+
+def naive_moving_average(hourly_weights: list[dict], window: int) -> list[dict]:
+    """The per-node, per-hour loop the vectorized smoothing replaced"""
+    smoothed = []
+    for hour in range(len(hourly_weights)):
+        hours = hourly_weights[max(0, hour - window // 2):hour + window // 2 + 1]
+        nodes = set().union(*hours)
+        smoothed.append({node: np.mean([h[node] for h in hours if node in h]) for node in nodes})
+    return smoothed
+
+
+@pytest.fixture
+def input_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(demand_inputs, "_DEMAND_INPUTS", {})
+    monkeypatch.setattr(demand_inputs, "_HOURLY_OD", {})
+    np.save(tmp_path / DEMAND_FILES[0], np.arange(720, dtype=float))
+    np.save(tmp_path / DEMAND_FILES[1], np.ones(720))
+    (tmp_path / DEMAND_FILES[2]).write_bytes(pickle.dumps(HOURLY_ORIGINS))
+    (tmp_path / DEMAND_FILES[3]).write_bytes(pickle.dumps([{3: 1.0, 4: 2.0}] * len(HOURLY_ORIGINS)))
+    return str(tmp_path)
+
+
+def test_od_matrix():
+    nodes, weights, present = od_matrix(HOURLY_ORIGINS)
+    assert nodes == [1, 2]
+    assert weights.tolist() == [[2.0, 4.0, 6.0, 0.0], [1.0, 0.0, 3.0, 5.0]]
+    assert present.tolist() == [[True, True, True, False], [True, False, True, True]]
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 5])
+def test_moving_average_skips_the_missing_hours(window):
+    nodes, weights, present = od_matrix(HOURLY_ORIGINS)
+    smoothed, smoothed_present = centered_moving_average(weights, present, window)
+    for hour, expected in enumerate(naive_moving_average(HOURLY_ORIGINS, window)):
+        rows = np.flatnonzero(smoothed_present[:, hour])
+        assert [nodes[r] for r in rows] == sorted(expected)
+        assert smoothed[rows, hour].tolist() == pytest.approx([expected[nodes[r]] for r in rows])
+
+
+def test_hourly_od(input_folder):
+    origins, destinations = get_hourly_od(input_folder, smoothing_hours=3)
+    assert origins == pytest.approx(naive_moving_average(HOURLY_ORIGINS, 3))
+    assert destinations == [{3: 1.0, 4: 2.0}] * len(HOURLY_ORIGINS)
+    assert get_hourly_od(input_folder, smoothing_hours=3)[0] is origins
+
+    origins, destinations = get_hourly_od(input_folder, smoothing_hours=1, norm_weights=True)
+    assert origins == [dict.fromkeys(hour, 1.0) for hour in HOURLY_ORIGINS]
+    assert destinations == [{3: 1, 4: 1}] * len(HOURLY_ORIGINS)
+
+
+def test_injection_schedule_is_reproducible(input_folder):
+    inputs = demand_inputs.get_demand_inputs(input_folder)
+    # the series is shifted ahead of one hour
+    assert inputs["vehicles_mean"][360] == 0.0
+
+    first, counts = sample_injection_schedule(inputs["vehicles_mean"], inputs["vehicles_std"], 3605, 3700, 10, 1.0, 7)
+    assert first == 361 and len(counts) == 10
+    assert (sample_injection_schedule(inputs["vehicles_mean"], inputs["vehicles_std"], 3605, 3700, 10, 1.0, 7)[1] == counts).all()
+    assert (sample_injection_schedule(inputs["vehicles_mean"], inputs["vehicles_std"], 3605, 3700, 10, 1.0, 8)[1] != counts).any()
@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+from contextlib import closing
+
+import pytest
+
+from conftest import N_EDGES, TIME_STEPS
+from src.graph.tools import ensemble, network_cache
+from src.graph.tools.ensemble import _launch_replicas, merge_shards
+from src.graph.tools.network_cache import get_prepared_network
+from src.graph.tools.turn_counts import TURN_COUNTS_SCHEMA
+
+
+def move_network(task: dict, progress_queue) -> str:
+    """Stands for `run_replica`: takes the prepared network and moves it, as `mobility.Dynamics` does"""
+    network = get_prepared_network(task["edges_filepath"], task["nodes_filepath"], task["scenario"])
+    if network["moved"]:
+        raise RuntimeError("network already moved")
+    network["moved"] = True
+    if task["replica"] == task.get("failing_replica"):
+        raise ValueError("boom")
+    return task["shard_path"]
+
+
+@pytest.fixture
+def replica_tasks(tmp_path, monkeypatch):
+    """Returns a function building the tasks of n replicas and the list of the networks prepared for them"""
+    prepared = []
+
+    def prepare(edges_filepath, nodes_filepath, scenario):
+        prepared.append(scenario)
+        return {"moved": False}
+
+    monkeypatch.setattr(network_cache, "_prepare_network", prepare)
+    monkeypatch.setattr(network_cache, "_PREPARED_NETWORKS", type(network_cache._PREPARED_NETWORKS)())
+    monkeypatch.setattr(ensemble, "get_hourly_od", lambda *args: None)
+    for name in ("edges.csv", "nodes.csv"):
+        (tmp_path / name).write_text("id\n0\n")
+
+    def make(n: int, **fields) -> list[dict]:
+        tasks = [
+            {
+                "replica": k, "seed": k, "shard_path": str(tmp_path / f"shard_{k}.db"), "input_folder": str(tmp_path),
+                "edges_filepath": str(tmp_path / "edges.csv"), "nodes_filepath": str(tmp_path / "nodes.csv"),
+                "scenario": None, "smoothing_hours": 3, "norm_weights": False, **fields,
+            }
+            for k in range(n)
+        ]
+        return tasks, prepared
+
+    return make
+
+
+def test_more_replicas_than_workers(replica_tasks):
+    tasks, prepared = replica_tasks(5)
+    shard_paths = _launch_replicas(tasks, 2, None, threading.Event(), replica=move_network)
+
+    # every replica gets an untouched copy of the network, prepared once
+    assert shard_paths == [task["shard_path"] for task in tasks]
+    assert prepared == [None]
+
+
+def test_a_failed_replica_stops_the_ensemble(replica_tasks):
+    tasks, _ = replica_tasks(4, failing_replica=1)
+    with pytest.raises(RuntimeError, match=r"Replica 1 \(seed 1\) failed: ValueError\('boom'\)"):
+        _launch_replicas(tasks, 2, None, threading.Event(), replica=move_network)
+
+
+def add_turn_counts(db_path: str, simulation_id: int) -> None:
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        for sql in TURN_COUNTS_SCHEMA:
+            conn.execute(sql)
+        conn.execute(
+            "INSERT INTO turn_counts (simulation_id, datetime, node_id, from_street_id, to_street_id, normalized_count) "
+            "VALUES (?, '2022-01-31 01:00:00', 1, 0, 1, 1.0)",
+            (simulation_id,),
+        )
+
+
+def test_merge_remaps_colliding_simulation_ids(make_database, tmp_path):
+    # replicas started in the same second get the same id
+    shard_paths = [make_database({20220131000000: offset}, f"shard_{k}.db") for k, offset in enumerate((0.0, 5.0, 9.0))]
+    for shard_path in shard_paths:
+        add_turn_counts(shard_path, 20220131000000)
+    db_path = str(tmp_path / "merged.db")
+    merge_shards(shard_paths, db_path)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        simulations = conn.execute("SELECT id FROM simulations ORDER BY id").fetchall()
+        first_densities = conn.execute(
+            "SELECT simulation_id, density_vpk FROM road_data WHERE street_id = 0 AND time_step = ? ORDER BY simulation_id",
+            (TIME_STEPS[0],),
+        ).fetchall()
+        n_road_data = conn.execute("SELECT COUNT(*) FROM road_data").fetchone()[0]
+        n_edges = conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+        turn_counts = conn.execute("SELECT simulation_id FROM turn_counts ORDER BY simulation_id").fetchall()
+        indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+    ids = [20220131000000, 20220131000001, 20220131000002]
+    assert simulations == [(i,) for i in ids]
+    # every replica keeps its own data, under its new id
+    assert first_densities == [(20220131000000, 0.0), (20220131000001, 5.0), (20220131000002, 9.0)]
+    assert n_road_data == 3 * N_EDGES * len(TIME_STEPS)
+    assert n_edges == N_EDGES
+    assert turn_counts == [(i,) for i in ids]
+    assert "turn_counts_node" in indexes
+
+
+def test_merge_into_an_existing_database(make_database, tmp_path):
+    db_path = make_database({20220131000000: 0.0}, "merged.db")
+    merge_shards([make_database({20220131000000: 1.0, 20220131000005: 2.0}, "shard.db")], db_path)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        simulations = conn.execute("SELECT id FROM simulations ORDER BY id").fetchall()
+        n_edges = conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+    # free ids are kept, the colliding one moves after the largest id already merged
+    assert simulations == [(20220131000000,), (20220131000001,), (20220131000005,)]
+    assert n_edges == N_EDGES
@@ -0,0 +1,49 @@
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pytest
+
+from conftest import N_EDGES, TIME_STEPS, timestamp
+from src.graph.tools.ensemble_stats import reduce_ensemble
+
+OFFSETS = {20220131000000: 0.0, 20220131000001: 3.0, 20220131000002: 9.0}
+
+
+def read_stats(db_path: str, window_frames: int) -> tuple[int, list[tuple]]:
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        ensemble_id = reduce_ensemble(conn, window_frames=window_frames)
+        stats = conn.execute(
+            "SELECT datetime, street_id, n_replicas, mean_density_vpk, std_density_vpk, q10_density_vpk, "
+            "q50_density_vpk, q90_density_vpk FROM ensemble_stats ORDER BY datetime, street_id"
+        ).fetchall()
+    return ensemble_id, stats
+
+
+@pytest.mark.parametrize("window_frames", [1, 2, 16])
+def test_statistics_across_the_replicas(make_database, window_frames):
+    ensemble_id, stats = read_stats(make_database(OFFSETS), window_frames)
+
+    assert ensemble_id == max(OFFSETS) + 1
+    expected = []
+    for k, t in enumerate(TIME_STEPS):
+        for s in range(N_EDGES):
+            densities = [offset + 10 * k + s for offset in OFFSETS.values()]
+            expected.append((
+                timestamp(t), s, 3, np.mean(densities), np.std(densities, ddof=1), *np.quantile(densities, [0.1, 0.5, 0.9])
+            ))
+    assert len(stats) == len(expected)
+    for row, expected_row in zip(stats, expected):
+        assert row[:3] == expected_row[:3]
+        assert row[3:] == pytest.approx(expected_row[3:])
+
+
+def test_missing_values_are_not_zeros(make_database):
+    db_path = make_database(OFFSETS)
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute("DELETE FROM road_data WHERE simulation_id = ? AND street_id = 0", (max(OFFSETS),))
+
+    _, stats = read_stats(db_path, 16)
+    street_0 = [row for row in stats if row[1] == 0]
+    assert [row[2] for row in street_0] == [2] * len(TIME_STEPS)
+    assert [row[3] for row in street_0] == pytest.approx([1.5 + 10 * k for k in range(len(TIME_STEPS))])
@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import closing
+
+from src.graph.tools.jobs import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+
+def dead_pid() -> int:
+    """Returns the pid of a process that has exited"""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def wait_for(queue: JobQueue, job_id: int, timeout: float = 10) -> dict:
+    """Waits for a job to reach a final state and returns it"""
+    deadline = time.monotonic() + timeout
+    while (job := queue.get(job_id))["status"] in (QUEUED, RUNNING):
+        assert time.monotonic() < deadline, f"job {job_id} still {job['status']}"
+        time.sleep(0.01)
+    return job
+
+
+def test_jobs_run_in_order(tmp_path):
+    runs = []
+
+    def run_job(n, progress_callback, cancel_event):
+        if n < 0:
+            raise ValueError("negative")
+        runs.append(n)
+        progress_callback(0, 1, 1)
+        return f"output_{n}", False
+
+    queue = JobQueue(str(tmp_path / "jobs.db"), run_job)
+    job_ids = [queue.submit({"n": n}) for n in (1, -1, 2)]
+    queue.start()
+    jobs = [wait_for(queue, job_id) for job_id in job_ids]
+
+    assert runs == [1, 2]
+    assert [job["status"] for job in jobs] == [DONE, FAILED, DONE]
+    assert jobs[0]["output_dir"] == "output_1" and jobs[0]["progress"] == 100
+    assert jobs[1]["error"] == "negative"
+
+
+def test_only_the_jobs_of_dead_processes_are_requeued(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    queue = JobQueue(db_path, run_job=None)
+    job_ids = [queue.submit({}) for _ in range(3)]
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.executemany(
+            "UPDATE jobs SET status=?, owner_pid=? WHERE id=?",
+            [(RUNNING, pid, job_id) for pid, job_id in zip((os.getpid(), dead_pid(), None), job_ids)],
+        )
+
+    # another process opening the queue, while this one still runs its job
+    queue = JobQueue(db_path, run_job=None)
+    assert [queue.get(job_id)["status"] for job_id in job_ids] == [RUNNING, QUEUED, QUEUED]
+
+
+def test_old_databases_are_migrated(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "progress REAL NOT NULL DEFAULT 0, output_dir TEXT, cached INTEGER, error TEXT, submitted TEXT NOT NULL, "
+            "started TEXT, finished TEXT)"
+        )
+        conn.execute("INSERT INTO jobs (params, status, submitted) VALUES ('{}', ?, '2024-01-01')", (RUNNING,))
+
+    queue = JobQueue(db_path, run_job=None)
+    assert queue.get(1)["status"] == QUEUED
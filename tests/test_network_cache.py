@@ -0,0 +1,36 @@
+import pytest
+
+from src.graph.tools import network_cache
+
+
+@pytest.fixture
+def prepared(tmp_path, monkeypatch):
+    """Replaces the network preparation, returning the scenario as the network, and returns the prepared scenarios"""
+    calls = []
+
+    def prepare(edges_filepath, nodes_filepath, scenario):
+        calls.append(scenario)
+        return scenario
+
+    monkeypatch.setattr(network_cache, "_prepare_network", prepare)
+    monkeypatch.setattr(network_cache, "_PREPARED_NETWORKS", type(network_cache._PREPARED_NETWORKS)())
+    monkeypatch.setattr(network_cache, "MAX_PREPARED_NETWORKS", 2)
+    for name in ("edges.csv", "nodes.csv"):
+        (tmp_path / name).write_text("id\n0\n")
+    return calls
+
+
+def scenario(street_id: int) -> dict:
+    return {"closures": [{"name": f"street {street_id}", "edge_ids": [street_id]}], "lane_changes": []}
+
+
+def get(tmp_path, street_id: int):
+    return network_cache.get_prepared_network(str(tmp_path / "edges.csv"), str(tmp_path / "nodes.csv"), scenario(street_id))
+
+
+def test_networks_are_evicted_least_recently_used_first(tmp_path, prepared):
+    for street_id in (1, 2, 1, 3, 1, 2):
+        get(tmp_path, street_id)
+    # 2 is evicted by 3, as 1 was used after it
+    assert prepared == [scenario(1), scenario(2), scenario(3), scenario(2)]
+    assert len(network_cache._PREPARED_NETWORKS) == 2
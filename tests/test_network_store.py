@@ -0,0 +1,51 @@
+import csv
+
+import pyarrow.csv as pa_csv
+import pytest
+
+from src.graph.tools import network_store
+
+
+SOURCE_CSV = """id;source;target;length;maxspeed;name;nlanes;coilcode;geometry
+0;0;1;1e3;50.0;via_a;2;12;LINESTRING (11.30 44.49, 11.31 44.50)
+1;1;2;12.5;30;"via; b";;;LINESTRING (11.31 44.50, 11.32 44.50)
+2;2;0;250.25;;via_c;3;;LINESTRING (11.32 44.50, 11.30 44.49)
+"""
+
+
+@pytest.fixture
+def source_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(network_store, "CSV_CACHE_FOLDER", str(tmp_path / "cache"))
+    path = tmp_path / "edges.csv"
+    path.write_text(SOURCE_CSV)
+    return str(path)
+
+
+def read_rows(path: str) -> list[dict]:
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f, delimiter=";"))
+
+
+def test_arrow_round_trip_keeps_the_values(source_csv):
+    csv_path = network_store.as_csv(network_store.csv_to_arrow(source_csv))
+    options = pa_csv.ParseOptions(delimiter=";")
+    source = pa_csv.read_csv(source_csv, parse_options=options)
+    # parsed with the source types, as the simulator does (e.g. maxspeed 50.0 is written 50)
+    convert = pa_csv.ConvertOptions(column_types=source.schema)
+    assert pa_csv.read_csv(csv_path, parse_options=options, convert_options=convert).equals(source)
+
+
+def test_arrow_round_trip_keeps_integer_columns(source_csv):
+    rows = read_rows(network_store.as_csv(network_store.csv_to_arrow(source_csv)))
+    source_rows = read_rows(source_csv)
+
+    # the simulator parses nlanes as int: "2.0" would fall back to one lane
+    for column in ("id", "source", "target", "nlanes", "coilcode"):
+        assert [row[column] for row in rows] == [row[column] for row in source_rows]
+    assert [row["name"] for row in rows] == ["via_a", "via; b", "via_c"]
+    assert [row["geometry"] for row in rows] == [row["geometry"] for row in source_rows]
+    assert [float(row["length"]) for row in rows] == [1000.0, 12.5, 250.25]
+
+
+def test_csv_files_are_returned_as_they_are(source_csv):
+    assert network_store.as_csv(source_csv) == source_csv
@@ -0,0 +1,46 @@
+import pytest
+
+from src.graph.tools.output_writer import OUTPUT_TABLES, connect_output, connection_queries, output_config
+
+
+class RecordingSimulator:
+    """Records the output calls a simulator receives"""
+
+    def __init__(self):
+        self.calls = []
+
+    def connectDataBase(self, db_path, queries):
+        self.calls.append(("connectDataBase", db_path, queries))
+
+    def saveData(self, interval, *flags):
+        self.calls.append(("saveData", interval, *flags))
+
+
+def test_output_config_reads_the_environment(monkeypatch):
+    monkeypatch.setenv("DSF_SAVE_INTERVAL", "60")
+    monkeypatch.setenv("DSF_SAVE_TABLES", "road_data, avg_stats")
+    monkeypatch.setenv("DSF_SAVE_WAL", "0")
+    assert output_config() == {"interval": 60, "tables": ["avg_stats", "road_data"], "wal": False}
+
+
+@pytest.mark.parametrize("tables", [[], ["speeds"]])
+def test_output_config_rejects_the_tables(tables):
+    with pytest.raises(ValueError):
+        output_config(300, tables)
+
+
+def test_output_config_rejects_no_tables_from_the_environment(monkeypatch):
+    monkeypatch.setenv("DSF_SAVE_TABLES", "")
+    with pytest.raises(ValueError):
+        output_config()
+
+
+def test_connect_output_sets_the_journal_mode():
+    simulator = RecordingSimulator()
+    connect_output(simulator, "shard.db", output_config(900, ["road_data"], wal=False))
+    assert simulator.calls == [
+        ("connectDataBase", "shard.db", connection_queries(False)),
+        ("saveData", 900, *(table == "road_data" for table in OUTPUT_TABLES)),
+    ]
+    assert "PRAGMA journal_mode = DELETE;" in connection_queries(False)
+    assert "PRAGMA journal_mode = WAL;" in connection_queries(True)
@@ -0,0 +1,54 @@
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+
+from conftest import N_EDGES, TIME_STEPS, timestamp
+from src.graph.tools.ensemble_stats import ENSEMBLE_NAME
+from src.graph.tools.postprocess import postprocess_database
+
+
+def test_postprocess_writes_the_ensemble_simulation(make_database):
+    db_path = make_database({20220131000000: 0.0, 20220131000001: 4.0})
+    postprocess_database(db_path)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        (ensemble_id,) = conn.execute("SELECT id FROM simulations WHERE name = ?", (ENSEMBLE_NAME,)).fetchone()
+        rows = conn.execute(
+            "SELECT datetime, time_step, street_id, density_vpk FROM road_data WHERE simulation_id = ? "
+            "ORDER BY datetime, street_id",
+            (ensemble_id,),
+        ).fetchall()
+        stats = conn.execute(
+            "SELECT n_replicas, mean_density_vpk, std_density_vpk FROM ensemble_stats ORDER BY datetime, street_id"
+        ).fetchall()
+        n_global = conn.execute("SELECT COUNT(*) FROM global_stats WHERE simulation_id = ?", (ensemble_id,)).fetchone()[0]
+
+    assert ensemble_id == 20220131000002
+    expected = [(timestamp(t), t, s, 2.0 + 10 * k + s) for k, t in enumerate(TIME_STEPS) for s in range(N_EDGES)]
+    assert rows == expected
+    assert [n for n, _, _ in stats] == [2] * len(expected)
+    np.testing.assert_allclose([std for _, _, std in stats], np.std([0, 4], ddof=1))
+    assert n_global == len(TIME_STEPS)
+
+
+def test_postprocess_runs_again_on_the_same_database(make_database):
+    db_path = make_database({1: 0.0, 2: 4.0})
+    postprocess_database(db_path)
+    postprocess_database(db_path)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        names = [name for (name,) in conn.execute("SELECT name FROM simulations ORDER BY id")]
+        (n_rows,) = conn.execute("SELECT COUNT(*) FROM road_data").fetchone()
+
+    assert names == ["sim_1", "sim_2", ENSEMBLE_NAME]
+    assert n_rows == 3 * len(TIME_STEPS) * N_EDGES
+
+
+def test_single_replica_has_no_ensemble_simulation(make_database):
+    db_path = make_database({1: 0.0})
+    postprocess_database(db_path)
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM simulations").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM ensemble_stats").fetchone()[0] == len(TIME_STEPS) * N_EDGES
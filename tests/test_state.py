@@ -0,0 +1,20 @@
+from src.graph.state import add_edits
+
+
+CLOSURE = {"name": "via_a", "edge_ids": [1]}
+LANE_CHANGE = {"name": "via_b", "edge_ids": [2], "nlanes": 2}
+
+
+def test_edits_are_appended():
+    left = add_edits(None, {"closures": [CLOSURE], "lane_changes": []})
+    merged = add_edits(left, {"closures": [], "lane_changes": [LANE_CHANGE]})
+    assert merged == {"closures": [CLOSURE], "lane_changes": [LANE_CHANGE]}
+
+
+def test_replace_overrides_the_edits():
+    left = {"closures": [CLOSURE], "lane_changes": [LANE_CHANGE]}
+    assert add_edits(left, {"closures": [], "lane_changes": [], "replace": True}) == {"closures": [], "lane_changes": []}
+    assert add_edits(left, {"closures": [CLOSURE], "lane_changes": [], "replace": True}) == {
+        "closures": [CLOSURE],
+        "lane_changes": [],
+    }
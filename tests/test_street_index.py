@@ -0,0 +1,32 @@
+import geopandas as gpd
+import pandas as pd
+
+from src.graph.tools import street_index
+from src.graph.tools.street_index import StreetNameIndex, get_name_index, normalize_name
+from src.graph.tools.utils import fuzzy_match
+
+NAMES = ["Via dell'Indipendenza", "Via Ugo Bassi", "Via Rizzoli", None, "Via Ugo Bassi"]
+
+
+def test_normalize_name():
+    assert normalize_name("Via dell'Indipendenza") == normalize_name("via_dell_indipendenza") == "via dell indipendenza"
+    assert normalize_name("Piazza Galvani ") == "piazza galvani"
+
+
+def test_match_groups_the_edges_of_a_street():
+    index = StreetNameIndex(pd.Series(NAMES), pd.Series([10, 11, 12, 13, 14]))
+    assert index.match("via ugo bassi") == ("Via Ugo Bassi", 100.0, [11, 14])
+    name, score, edge_ids = index.match("via indipendenza")
+    assert (name, edge_ids) == ("Via dell'Indipendenza", [10])
+    assert index.match("piazza maggiore") is None
+
+
+def test_fuzzy_match_reuses_the_index(monkeypatch):
+    monkeypatch.setattr(street_index, "_NAME_INDEXES", type(street_index._NAME_INDEXES)())
+    gdf = gpd.GeoDataFrame({"name": NAMES})
+
+    assert fuzzy_match(gdf, "name", "via rizoli")[0] == "Via Rizzoli"
+    index = get_name_index(gdf["name"])
+    assert fuzzy_match(gdf.copy(), "name", "via ugo bassi") == ("Via Ugo Bassi", 100.0)
+    assert get_name_index(gdf["name"]) is index
+    assert len(street_index._NAME_INDEXES) == 1
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+from contextlib import closing
+
+import pytest
+
+from src.graph.tools.turn_counts import TurnCountsWriter, read_turn_counts
+
+
+@pytest.fixture
+def edges_filepath(tmp_path):
+    path = tmp_path / "edges.csv"
+    path.write_text("id;source;target;length\n0;0;1;100\n1;1;2;100\n2;1;0;100\n")
+    return str(path)
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    """Runs the test in the timezone of Bologna, one hour ahead of UTC in winter"""
+    monkeypatch.setenv("TZ", "Europe/Rome")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_turn_counts_are_sparse_and_assigned_on_close(make_database, edges_filepath, local_timezone):
+    db_path = make_database({20220131000000: 0.0})
+    writer = TurnCountsWriter(db_path, edges_filepath)
+    # 2022-01-31 00:00 in Bologna, the datetime dsf writes for the same epoch
+    writer.write(1643583600, {0: {1: 0.75, 2: 0.25}, 1: {0: 0.0}})
+    writer.close()
+
+    turn_counts = read_turn_counts(db_path, 20220131000000)
+    assert turn_counts.to_dict("records") == [
+        {"datetime": "2022-01-31 00:00:00", "node_id": 1, "from_street_id": 0, "to_street_id": 1, "normalized_count": 0.75},
+        {"datetime": "2022-01-31 00:00:00", "node_id": 1, "from_street_id": 0, "to_street_id": 2, "normalized_count": 0.25},
+    ]
+    assert read_turn_counts(db_path, 20220131000000, node_id=2).empty
+
+
+def test_close_without_simulations(tmp_path, edges_filepath):
+    db_path = str(tmp_path / "shard.db")
+    writer = TurnCountsWriter(db_path, edges_filepath)
+    writer.write(1643583600, {0: {1: 1.0}})
+    writer.close()
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert conn.execute("SELECT simulation_id FROM turn_counts").fetchall() == [(None,)]
@@ -0,0 +1,41 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src.graph.tools import utils
+from src.graph.tools.utils import create_output_dir, read_edges_file
+
+
+def test_concurrent_runs_get_their_own_output_directory(tmp_path):
+    prefix = str(tmp_path / "output")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        output_dirs = list(executor.map(lambda _: create_output_dir(prefix), range(32)))
+
+    assert len(set(output_dirs)) == len(output_dirs)
+    for output_dir in output_dirs:
+        assert os.path.isdir(output_dir)
+        assert os.path.basename(output_dir).startswith("output_")
+        assert os.listdir(output_dir) == []
+
+
+def test_output_directory_relative_to_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output_dir = create_output_dir()
+    assert os.path.dirname(output_dir) == "" and os.path.isdir(tmp_path / output_dir)
+    assert create_output_dir("./output_slow_charge").startswith("./output_slow_charge_")
+
+
+def test_edges_frames_are_evicted_least_recently_used_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "_EDGES_FRAMES", type(utils._EDGES_FRAMES)())
+    monkeypatch.setattr(utils, "MAX_EDGES_FRAMES", 2)
+    path = tmp_path / "edges.csv"
+    path.write_text("id;name;geometry\n0;via a;LINESTRING (11.30 44.49, 11.31 44.50)\n")
+
+    ids = read_edges_file(str(path), columns=["id"], geometry=False)
+    names = read_edges_file(str(path), columns=["name"], geometry=False)
+    assert read_edges_file(str(path), columns=["id"], geometry=False) is ids
+    read_edges_file(str(path), geometry=False)
+
+    # the names were the least recently used frame
+    assert len(utils._EDGES_FRAMES) == 2
+    assert read_edges_file(str(path), columns=["id"], geometry=False) is ids
+    assert read_edges_file(str(path), columns=["name"], geometry=False) is not names